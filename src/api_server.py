@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from http import HTTPStatus
+import catalog
+import config
+import db_engine
+import llm_backend
+import pipeline
+import query_guard
+import result_cache
+import currency
+import index_advisor
+import rollups
+import single_flight
+import sql_cache
+import telemetry
+from benchmark import DEFAULT_CORPUS, load_corpus
+from fake_llm import FakeLLM
+
+# HTTP status per pipeline error_kind
+ERROR_STATUS = {"security": 400, "database": 422, "llm": 502}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class QueryService:
+    """
+    The pipeline as a request/response service.
+
+    At most max_concurrency questions run at once and at most max_pending wait for
+    a slot; anything beyond that is rejected straight away (HTTP 429) instead of
+    queueing without bound while the LLM quota or the database is saturated.
+    """
+
+    def __init__(self, llm=None, database_file=None, max_concurrency=None, max_pending=None):
+        self.llm = llm or llm_backend.get_backend()
+        self.database_file = database_file or config.DATABASE_FILE
+        self.max_concurrency = max_concurrency or config.API_MAX_CONCURRENCY
+        self.max_pending = config.API_MAX_PENDING if max_pending is None else max_pending
+        self._semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters = {"requests": 0, "answered": 0, "failed": 0, "rejected": 0}
+
+    def saturated(self):
+        return self.in_flight + self.waiting >= self.max_concurrency + self.max_pending
+
+    async def answer(self, question, use_cache=True):
+        """Answers one question; raises HTTPError(429) when the service is saturated."""
+        self.counters["requests"] += 1
+        if self.saturated():
+            self.counters["rejected"] += 1
+            raise HTTPError(429, "Too many requests in progress, retry later.")
+        if self._semaphore is None:
+            # Created lazily so it belongs to the running loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            answer = await pipeline.answer_question_async(
+                question, catalog.schema(), catalog.exchange_rates(), self.llm, self.database_file, use_cache
+            )
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        self.counters["failed" if answer["error"] else "answered"] += 1
+        return answer
+
+    def health(self):
+        return {
+            "status": "ok" if os.path.exists(self.database_file) else "no database",
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_pending": self.max_pending,
+        }
+
+    def metrics(self):
+        """Yields the service gauges and counters as (metric_name, labels, value) tuples for telemetry."""
+        yield "corpquery_api_in_flight", {}, self.in_flight
+        yield "corpquery_api_waiting", {}, self.waiting
+        for key, value in self.counters.items():
+            yield f"corpquery_api_{key}_total", {}, value
+
+def answer_to_json(answer):
+    """Returns the response body and HTTP status for a pipeline answer."""
+    results = answer["results"]
+    body = {
+        "trace_id": answer["trace_id"],
+        "question": answer["question"],
+        "sql": answer["sql"],
+        "cache_hit": answer["cache_hit"],
+        "columns": results.columns if results is not None else None,
+        "types": [kind.lower() for kind in results.types] if results is not None else None,
+        "rows": [list(row) for row in results.rows()] if results is not None else None,
+        "truncated": results.truncated if results is not None else None,
+        "description": answer["description"],
+        "error": answer["error"],
+        "total_ms": round(answer["total_seconds"] * 1000, 3),
+    }
+    return body, ERROR_STATUS.get(answer["error_kind"], 200)
+
+async def _read_request(reader):
+    """Reads one HTTP/1.1 request; returns (method, path, headers, body) or None at end of stream."""
+    request_line = await asyncio.wait_for(reader.readline(), config.API_READ_TIMEOUT_SECONDS)
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), config.API_READ_TIMEOUT_SECONDS)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length > config.API_MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large.")
+    body = await asyncio.wait_for(reader.readexactly(length), config.API_READ_TIMEOUT_SECONDS) if length else b""
+    return method, path.split("?")[0], headers, body
+
+def _response(status, body, content_type="application/json; charset=utf-8", keep_alive=True, extra_headers=()):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        *extra_headers,
+    ]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+async def handle(service, method, path, body):
+    """Routes one request; returns (status, body, content_type)."""
+    if path == "/healthz" and method == "GET":
+        health = service.health()
+        return (200 if health["status"] == "ok" else 503), health, None
+    if path == "/metrics" and method == "GET":
+        # Collectors such as sql_cache.cache_metrics open SQLite, so the scrape runs off the event loop
+        metrics = await asyncio.to_thread(telemetry.render_prometheus)
+        return 200, metrics.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    if path == "/query":
+        if method != "POST":
+            raise HTTPError(405, "Use POST.")
+        try:
+            request = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise HTTPError(400, "Body must be JSON.")
+        question = request.get("question") if isinstance(request, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise HTTPError(400, 'Body must contain a non-empty "question".')
+        use_cache = request.get("use_cache", True)
+        if not isinstance(use_cache, bool):
+            raise HTTPError(400, '"use_cache" must be true or false.')
+        answer = await service.answer(question.strip(), use_cache)
+        response, status = answer_to_json(answer)
+        return status, response, None
+    raise HTTPError(404, "Not found.")
+
+def make_handler(service):
+    """Returns the asyncio.start_server connection callback; connections are kept alive until the client closes."""
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, response, content_type = await handle(service, method, path, body)
+                    extra = ()
+                except HTTPError as e:
+                    status, response, content_type = e.status, {"error": str(e)}, None
+                    extra = ("Retry-After: 1",) if e.status == 429 else ()
+                    # After a malformed request the stream position is unknown
+                    keep_alive = keep_alive and e.status in (404, 405, 429)
+                writer.write(_response(status, response, content_type or "application/json; charset=utf-8", keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            # Anything else is a bug in a handler; the client still gets an answer
+            print(f"Error handling API request: {e!r}")
+            try:
+                writer.write(_response(500, {"error": "Internal server error."}, keep_alive=False))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+    return on_connection
+
+async def serve(service, host=None, port=None):
+    """Serves the API until cancelled."""
+    server = await asyncio.start_server(make_handler(service), host or config.API_HOST, port or config.API_PORT)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"Serving the query API on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the question → SQL → rows → description pipeline.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--database", default=config.DATABASE_FILE)
+    parser.add_argument("--max-concurrency", type=int, default=config.API_MAX_CONCURRENCY)
+    parser.add_argument("--max-pending", type=int, default=config.API_MAX_PENDING)
+    parser.add_argument("--fake-llm", action="store_true", help="answer with the corpus' golden SQL instead of Gemini")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="questions and golden SQL for --fake-llm")
+    parser.add_argument("--sql-latency-ms", type=float, default=0.0, help="simulated generate_sql latency for --fake-llm")
+    parser.add_argument("--description-latency-ms", type=float, default=0.0, help="simulated generate_description latency for --fake-llm")
+    args = parser.parse_args(argv)
+
+    if args.fake_llm:
+        corpus = load_corpus(args.corpus)
+        llm_backend.set_backend(FakeLLM(
+            {item["question"]: item["golden_sql"] for item in corpus if item["golden_sql"]},
+            sql_latency=args.sql_latency_ms / 1000,
+            description_latency=args.description_latency_ms / 1000,
+        ))
+    llm = llm_backend.get_backend()
+    llm.warm_up()
+    rollups.ensure(args.database)
+    index_advisor.ensure(args.database)
+    currency.ensure(args.database)
+
+    service = QueryService(llm, args.database, args.max_concurrency, args.max_pending)
+    telemetry.register_collector(db_engine.pool_metrics)
+    telemetry.register_collector(sql_cache.cache_metrics)
+    telemetry.register_collector(query_guard.guard_metrics)
+    telemetry.register_collector(result_cache.cache_metrics)
+    telemetry.register_collector(single_flight.flight_metrics)
+    telemetry.register_collector(service.metrics)
+    if hasattr(llm, "metrics"):
+        telemetry.register_collector(llm.metrics)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,24 @@
 import streamlit as st
 import sqlite3
-import gemini_client
+import llm_backend
 import config
 import os
 from dotenv import load_dotenv
-import schema_parser
-import re
 import datetime
-import json
-
-# Security Exception
-class SecurityException(Exception):
-    pass
-
-def filter_user_input(user_input):
-    banned_phrases = ["忽略", "刪除", "其他公司", "ignore", "delete", "other companies"]
-    if any(phrase in user_input for phrase in banned_phrases):
-        raise SecurityException("檢測到危險指令")
+import sql_cache
+import catalog
+import db_engine
+import telemetry
+import pipeline
+import query_guard
+import result_cache
+import history_store
+import single_flight
+import currency
+import index_advisor
+import rollups
+import exporter
+from pipeline import SecurityException, filter_user_input
 
 # Load environment variables from .env file
 load_dotenv()
@@ -28,169 +30,194 @@ if not GEMINI_API_KEY:
     st.error("Please set the GEMINI_API_KEY environment variable in the .env file.")
     st.stop()
 
+# Import and configure the Gemini SDK once per process instead of on the first question
+llm_backend.warm_up()
+
 # Database file
-DATABASE_FILE = "data.db"
+DATABASE_FILE = config.DATABASE_FILE
 MEMORY_FILE = "memory.txt"
-SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'schema.json') # Get absolute path
-EXCHANGE_RATES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exchange_rates.json') # Get absolute path
 
-def query_database(sql_query):
-    """Queries the SQLite database and returns the results."""
-    conn = None
+def query_database(sql_query, trace_id=None, cache_hit=False):
+    """Queries the SQLite database; returns a result_set.ColumnarResult of at most RESULT_MAX_ROWS/RESULT_MAX_BYTES."""
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cur = conn.cursor() #創建cursor用以執行SQL語句
-        cur.execute(sql_query)
-        rows = cur.fetchall()
-        # Convert data to strings to handle encoding issues
-        string_rows = []
-        for row in rows:
-            string_rows.append(tuple(str(x) for x in row))
-        return string_rows
+        return pipeline.run_query(sql_query, database_file=DATABASE_FILE, trace_id=trace_id, cache_hit=cache_hit)
     except sqlite3.Error as e:
         st.error(f"Error querying database: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
-
-def load_history():
-    """Loads history from memory.txt."""
-    try:
-        with open(MEMORY_FILE, "r") as f:
-            history = json.load(f)
-    except FileNotFoundError:
-        history = []
-    return history
 
-def delete_history_item(index):
-    """Deletes a history record and clears the input box."""
-    del st.session_state.conversation_history[index]
-    st.session_state.natural_language_query = ""
+def render_results(results):
+    """Shows the fetched result as a sortable table with its column types."""
+    st.dataframe(results.to_dataframe(), hide_index=True)
+    if results.truncated:
+        st.caption(f"僅顯示前 {len(results)} 筆資料")
+
+DOWNLOAD_LABELS = {"csv": "下載 CSV", "parquet": "下載 Parquet", "binary": "下載 .tcol (typed binary)"}
+
+@st.fragment
+def render_downloads(results, sql_query):
+    """
+    Offers the fetched result as CSV and in a typed columnar format for downstream tools.
+    A file is serialized only when its prepare button is clicked, and kept in the
+    session for this SQL and database version so reruns do not rebuild it.
+    """
+    if "exports" not in st.session_state:
+        st.session_state.exports = {}
+    exports = st.session_state.exports
+    version = db_engine.data_version(DATABASE_FILE)
+    for column, format_name in zip(st.columns(2), ("csv", exporter.columnar_format())):
+        key = (sql_query, version, format_name)
+        if key not in exports and column.button(f"準備{DOWNLOAD_LABELS[format_name]}", key=f"prepare_{format_name}"):
+            # Only the files of the result on screen are kept
+            for stale in [cached for cached in exports if cached[:2] != key[:2]]:
+                del exports[stale]
+            exports[key] = exporter.export_result(results, format_name)
+        if key in exports:
+            column.download_button(
+                DOWNLOAD_LABELS[format_name],
+                data=exports[key],
+                file_name=f"query_result{exporter.EXTENSIONS[format_name]}",
+                mime=exporter.MIME_TYPES[format_name],
+                key=f"download_{format_name}",
+            )
+    if results.truncated:
+        st.caption(f"匯出內容僅包含已讀取的前 {len(results)} 筆資料；完整結果請使用 src/exporter.py --query")
+
+def build_database():
+    """Creates the demo database when data.db is missing."""
+    import create_db
+    create_db.main([])
+
+@st.fragment
+def render_history():
+    """Shows the latest history entries and loads older pages on demand."""
+    def load_more():
+        entries = st.session_state.history_entries
+        page = history_store.load_page(config.COMPANYKEY, before=entries[-1] if entries else None)
+        entries.extend(page)
+        st.session_state.history_has_more = len(page) == config.HISTORY_PAGE_SIZE
+
+    def delete_callback(entry_id):
+        history_store.delete(config.COMPANYKEY, entry_id)
+        st.session_state.history_entries = [entry for entry in st.session_state.history_entries if entry.id != entry_id]
+
+    for entry in st.session_state.history_entries:
+        col1, col2 = st.columns([0.9, 0.1])
+        with col1:
+            st.markdown(f"👤 尊貴的客戶: {entry.question}")
+            st.markdown(f"🤖 CorpQuery: {entry.response}")
+            st.markdown(f"🕒 {entry.created_at[:16] or 'N/A'}")
+        with col2:
+            st.button("刪除", key=f"delete_{entry.id}", on_click=delete_callback, args=(entry.id,))
+    if st.session_state.history_has_more:
+        st.button("載入更多", key="load_more_history", on_click=load_more)
 
 def main():
     st.title("CorpQuery-智能數據引擎")
 
-    # Initialize session state for conversation history
-    if "conversation_history" not in st.session_state:
-        st.session_state.conversation_history = load_history()
+    # Optional Prometheus endpoint (config.METRICS_PORT), started once per process
+    telemetry.register_collector(db_engine.pool_metrics)
+    telemetry.register_collector(sql_cache.cache_metrics)
+    telemetry.register_collector(query_guard.guard_metrics)
+    telemetry.register_collector(result_cache.cache_metrics)
+    telemetry.register_collector(single_flight.flight_metrics)
+    if hasattr(llm_backend.get_backend(), "metrics"):
+        telemetry.register_collector(llm_backend.get_backend().metrics)
+    telemetry.start_metrics_server()
+    trace_id = telemetry.new_trace_id()
+
+    # Initialize session state for conversation history: only the latest page is loaded
+    if "history_entries" not in st.session_state:
+        history_store.import_memory_file(MEMORY_FILE, config.COMPANYKEY)
+        st.session_state.history_entries = history_store.load_page(config.COMPANYKEY)
+        st.session_state.history_has_more = len(st.session_state.history_entries) == config.HISTORY_PAGE_SIZE
 
     if "natural_language_query" not in st.session_state:
         st.session_state.natural_language_query = ""
 
-    # Load database schema from JSON file
-    with open(SCHEMA_FILE, 'r') as f:
-        schema_info = json.load(f)
-
-    # Load exchange rates from JSON file
-    with open(EXCHANGE_RATES_FILE, 'r') as f:
-        exchange_rates = json.load(f)
+    # Schema and exchange rates are parsed once per process and reloaded only when the files change
+    schema_info = catalog.schema()
+    exchange_rates = catalog.exchange_rates()
 
     # User input for natural language query
     natural_language_query = st.text_input("請輸入查詢：", key="natural_language_query", value=st.session_state.natural_language_query)
 
     try:
-        filter_user_input(natural_language_query)
+        with telemetry.span("input_filter", trace_id, query_chars=len(natural_language_query)):
+            filter_user_input(natural_language_query)
     except SecurityException as e:
         st.error(str(e))
         st.stop()
 
-    # Check if database exists, create if not
-    if not os.path.exists(DATABASE_FILE):
-        import create_db
-        conn = create_db.create_connection()
-        create_db.main()
-        conn.close()
+    # Check once per process if the database exists, create if not
+    catalog.ensure_database(DATABASE_FILE, build_database)
+    # Databases built before the rollups, tenant indexes and rate change counter existed get them on first use
+    rollups.ensure(DATABASE_FILE)
+    index_advisor.ensure(DATABASE_FILE)
+    currency.ensure(DATABASE_FILE)
 
     # Generate SQL query using Gemini API
     if st.session_state.natural_language_query:
         if st.session_state.natural_language_query.strip():
+            # Look up the post-processed SQL in the cache before calling Gemini
             with st.spinner("Generating SQL query..."):
-                prompt = {
-                    "query": st.session_state.natural_language_query,
-                    "schema": schema_info,
-                    "exchange_rates": exchange_rates,
-                    "query": st.session_state.natural_language_query,
-                    "schema": schema_info,
-                    "exchange_rates": exchange_rates,
-                    "instructions": "When the user's query involves currency conversion, use the 匯率資料表 table to get the exchange rates. The table contains exchange rates against TWD for USD, JPY, EUR, and HKD, with columns 幣別 (currency), 生效日期 (effective date), 匯率 (exchange rate), 匯率類型 (exchange rate type), and 公司金鑰 (company key). The 生效日期 in 匯率資料表 represents the exchange rate for that specific date and does not need to match the transaction date in other tables; do NOT include the condition `H.生效日期 = T.交易日期` in the SQL query. Also, consider the 帳戶餘額表 table, which has columns 帳戶 (account), 餘額 (balance), 幣別 (currency), 最低安全餘額 (minimum safe balance), and 公司金鑰 (company key). For SQL queries, ensure the following: 1. Use safe alias names for columns (e.g., 'total_in_twd' or 'balance_twd') and avoid special characters like parentheses, commas, or symbols unless enclosed in double quotes (e.g., '\"總額(台幣)\"' for aliases with parentheses). 2. For queries involving date ranges (e.g., 'past year'), use `BETWEEN DATE('now', '-1 year') AND DATE('now')` and assume dates in tables like 交易明細 are in 'YYYY-MM-DD' format. 3. Ensure all generated SQL adheres to SQLite syntax, properly quoting identifiers with double quotes if they contain spaces or special characters, and avoiding reserved keywords or unescaped special characters in aliases."
-                }
-                sql_query = gemini_client.generate_sql(prompt, schema_info)
+                sql_query, cache_hit = pipeline.get_sql(st.session_state.natural_language_query, schema_info, exchange_rates, llm=llm_backend.get_backend(), trace_id=trace_id)
+            if sql_query is None:
+                st.error("Failed to generate SQL query.")
 
             if sql_query:
-                # Remove "```sql" from the beginning of the query
-                sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-                sql_query = sql_query.replace("\n", "")
-
-                # Add spaces around FROM and WHERE
-                sql_query = sql_query.replace("FROM", " FROM ").replace("WHERE", " WHERE ")
-
-                # Enforce 公司金鑰 condition
-                company_key = config.COMPANYKEY
-                # Enforce 公司金鑰 condition
-                sql_query = re.sub(r"公司金鑰\s*=\s*(\".*?\"|'.*?')", f"公司金鑰 = '{company_key}'", sql_query, flags=re.IGNORECASE)
-                if "WHERE" not in sql_query.upper():
-                    sql_query = f"SELECT * FROM ({sql_query}) WHERE 公司金鑰 = '{company_key}'"
-
-                # Extract employee number from the natural language query
-                match = re.search(r"員工(\d+)", st.session_state.natural_language_query)
-                if match:
-                    employee_number = match.group(1)
-                    employee_name = f"員工 {employee_number}"
-                    # Replace the incorrect employee name in the SQL query with the correct one
-                    sql_query = sql_query.replace("'員工姓名'", f"'{employee_name}'")
-
                 # Query the database
                 try:
-                    print(f"Executing SQL query: {sql_query}")
                     with st.spinner("Executing SQL query..."):
-                        results = query_database(sql_query)
+                        results = query_database(sql_query, trace_id, cache_hit)
 
                 except sqlite3.Error as e:
                     st.error(f"Error querying database: {e}. Please check the generated SQL query and the database schema.")
                     results = None
 
-                # Generate a conversational description of the query results
-                results_string = ""
-                if results:
-                    for row in results:
-                        results_string += str(row) + "\n"
-                else:
-                    results_string = "The SQL query returned no results."
-
-                # 1st Summarization
-                with st.spinner("Generating conversational description..."):
-                    now = datetime.datetime.now()
-                    current_time = now.strftime("%Y-%m-%d %H:%M:%S")
-                    description_prompt = f"""You are a helpful assistant that always responds in Traditional Chinese. The current time is {current_time}.
-
-                    If the user's query involves calculating salaries "this month" or "currently", use the current date as the salary date.
+                # Only cache SQL that executed successfully
+                if results is not None and not cache_hit:
+                    pipeline.remember_sql(st.session_state.natural_language_query, schema_info, sql_query)
 
-                    Generate a conversational description of the query results.
-                    Do not include the SQL query in the description.
-                    Do not mention anything about '公司金鑰'，user don't know what is '公司金鑰', just explain it is the filter that belong user's company.
-                    User Natural language query: {st.session_state.natural_language_query}
-                    Query Results: {results_string}
-                    No need to translate Results value
-                    """
+                if results is not None:
+                    with st.expander("查詢結果"):
+                        render_results(results)
+                        render_downloads(results, sql_query)
 
-                    if results_string == "The SQL query returned no results.":
-                        description_prompt += """
-                        Explain why there might be no data.
-                        """
+                # Generate a conversational description of the query results.
+                # Scalar and single-row results get a template description without an LLM call.
+                description_prompt, description = pipeline.build_description_prompt(st.session_state.natural_language_query, results, trace_id)
 
-                    description = gemini_client.generate_description(description_prompt)
+                # 1st Summarization
+                # Sessions asking the same question at the same moment share one description
+                coalesce_key = pipeline.description_key(st.session_state.natural_language_query, sql_query)
+                streamed = False
+                if description is None and config.DESCRIPTION_STREAMING:
+                    # Show the description as it is generated; the chunks are joined for the history
+                    chunks = []
+                    def collect_chunks():
+                        for chunk in pipeline.describe_stream(description_prompt, llm=llm_backend.get_backend(), trace_id=trace_id, coalesce_key=coalesce_key):
+                            chunks.append(chunk)
+                            yield chunk
+                    st.write_stream(collect_chunks())
+                    description = "".join(chunks) or None
+                    streamed = True
+                elif description is None:
+                    with st.spinner("Generating conversational description..."):
+                        description = pipeline.describe(description_prompt, llm=llm_backend.get_backend(), trace_id=trace_id, coalesce_key=coalesce_key)
                 print(f"1st description: {description}")
 
                 if description:
                     # Display the results
-                    st.write(description)
+                    if not streamed:
+                        st.write(description)
                     #st.write(results) Debug用
 
                     # Update conversation history
                     now = datetime.datetime.now()
-                    timestamp = now.strftime("%Y-%m-%d %H:%M")
-                    st.session_state.conversation_history.append((st.session_state.natural_language_query, description, timestamp))
+                    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+                    entry_id = history_store.append(config.COMPANYKEY, st.session_state.natural_language_query, description, sql_query, timestamp)
+                    entry = history_store.HistoryEntry(entry_id, st.session_state.natural_language_query, description, sql_query, timestamp)
+                    st.session_state.history_entries.insert(0, entry)
                 else:
                     st.error("Failed to generate a conversational description of the query results.")
 
@@ -207,22 +234,7 @@ def main():
 
     # Display conversation history
     st.subheader("歷史紀錄")
-    for i, item in enumerate(st.session_state.conversation_history):
-        if len(item) == 2:
-            query, response = item
-            timestamp = "N/A"
-        else:
-            query, response, timestamp = item
-        col1, col2 = st.columns([0.9, 0.1])
-        with col1:
-            st.markdown(f"👤 尊貴的客戶: {query}")
-            st.markdown(f"🤖 CorpQuery: {response}")
-            st.markdown(f"🕒 {timestamp}")
-        with col2:
-            def delete_callback(i):
-                del st.session_state.conversation_history[i]
-                st.session_state.natural_language_query = ""
-            st.button("刪除", key=f"delete_{i}", on_click=delete_callback, args=(i,))
+    render_history()
 
 if __name__ == "__main__":
     main()
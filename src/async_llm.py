@@ -0,0 +1,267 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+import config
+from llm_backend import LLMBackend
+
+# Recent successful call latencies per kind, used for the hedging delay
+LATENCY_WINDOW = 200
+
+class TokenBucket:
+    """
+    A rate limiter shared by every event loop and thread in the process.
+
+    acquire() reserves a token under a plain lock and then sleeps until it is due,
+    so it works regardless of which event loop awaits it (Streamlit starts a new
+    loop per script run).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes one token and returns how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+class ConcurrencyLimit:
+    """A process-wide bound on in-flight requests that any event loop can await."""
+
+    def __init__(self, limit):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    async def __aenter__(self):
+        delay = 0.001
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+class AsyncLLM:
+    """
+    Async generate_sql/generate_description on top of an LLMBackend.
+
+    Every attempt waits for a token of the shared rate limiter and a concurrency
+    slot. Failed attempts (exceptions from the backend's *_async methods, or the
+    per-attempt timeout) are retried with jittered exponential backoff, and when
+    hedging is on a duplicate request is sent once an attempt runs longer than the
+    recent p95 latency; the first answer wins and the other request is cancelled.
+    Backends that only have LLMBackend's thread-based *_async defaults are never
+    hedged, since a call running in a worker thread cannot be cancelled.
+    After the last retry the methods return None, like the synchronous backends.
+    """
+
+    def __init__(self, backend, rate=None, burst=None, concurrency=None, max_retries=None,
+                 retry_base=None, retry_max=None, timeout=None, hedge=None, seed=None):
+        self.backend = backend
+        self.bucket = TokenBucket(rate or config.LLM_RATE_PER_SECOND, burst or config.LLM_BURST)
+        self.limit = ConcurrencyLimit(concurrency or config.LLM_MAX_CONCURRENCY)
+        self.max_retries = config.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_base = config.LLM_RETRY_BASE_SECONDS if retry_base is None else retry_base
+        self.retry_max = config.LLM_RETRY_MAX_SECONDS if retry_max is None else retry_max
+        self.timeout = config.LLM_TIMEOUT_SECONDS if timeout is None else timeout
+        self.hedge = config.LLM_HEDGE if hedge is None else hedge
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.counters = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    def _bump(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _native_async(self, kind):
+        """Whether the backend implements the *_async method itself rather than inheriting the to_thread default."""
+        name = f"{kind}_async"
+        return getattr(type(self.backend), name, None) is not getattr(LLMBackend, name)
+
+    def _hedge_delay(self, kind):
+        """Returns the recent p95 latency of a call kind, or None while there are too few samples."""
+        if not self.hedge or not self._native_async(kind):
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(kind, ()))
+        if len(samples) < config.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(config.LLM_HEDGE_QUANTILE * len(samples)))]
+
+    def _backoff(self, attempt):
+        """Full jitter: a random delay up to the capped exponential backoff."""
+        with self._lock:
+            return self._random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+
+    async def _once(self, kind, prompt, temperature):
+        method = getattr(self.backend, f"{kind}_async")
+        async with self.limit:
+            await self.bucket.acquire()
+            self._bump("attempts")
+            start = time.perf_counter()
+            result = await asyncio.wait_for(method(prompt, temperature), self.timeout)
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=LATENCY_WINDOW)).append(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, kind, prompt, temperature):
+        primary = asyncio.ensure_future(self._once(kind, prompt, temperature))
+        pending = {primary}
+        # Whatever interrupts the wait, including the caller being cancelled,
+        # unfinished requests are cancelled so they stop using quota
+        try:
+            delay = self._hedge_delay(kind)
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            self._bump("hedges")
+            hedge = asyncio.ensure_future(self._once(kind, prompt, temperature))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._bump("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+
+    async def _call(self, kind, prompt, temperature):
+        self._bump("calls")
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._hedged(kind, prompt, temperature)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self._bump("failures")
+                    print(f"Error in {kind} after {attempt + 1} attempts: {e}")
+                    return None
+                self._bump("retries")
+                delay = self._backoff(attempt)
+                print(f"Error in {kind} (attempt {attempt + 1}), retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def generate_sql(self, prompt, temperature=0.0):
+        return await self._call("generate_sql", prompt, temperature)
+
+    async def generate_description(self, prompt, temperature=0.0):
+        return await self._call("generate_description", prompt, temperature)
+
+    def generate_description_stream(self, prompt, temperature=0.0):
+        """
+        Streams a description under the rate and concurrency limits. Failures before
+        the first chunk are retried with backoff; once text has been shown the stream
+        cannot be restarted, so later failures are raised.
+        """
+        self._bump("calls")
+        for attempt in range(self.max_retries + 1):
+            started = False
+            try:
+                with self.limit:
+                    self.bucket.acquire_sync()
+                    self._bump("attempts")
+                    for chunk in self.backend.generate_description_stream(prompt, temperature):
+                        started = True
+                        yield chunk
+                return
+            except Exception as e:
+                if started or attempt == self.max_retries:
+                    self._bump("failures")
+                    raise
+                self._bump("retries")
+                delay = self._backoff(attempt)
+                print(f"Error in generate_description_stream (attempt {attempt + 1}), retrying in {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    def stats(self):
+        """Returns the call counters and the current hedging delays."""
+        with self._lock:
+            current = dict(self.counters)
+        for kind in ("generate_sql", "generate_description"):
+            current[f"{kind}_hedge_delay"] = self._hedge_delay(kind) or 0.0
+        return current
+
+    def metrics(self):
+        """Yields the counters as (metric_name, labels, value) tuples for telemetry."""
+        for key, value in self.stats().items():
+            yield f"corpquery_llm_{key}", {}, value
+
+class ResilientBackend(LLMBackend):
+    """
+    Synchronous LLMBackend facade over AsyncLLM, for the Streamlit app and the pipeline.
+
+    Every call, sync or async, runs on one long-lived event loop in a background
+    thread: the Gemini SDK's async client stays bound to the loop that first used
+    it, so a new loop per call (asyncio.run) would break every later call.
+    """
+
+    def __init__(self, async_llm):
+        self.async_llm = async_llm
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _submit(self, coroutine):
+        """Schedules a coroutine on the backend's loop, starting the loop thread on first use."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def generate_sql(self, prompt, temperature=0.0):
+        return self._submit(self.async_llm.generate_sql(prompt, temperature)).result()
+
+    def generate_description(self, prompt, temperature=0.0):
+        return self._submit(self.async_llm.generate_description(prompt, temperature)).result()
+
+    async def generate_sql_async(self, prompt, temperature=0.0):
+        return await asyncio.wrap_future(self._submit(self.async_llm.generate_sql(prompt, temperature)))
+
+    async def generate_description_async(self, prompt, temperature=0.0):
+        return await asyncio.wrap_future(self._submit(self.async_llm.generate_description(prompt, temperature)))
+
+    def generate_description_stream(self, prompt, temperature=0.0):
+        return self.async_llm.generate_description_stream(prompt, temperature)
+
+    def warm_up(self):
+        self.async_llm.backend.warm_up()
+
+    def metrics(self):
+        return self.async_llm.metrics()
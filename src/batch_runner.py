@@ -0,0 +1,177 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import catalog
+import config
+import llm_backend
+import pipeline
+import currency
+import index_advisor
+import rollups
+import telemetry
+from async_llm import TokenBucket
+from benchmark import load_corpus
+from fake_llm import FakeLLM
+
+def load_questions(path):
+    """
+    Loads the questions to answer from JSONL or CSV.
+
+    JSONL lines are read like the benchmark corpus ("question", or requests.jsonl
+    style entries with quoted questions in "body"). CSV files need a "question"
+    column (otherwise the first column is used) and may carry an "id" column.
+    Every item gets a unique id, which is what --resume matches on.
+
+    Returns:
+        list: dicts with id, question and golden_sql (None when unknown).
+    """
+    if path.lower().endswith(".csv"):
+        items = []
+        # utf-8-sig: spreadsheets exported from Excel start with a BOM
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            for row in csv.DictReader(f):
+                question = row.get("question") or next(iter(row.values()), None)
+                if question and question.strip():
+                    items.append({"id": row.get("id") or row.get("request_id"), "question": question.strip(), "golden_sql": row.get("golden_sql") or None})
+    else:
+        items = load_corpus(path)
+
+    seen = {}
+    for number, item in enumerate(items, 1):
+        base = str(item["id"]) if item["id"] else f"line-{number}"
+        seen[base] = seen.get(base, 0) + 1
+        # requests.jsonl entries can hold several questions under one request_id
+        item["id"] = base if seen[base] == 1 else f"{base}#{seen[base]}"
+    return items
+
+def completed_ids(output_file, retry_errors=False):
+    """Returns the ids already written to output_file (skipping failed ones when retry_errors)."""
+    done = set()
+    if not os.path.exists(output_file):
+        return done
+    with open(output_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by the interruption; the item is simply run again
+                continue
+            if retry_errors and record.get("error"):
+                continue
+            done.add(record["id"])
+    return done
+
+def _record(item, answer, stages, include_rows):
+    """Turns a pipeline answer into one JSON-serializable output line."""
+    results = answer["results"]
+    record = {
+        "id": item["id"],
+        "question": item["question"],
+        "trace_id": answer["trace_id"],
+        "sql": answer["sql"],
+        "cache_hit": answer["cache_hit"],
+        "row_count": len(results) if results is not None else None,
+        "truncated": results.truncated if results is not None else None,
+        "description": answer["description"],
+        "error": answer["error"],
+        "total_ms": round(answer["total_seconds"] * 1000, 3),
+        "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in stages.items()},
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    if include_rows and results is not None:
+        record["columns"] = results.columns
+        record["types"] = results.types
+        record["rows"] = [list(row) for row in results.rows()]
+    return record
+
+def run(items, output_file, llm=None, database_file=None, workers=4, rate=None, use_cache=True, include_rows=False):
+    """
+    Answers the items concurrently and appends one JSON line per item to output_file
+    as soon as it finishes.
+
+    Args:
+        workers (int): Size of the worker pool.
+        rate (float): Maximum questions started per second, or None for no limit.
+
+    Returns:
+        dict: counts of answered and failed items and the elapsed seconds.
+    """
+    schema_info = catalog.schema()
+    exchange_rates = catalog.exchange_rates()
+    bucket = TokenBucket(rate, max(1, workers)) if rate else None
+    write_lock = threading.Lock()
+    summary = {"answered": 0, "failed": 0}
+
+    def answer_item(item):
+        if bucket:
+            bucket.acquire_sync()
+        trace_id = telemetry.new_trace_id()
+        with telemetry.collect(trace_id) as stages:
+            try:
+                answer = pipeline.answer_question(item["question"], schema_info, exchange_rates, llm, database_file, use_cache, trace_id)
+            except Exception as e:
+                # One bad item must not stop the batch
+                answer = {"trace_id": trace_id, "sql": None, "results": None, "description": None, "cache_hit": False, "error": f"{type(e).__name__}: {e}", "total_seconds": 0.0}
+        record = _record(item, answer, stages, include_rows)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with write_lock:
+            out.write(line + "\n")
+            out.flush()
+            summary["failed" if record["error"] else "answered"] += 1
+        print(f"[{summary['answered'] + summary['failed']}/{len(items)}] {item['id']}: {record['error'] or 'ok'} ({record['total_ms']:.0f} ms)")
+
+    start = time.perf_counter()
+    with open(output_file, "a+b") as f:
+        # An interrupted run can leave half a line behind; start the new records on a fresh line
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    with open(output_file, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(answer_item, items))
+    summary["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions without the Streamlit UI.")
+    parser.add_argument("input", help="questions as JSONL (also the requests.jsonl format) or CSV")
+    parser.add_argument("--output", required=True, help="results JSONL, appended to one line per question")
+    parser.add_argument("--database", default=config.DATABASE_FILE)
+    parser.add_argument("--company-key", default=config.COMPANYKEY, help="公司金鑰 every query is restricted to")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=None, help="maximum questions started per second")
+    parser.add_argument("--resume", action="store_true", help="skip ids already present in --output")
+    parser.add_argument("--retry-errors", action="store_true", help="with --resume, run failed ids again")
+    parser.add_argument("--no-sql-cache", action="store_true", help="always ask the LLM for SQL")
+    parser.add_argument("--include-rows", action="store_true", help="also write the result rows")
+    parser.add_argument("--fake-llm", action="store_true", help="answer with golden_sql from the input instead of Gemini")
+    args = parser.parse_args(argv)
+
+    config.COMPANYKEY = str(args.company_key)
+    items = load_questions(args.input)
+    if args.resume:
+        done = completed_ids(args.output, args.retry_errors)
+        items = [item for item in items if item["id"] not in done]
+        print(f"Resuming: {len(done)} done, {len(items)} to go")
+    if not items:
+        return 0
+
+    if args.fake_llm:
+        llm_backend.set_backend(FakeLLM({item["question"]: item["golden_sql"] for item in items if item["golden_sql"]}))
+    llm = llm_backend.get_backend()
+    llm.warm_up()
+    rollups.ensure(args.database)
+    index_advisor.ensure(args.database)
+    currency.ensure(args.database)
+
+    summary = run(items, args.output, llm, args.database, args.workers, args.rate, not args.no_sql_cache, args.include_rows)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import catalog
+import config
+import create_db
+import db_engine
+import llm_backend
+import pipeline
+import telemetry
+from fake_llm import FakeLLM
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(REPO_ROOT, "benchmark_corpus.jsonl")
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmark_baseline.json")
+
+# Regressions smaller than this are treated as noise
+MIN_LATENCY_DELTA_SECONDS = 0.002
+
+def load_corpus(path):
+    """
+    Loads the question corpus from JSONL.
+
+    Lines may carry "question" (and optionally "golden_sql"), or be backlog entries in
+    the requests.jsonl format, whose quoted example questions in "body" are used
+    without golden answers.
+    """
+    corpus = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("question"):
+                corpus.append({"id": item.get("request_id"), "question": item["question"], "golden_sql": item.get("golden_sql")})
+                continue
+            for question in re.findall(r"[\"“「]([^\"”」]*[\u4e00-\u9fff][^\"”」]*)[\"”」]", item.get("body", "")):
+                corpus.append({"id": item.get("request_id"), "question": question, "golden_sql": None})
+    return corpus
+
+def _canonical(rows):
+    """Order-insensitive, float-tolerant representation of a result for comparison."""
+    return sorted(repr(tuple(round(v, 6) if isinstance(v, float) else v for v in row)) for row in rows)
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run(corpus, llm, database_file, iterations=3, concurrency=1, use_cache=False):
+    """Replays the corpus against the pipeline and returns the benchmark report."""
+    schema_info = catalog.schema()
+    exchange_rates = catalog.exchange_rates()
+
+    expected = {}
+    for item in corpus:
+        if item["golden_sql"]:
+            expected[item["question"]] = _canonical(db_engine.fetch_bounded(item["golden_sql"], database_file=database_file).rows())
+
+    telemetry.reset()
+    work = [item for _ in range(iterations) for item in corpus]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        answers = list(executor.map(
+            lambda item: pipeline.answer_question(item["question"], schema_info, exchange_rates, llm, database_file, use_cache),
+            work,
+        ))
+    elapsed = time.perf_counter() - start
+
+    checked = correct = errors = 0
+    failures = []
+    for answer in answers:
+        if answer["error"]:
+            errors += 1
+        if answer["question"] in expected:
+            checked += 1
+            rows = answer["results"].rows() if answer["results"] is not None else None
+            if rows is not None and _canonical(rows) == expected[answer["question"]]:
+                correct += 1
+            elif answer["question"] not in failures:
+                failures.append(answer["question"])
+
+    totals = [answer["total_seconds"] for answer in answers]
+    stages = {
+        name: {key: round(values[key], 6) for key in ("p50", "p95", "p99")} | {"count": values["count"]}
+        for name, values in telemetry.stage_quantiles().items()
+    }
+    stages["total"] = {
+        "p50": round(_quantile(totals, 0.50), 6),
+        "p95": round(_quantile(totals, 0.95), 6),
+        "p99": round(_quantile(totals, 0.99), 6),
+        "count": len(totals),
+    }
+    return {
+        "questions": len(answers),
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 6),
+        "throughput_qps": round(len(answers) / elapsed, 3) if elapsed else 0.0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "errors": errors,
+        "checked": checked,
+        "correct": correct,
+        "accuracy": round(correct / checked, 4) if checked else None,
+        "incorrect_questions": failures,
+        "stages": stages,
+    }
+
+def compare(report, baseline, tolerance):
+    """Returns a list of human-readable regressions of report against baseline."""
+    regressions = []
+    for name, base in baseline.get("stages", {}).items():
+        current = report["stages"].get(name)
+        if not current:
+            continue
+        for key in ("p50", "p95"):
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > MIN_LATENCY_DELTA_SECONDS:
+                regressions.append(f"{name} {key}: {current[key] * 1000:.1f} ms > baseline {base[key] * 1000:.1f} ms")
+    if report["throughput_qps"] < baseline.get("throughput_qps", 0) * (1 - tolerance):
+        regressions.append(f"throughput: {report['throughput_qps']} qps < baseline {baseline['throughput_qps']} qps")
+    if baseline.get("accuracy") is not None and (report["accuracy"] or 0) < baseline["accuracy"]:
+        regressions.append(f"accuracy: {report['accuracy']} < baseline {baseline['accuracy']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with a local stand-in LLM.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="question corpus (JSONL, also accepts the requests.jsonl format)")
+    parser.add_argument("--database", help="existing database to benchmark against instead of a generated one")
+    parser.add_argument("--db-size", type=int, default=1000, help="交易明細 rows in the generated database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sql-latency-ms", type=float, default=0.0, help="simulated generate_sql latency")
+    parser.add_argument("--description-latency-ms", type=float, default=0.0, help="simulated generate_description latency")
+    parser.add_argument("--use-sql-cache", action="store_true", help="let repeated questions hit the NL-to-SQL cache")
+    parser.add_argument("--use-result-cache", action="store_true", help="let repeated SQL hit the query result cache")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before failing")
+    parser.add_argument("--output", help="write the report JSON here")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="corpquery-bench-")
+    # Keep the benchmark's caches and logs away from the real ones
+    config.SQL_CACHE_FILE = os.path.join(workdir, "sql_cache.db")
+    config.INDEX_ADVISOR_FILE = os.path.join(workdir, "index_advisor.db")
+    config.TELEMETRY_LOG_FILE = None
+    config.RESULT_CACHE_ENABLED = args.use_result_cache
+
+    database_file = args.database
+    if not database_file:
+        database_file = os.path.join(workdir, "bench.db")
+        start = time.perf_counter()
+        create_db.generate_database(database_file, employees=max(10, args.db_size // 10), transactions=args.db_size, seed=args.seed)
+        print(f"Generated {database_file} in {time.perf_counter() - start:.2f}s")
+
+    corpus = load_corpus(args.corpus)
+    llm = FakeLLM(
+        {item["question"]: item["golden_sql"] for item in corpus if item["golden_sql"]},
+        sql_latency=args.sql_latency_ms / 1000,
+        description_latency=args.description_latency_ms / 1000,
+        seed=args.seed,
+    )
+    llm_backend.set_backend(llm)
+    report = run(corpus, llm, database_file, args.iterations, args.concurrency, args.use_sql_cache)
+    report["db_size"] = None if args.database else args.db_size
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("PERFORMANCE REGRESSION against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
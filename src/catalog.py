@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+from types import MappingProxyType
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(REPO_ROOT, "schema.json")
+EXCHANGE_RATES_FILE = os.path.join(REPO_ROOT, "exchange_rates.json")
+
+_lock = threading.Lock()
+_files = {}   # path -> _Loaded
+_database_lock = threading.Lock()
+_ready_databases = set()
+
+class _Loaded:
+    """A parsed JSON file with the stat and hashes it was loaded from."""
+
+    def __init__(self, stat, content_hash, value, fingerprint):
+        self.stat = stat
+        self.content_hash = content_hash
+        self.value = value
+        self.fingerprint = fingerprint
+
+def freeze(value):
+    """Turns parsed JSON into read-only shared objects: dicts become MappingProxyType, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def json_default(value):
+    """json.dumps default= hook that serializes frozen mappings."""
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def compute_fingerprint(value):
+    """Returns a stable hash of (frozen or plain) JSON data."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=json_default)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load(path):
+    """
+    Returns the frozen contents of a JSON file, parsing it only when it changed.
+
+    The mtime and size are checked on every call; when they moved, the file is
+    re-read and only re-parsed if its content hash differs too.
+    """
+    path = os.path.abspath(path)
+    stat = _stat_key(path)
+    with _lock:
+        loaded = _files.get(path)
+        if loaded is not None and loaded.stat == stat:
+            return loaded
+        with open(path, "rb") as f:
+            raw = f.read()
+        content_hash = hashlib.sha256(raw).hexdigest()
+        if loaded is not None and loaded.content_hash == content_hash:
+            loaded.stat = stat
+            return loaded
+        if loaded is not None:
+            print(f"Reloading {path}")
+        value = freeze(json.loads(raw.decode("utf-8")))
+        loaded = _Loaded(stat, content_hash, value, compute_fingerprint(value))
+        _files[path] = loaded
+        return loaded
+
+def schema(schema_file=None):
+    """Returns the shared, read-only schema.json contents."""
+    return load(schema_file or SCHEMA_FILE).value
+
+def exchange_rates(exchange_rates_file=None):
+    """Returns the shared, read-only exchange_rates.json contents."""
+    return load(exchange_rates_file or EXCHANGE_RATES_FILE).value
+
+def schema_fingerprint(schema_info=None):
+    """
+    Returns the fingerprint downstream caches key on.
+
+    For the catalog's own schema object (or no argument) the hash computed at load
+    time is returned; any other schema dict is hashed on the spot.
+    """
+    loaded = load(SCHEMA_FILE)
+    if schema_info is None or schema_info is loaded.value:
+        return loaded.fingerprint
+    return compute_fingerprint(schema_info)
+
+def ensure_database(database_file, build):
+    """Calls build() when database_file does not exist; checked once per process and file."""
+    database_file = os.path.abspath(database_file)
+    if database_file in _ready_databases:
+        return
+    with _database_lock:
+        if database_file in _ready_databases:
+            return
+        if not os.path.exists(database_file):
+            build()
+        _ready_databases.add(database_file)
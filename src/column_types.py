@@ -0,0 +1,56 @@
+import catalog
+
+# Storage classes in widening order; BLOB mixed with anything else becomes TEXT (hex)
+RANK = {"INTEGER": 0, "REAL": 1, "TEXT": 2}
+PYTHON_TYPES = {int: "INTEGER", float: "REAL", str: "TEXT", bytes: "BLOB"}
+
+def affinity(declared):
+    """Maps a declared SQL type to INTEGER, REAL, TEXT or BLOB like SQLite's affinity rules, or None."""
+    if not declared:
+        return None
+    declared = declared.upper()
+    if "INT" in declared:
+        return "INTEGER"
+    if any(name in declared for name in ("CHAR", "CLOB", "TEXT")):
+        return "TEXT"
+    if "BLOB" in declared:
+        return "BLOB"
+    return "REAL"
+
+def declared_types(columns, schema_info=None, table_name=None):
+    """
+    Looks up the schema.json type of each result column. For a table its own
+    columns are used; otherwise a name counts only when every table declaring it
+    agrees on the type. Unknown columns get None.
+    """
+    schema_info = schema_info or catalog.schema()
+    if table_name in schema_info:
+        tables = [schema_info[table_name]]
+    else:
+        tables = schema_info.values()
+    types = {}
+    for table_info in tables:
+        for column in table_info.get("columns", []):
+            if column.get("name") == "FOREIGN KEY":
+                continue
+            types.setdefault(column["name"], set()).add(affinity(column.get("type")))
+    return [next(iter(types[name])) if len(types.get(name, ())) == 1 else None for name in columns]
+
+def resolve_types(declared, observed):
+    """
+    Widens each declared type to the storage classes that actually occur, so no
+    value is lost: SQLite keeps REAL values in INTEGER columns and text in numeric
+    ones. Columns with neither a declared type nor values become TEXT.
+    """
+    types = []
+    for declared_type, python_types in zip(declared, observed):
+        kinds = {PYTHON_TYPES.get(python_type, "TEXT") for python_type in python_types if python_type is not type(None)}
+        if declared_type:
+            kinds.add(declared_type)
+        if kinds == {"BLOB"}:
+            types.append("BLOB")
+        elif "BLOB" in kinds:
+            types.append("TEXT")
+        else:
+            types.append(max(kinds, key=RANK.get) if kinds else "TEXT")
+    return types
@@ -1,14 +1,125 @@
 COMPANYKEY = "6224" #測試用的公司金鑰
 
-SQL_TEMPLATE = """
+# Prompt 的固定前綴 (規則)，每個問題都相同，方便供應商端 prefix caching
+SQL_RULES = """
 你是一個SQL生成助手，你可以回答任何有關匯率的問題(包括預期匯率升值的計算問題)，必須遵守：
 1. 所有查詢必須包含WHERE 公司金鑰='{COMPANYKEY}'
 2. 禁止生成DELETE/UPDATE語句
 3. 生成SQL語句需檢查是否有SQL注入風險
 4. 生成SQL語句的時候千萬不要有警告訊息例如"由於我無法預測未來的匯率變動，我將基於目前匯率資料表中的匯率，計算台幣升值"因為這種廢話會讓sql語法錯誤，並且請再三確定生成的sql語法正確\*\*僅返回完全有效的SQL查詢語句。任何包含額外文字或語法錯誤的輸出將被視為錯誤。\*\*
 5. 如果使用者請求的欄位不存在於schema中，則返回錯誤訊息 "欄位不存在"，並根據user的意圖建議詢問方式(例如目前schema沒有記錄帳戶的歷史換匯成本,可以建議查其他的東西)
-{schema}
+"""
 
+SQL_QUESTION_TEMPLATE = """
 Generate a SQL query to answer the following question:
 {question}
 """
+
+SQL_TEMPLATE = SQL_RULES + "{schema}\n" + SQL_QUESTION_TEMPLATE
+
+# 給 SQL 生成的補充說明
+SQL_INSTRUCTIONS = "When the user's query involves currency conversion, do NOT join the 匯率資料表 table; use the SQL functions to_twd(amount, currency, date) and from_twd(amount, currency, date) instead. to_twd converts an amount in currency (USD, JPY, EUR or HKD) into TWD at the 匯率資料表 rate in effect on date for the user's company, e.g. SUM(to_twd(付款金額, 幣別, 交易日期)) AS total_in_twd; from_twd converts a TWD amount into currency. Pass the row's own date column (e.g. 交易日期) for historical amounts, or DATE('now') for current values such as 帳戶餘額表 balances. TWD amounts are returned unchanged. Only query 匯率資料表 directly when the question is about the exchange rates themselves (columns 幣別, 生效日期, 匯率 = foreign currency per 1 TWD, 匯率類型, 公司金鑰). Also, consider the 帳戶餘額表 table, which has columns 帳戶 (account), 餘額 (balance), 幣別 (currency), 最低安全餘額 (minimum safe balance), and 公司金鑰 (company key). For SQL queries, ensure the following: 1. Use safe alias names for columns (e.g., 'total_in_twd' or 'balance_twd') and avoid special characters like parentheses, commas, or symbols unless enclosed in double quotes (e.g., '\"總額(台幣)\"' for aliases with parentheses). 2. For queries involving date ranges (e.g., 'past year'), use `BETWEEN DATE('now', '-1 year') AND DATE('now')` and assume dates in tables like 交易明細 are in 'YYYY-MM-DD' format. 3. Ensure all generated SQL adheres to SQLite syntax, properly quoting identifiers with double quotes if they contain spaces or special characters, and avoiding reserved keywords or unescaped special characters in aliases."
+
+# Prompt 組裝設定
+PROMPT_TOKEN_BUDGET = 6000 #超過時先刪除優先度低的段落
+PROMPT_INCLUDE_EXCHANGE_RATES = False #是否把 exchange_rates.json 放進提示詞；匯率改由 SQL 函式 to_twd/from_twd 查詢
+
+# NL-to-SQL 快取設定
+SQL_CACHE_FILE = "sql_cache.db" #快取檔 (SQLite)
+SQL_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60 #快取有效時間 (秒)
+SQL_CACHE_MAX_ENTRIES = 1000 #超過時以 LRU 淘汰
+
+# 資料庫連線池設定
+DATABASE_FILE = "data.db"
+DB_POOL_SIZE = 8 #唯讀連線數上限
+DB_POOL_TIMEOUT_SECONDS = 10 #等待可用連線的時間
+DB_STATEMENT_CACHE_SIZE = 256 #每條連線的 prepared statement LRU 大小
+DB_CACHE_SIZE_KB = 64 * 1024 #PRAGMA cache_size (KiB)
+DB_MMAP_SIZE = 256 * 1024 * 1024 #PRAGMA mmap_size (bytes)
+
+# 查詢結果讀取設定
+RESULT_CHUNK_SIZE = 500 #每次 fetchmany 的筆數
+RESULT_MAX_ROWS = 5000 #單次查詢最多讀取的筆數
+RESULT_MAX_BYTES = 2 * 1024 * 1024 #單次查詢最多讀取的資料量
+
+# 匯出設定
+EXPORT_CHUNK_SIZE = 10000 #匯出時每次 fetchmany 的筆數 (Parquet 每個 row group 的筆數上限)
+
+# 查詢結果摘要設定 (送給 generate_description 的內容)
+SUMMARY_TOP_N = 5 #每個欄位列出的前幾名
+SUMMARY_SAMPLE_ROWS = 5 #附帶的範例資料筆數
+SUMMARY_MAX_GROUPS = 20 #可做分組合計的欄位最多不重複值數
+
+# Schema 關鍵字索引設定
+SCHEMA_INDEX_FILE = "schema_index.json" #離線建立的關鍵字/同義詞索引
+SCHEMA_INDEX_MAX_TABLES = 8 #每個問題最多放進 prompt 的資料表數
+
+# 延遲量測設定
+TELEMETRY_LOG_FILE = "telemetry.jsonl" #各階段 span 的 JSONL 紀錄
+TELEMETRY_LOG_MAX_BYTES = 10 * 1024 * 1024 #超過即輪替
+TELEMETRY_LOG_BACKUPS = 5 #保留的輪替檔數
+TELEMETRY_WINDOW = 2048 #計算 p50/p95/p99 時每個階段保留的最近樣本數
+TELEMETRY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) #直方圖 bucket (秒)
+METRICS_PORT = 0 #Prometheus 文字格式 /metrics 的埠號，0 表示不啟動
+METRICS_HOST = "127.0.0.1" #/metrics 監聽位址，需要讓其他主機抓取時才改為 "0.0.0.0"
+
+# 索引建議設定
+INDEX_ADVISOR_ENABLED = True #記錄每個執行的 SQL 並以 EXPLAIN QUERY PLAN 檢查全表掃描
+INDEX_ADVISOR_FILE = "index_advisor.db" #查詢紀錄與索引建議
+INDEX_ADVISOR_AUTO_CREATE = False #True 時自動建立出現次數達門檻的建議索引
+INDEX_ADVISOR_MIN_COUNT = 3 #同一存取模式出現幾次才建議/建立索引
+INDEX_ADVISOR_FLUSH_SECONDS = 5 #查詢紀錄先暫存在記憶體，每隔幾秒由背景執行緒批次寫入
+INDEX_ADVISOR_FLUSH_ROWS = 100 #暫存筆數達此數量時提前寫入
+INDEX_ADVISOR_MAX_QUERIES = 2000 #記憶體中保留分析結果 (查詢計畫與建議) 的不同 SQL 數，超過時淘汰最久未用的
+
+# 查詢執行保護設定 (LLM 產生的 SQL)
+GUARD_TIME_BUDGET_SECONDS = 10 #單一查詢最長執行時間，超過即中斷
+GUARD_PROGRESS_STEPS = 1000 #每執行幾個 SQLite VM 指令檢查一次時間
+GUARD_MAX_UNINDEXED_SCANS = 1 #查詢計畫中允許的未使用索引全表掃描數
+GUARD_SMALL_TABLE_ROWS = 1000 #少於此筆數的資料表掃描不計入（依 ANALYZE 估計，無統計資料時最多只數到此筆數）
+
+# 查詢結果快取設定 (SQL + 公司金鑰 -> 結果，資料庫有寫入即失效)
+RESULT_CACHE_ENABLED = True #是否快取查詢結果
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024 #快取結果總大小上限 (依資料量估算，非筆數)
+
+# 對話歷史紀錄設定
+HISTORY_DB_FILE = "history.db" #取代 memory.txt 的歷史紀錄資料庫
+HISTORY_PAGE_SIZE = 10 #歷史紀錄每次顯示/載入的筆數
+
+# Gemini 設定
+GEMINI_MODEL = "gemini-2.0-flash" #使用的模型
+GEMINI_WARM_UP_PING = False #啟動時是否送出 count_tokens 請求，預先建立連線
+
+# LLM 呼叫的速率限制、重試與對沖請求 (async_llm)
+LLM_RESILIENT = True #app 預設的 Gemini 後端是否經過 async_llm
+LLM_RATE_PER_SECOND = 5 #每秒可送出的請求數 (token bucket)
+LLM_BURST = 10 #token bucket 容量
+LLM_MAX_CONCURRENCY = 8 #同時進行中的請求上限
+LLM_MAX_RETRIES = 3 #失敗後最多重試次數
+LLM_RETRY_BASE_SECONDS = 0.5 #指數退避的起始延遲
+LLM_RETRY_MAX_SECONDS = 8 #指數退避的最大延遲
+LLM_TIMEOUT_SECONDS = 60 #單次請求逾時
+LLM_HEDGE = True #請求超過近期 p95 延遲時再送一個相同請求，取先回來的結果
+LLM_HEDGE_QUANTILE = 0.95 #對沖延遲採用的分位數
+LLM_HEDGE_MIN_SAMPLES = 20 #累積足夠樣本後才開始對沖
+
+# 回覆說明設定
+DESCRIPTION_STREAMING = True #口語化說明邊產生邊顯示 (st.write_stream)
+
+# HTTP API 設定 (api_server)
+API_HOST = "127.0.0.1" #監聽位址
+API_PORT = 8000 #監聽埠號
+API_MAX_CONCURRENCY = 16 #同時處理中的 /query 請求上限
+API_MAX_PENDING = 32 #等待處理的請求上限，超過即回 429
+API_MAX_BODY_BYTES = 64 * 1024 #請求內容大小上限
+API_READ_TIMEOUT_SECONDS = 30 #讀取請求 (含 keep-alive 閒置) 的逾時
+
+# 相同請求合併設定 (single_flight)
+SINGLE_FLIGHT_ENABLED = True #同時進行中的相同問題/SQL 共用一次 LLM 呼叫與查詢
+
+# Schema 文件匯入設定 (schema_ingest，相對路徑以專案目錄為準)
+SCHEMA_DOCS_DIR = "DB_Schema" #Word 格式的資料表文件目錄 (含子目錄)
+SCHEMA_MANIFEST_FILE = "schema_manifest.json" #各文件的內容雜湊與解析結果，未變更的文件不重新解析
+SCHEMA_CATALOG_FILE = "schema_catalog.json" #彙整後的 schema 目錄
+SCHEMA_CATALOG_PICKLE = "schema_catalog.pickle" #同內容的 pickle，載入較快
+SCHEMA_INGEST_WORKERS = None #平行解析的程序數，None 表示 CPU 核心數
@@ -1,11 +1,18 @@
 import sqlite3
 import random
 import datetime
-import csv
-import json
+import math
+import argparse
+import itertools
+import catalog
+import config
+import currency
+import exporter
+import index_advisor
+import rollups
 
 # Database file
-DATABASE_FILE = "data.db"
+DATABASE_FILE = config.DATABASE_FILE
 
 def create_connection():
     """Creates a database connection to the SQLite database."""
@@ -78,7 +85,7 @@ def populate_departments(conn, num_records=2):
     count = cur.fetchone()[0]
     print(f"Number of rows in 部門資訊: {count}")
 
-def populate_twd_payment_details(conn, num_records=3):
+def populate_twd_payment_details(conn, num_records=20):
     """Populates the 交易明細 table with fake data."""
     sql = """
     INSERT INTO 交易明細 (收入金額, 付款金額, 費用類型, 付款人資訊, 收款人資訊, 交易日期, 公司金鑰, 備註, 帳戶, 幣別)
@@ -106,7 +113,6 @@ def populate_twd_payment_details(conn, num_records=3):
         "水電費": "Utilities",
         "薪資": "Salaries"
     }
-    num_records = 20
     for i in range(num_records):
         payment_amount = round(random.uniform(2000, 10000), 0)
         income_amount = 0
@@ -143,8 +149,7 @@ def populate_exchange_rates(conn):
     exchange_rate_type = "即期匯率"
 
     # Load exchange rates from JSON file
-    with open("exchange_rates.json", 'r') as f:
-        exchange_rates = json.load(f)
+    exchange_rates = catalog.exchange_rates()
 
     for key, rate in exchange_rates.items():
         if key.startswith("TWD_"):
@@ -198,173 +203,379 @@ def populate_account_balances(conn):
     count = cur.fetchone()[0]
     print(f"Number of rows in 帳戶餘額表: {count}")
 
-def display_table_data(conn, table_name):
-    """Displays all data from a table in the SQLite database."""
-    try:
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM {table_name}")
-        rows = cur.fetchall()
-        print(f"Data in {table_name}:")
-        for row in rows:
-            print(row)
-    except sqlite3.Error as e:
-        print(f"Error displaying data from {table_name}: {e}")
+# --- Bulk, seeded data generation -------------------------------------------
 
-def export_to_csv(conn, table_name, filename):
-    """Exports a table from the SQLite database to a CSV file."""
-    try:
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM {table_name}")
-        rows = cur.fetchall()
-        print(f"Data from {table_name}: {rows}")
+GENERATOR_BATCH_SIZE = 50000 #每批 executemany 的筆數
+
+ACCOUNT_CURRENCY_MAP = {
+    "臺幣帳戶1": "TWD",
+    "臺幣帳戶2": "TWD",
+    "日幣帳戶": "JPY",
+    "美金帳戶": "USD",
+    "歐元帳戶": "EUR",
+    "港幣帳戶": "HKD"
+}
+# Share of transactions per account; most business happens in TWD
+ACCOUNT_WEIGHTS = [0.35, 0.25, 0.1, 0.18, 0.07, 0.05]
+DEPARTMENTS = ["Sales", "Marketing", "Engineering", "HR", "IT", "Finance", "Research", "Operations"]
+LOCATIONS = ["台北", "新竹", "台中", "高雄", "Tokyo", "Singapore", "Hong Kong", "New York"]
+# 職稱 -> typical monthly salary in TWD
+JOB_TITLE_SALARIES = {"Engineer": 70000, "Manager": 110000, "Analyst": 65000, "Developer": 72000, "Designer": 60000, "Tester": 55000}
+# 備註 -> (費用類型, median payment in TWD, spread)
+PAYMENT_MEMOS = {
+    "材料費": ("Materials", 20000, 0.8),
+    "辦公室租金": ("Rent", 80000, 0.3),
+    "廣告費": ("Advertising", 30000, 0.9),
+    "水電費": ("Utilities", 5000, 0.5),
+    "薪資": ("Salaries", 150000, 0.6),
+}
+INCOME_MEMOS = ["貨款收入", "服務收入", "利息收入", "退款"]
+COUNTERPARTIES = ["台灣電力公司", "台北自來水事業處", "欣欣天然氣", "遠東百貨", "統一企業", "宏達國際", "John Smith", "David Lee", "Mary Chen"]
+COMPANY_NAMES = ["宏益科技股份有限公司", "長興貿易有限公司", "瑞豐實業股份有限公司", "聯成國際有限公司", "大同精密股份有限公司"]
+
+def generate_company_keys(num_tenants):
+    """Returns the tenant keys, starting at config.COMPANYKEY so the app's tenant always has data."""
+    first = int(config.COMPANYKEY)
+    return [str(first + i) for i in range(num_tenants)]
 
-        # Get column names
-        column_names = [description[0] for description in cur.description]
+def company_name(company_key):
+    """Returns the display name a tenant uses as 付款人資訊/收款人資訊."""
+    offset = int(company_key) - int(config.COMPANYKEY)
+    if 0 <= offset < len(COMPANY_NAMES):
+        return COMPANY_NAMES[offset]
+    return f"公司{company_key}"
+
+def _tenant_weights(company_keys):
+    # Zipf-like: a few large tenants and a long tail of small ones
+    return [1 / (i + 1) for i in range(len(company_keys))]
+
+def _date_range(start_date, end_date):
+    days = (end_date - start_date).days
+    return [start_date + datetime.timedelta(days=i) for i in range(days + 1)]
+
+def _date_weights(dates):
+    """Weekdays, month ends and recent dates are more likely, like real transaction volume."""
+    weights = []
+    total = max(len(dates) - 1, 1)
+    for i, day in enumerate(dates):
+        weight = 1.0 if day.weekday() < 5 else 0.15
+        if day.day >= 25 or day.day <= 5:
+            weight *= 1.6
+        weights.append(weight * (0.6 + 0.8 * i / total))
+    return weights
+
+def _insert_batches(conn, sql, rows, batch_size=GENERATOR_BATCH_SIZE):
+    """Inserts rows with executemany in large batches inside one transaction."""
+    count = 0
+    batch = []
+    with conn:
         for row in rows:
-            print(row)
-
-        # Write to CSV file
-        with open(filename, "w", newline="", encoding="utf-8-sig") as csvfile:
-            csv_writer = csv.writer(csvfile)
-            # Write header row
-            csv_writer.writerow(column_names)
-            # Convert amount columns to integers where applicable
-            new_rows = []
-            for row in rows:
-                if table_name == "員工薪資":
-                    new_row = (row[0], row[1], int(row[2]) if row[2] is not None else None, row[3], row[4], row[5], row[6], row[7])
-                elif table_name == "部門資訊":
-                    new_row = (row[0], row[1], row[2], int(row[3]) if row[3] is not None else None, row[4], row[5])
-                elif table_name == "交易明細":
-                    new_row = (
-                        int(row[0]) if row[0] is not None else None,  # 收入金額
-                        int(row[1]) if row[1] is not None else None,  # 付款金額
-                        row[2],  # 費用類型
-                        row[3],  # 付款人資訊
-                        row[4],  # 收款人資訊
-                        row[5],  # 交易日期
-                        row[6],  # 公司金鑰
-                        row[7],  # 備註
-                        row[8],  # 帳戶
-                        row[9]   # 幣別
-                    )
-                elif table_name == "匯率資料表":
-                    new_row = (row[0], row[1], row[2], row[3], '6224')
-                elif table_name == "帳戶餘額表":
-                    new_row = (row[0], row[1], row[2], row[3], '6224')
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+def generate_exchange_rate_history(conn, rng, company_keys, start_date, end_date):
+    """Generates a daily (business day) 匯率資料表 history as a random walk around exchange_rates.json."""
+    exchange_rates = catalog.exchange_rates()
+    base_rates = {key[4:]: rate for key, rate in exchange_rates.items() if key.startswith("TWD_")}
+    history = []
+    for currency, base in sorted(base_rates.items()):
+        rate = base
+        for day in _date_range(start_date, end_date):
+            if day.weekday() >= 5:
+                continue
+            # Small daily moves with a pull back towards the long-run rate
+            rate *= 1 + rng.gauss(0, 0.004) + 0.02 * (base - rate) / base
+            history.append((currency, day.isoformat(), round(rate, 6)))
+    sql = "INSERT INTO 匯率資料表 (幣別, 生效日期, 匯率, 匯率類型, 公司金鑰) VALUES (?, ?, ?, ?, ?)"
+    rows = ((currency, day, rate, "即期匯率", company_key) for company_key in company_keys for currency, day, rate in history)
+    count = _insert_batches(conn, sql, rows)
+    print(f"Generated {count} rows in 匯率資料表")
+    return {currency: rate for currency, _, rate in history}
+
+def generate_departments(conn, rng, company_keys):
+    """Generates the same set of departments for every tenant."""
+    sql = "INSERT INTO 部門資訊 (部門編號, 部門名稱, 部門主管, 部門人數, 地點, 公司金鑰) VALUES (?, ?, ?, ?, ?, ?)"
+    rows = []
+    for t, company_key in enumerate(company_keys):
+        for d, department in enumerate(DEPARTMENTS):
+            rows.append((t * len(DEPARTMENTS) + d + 1, department, f"主管 {t * len(DEPARTMENTS) + d + 1}", rng.randint(5, 200), rng.choice(LOCATIONS), company_key))
+    count = _insert_batches(conn, sql, rows)
+    print(f"Generated {count} rows in 部門資訊")
+
+def generate_salaries(conn, rng, num_employees, company_keys, start_date, end_date):
+    """Generates one 員工薪資 row per employee, spread over the tenants."""
+    sql = """
+    INSERT INTO 員工薪資 (員工編號, 員工姓名, 薪資, 部門, 職稱, 到職日期, 公司金鑰, 薪資日期)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    titles = list(JOB_TITLE_SALARIES)
+    tenant_weights = _tenant_weights(company_keys)
+    # Payroll runs on the 5th of each month
+    pay_dates = [day for day in _date_range(start_date, end_date) if day.day == 5] or [end_date]
+
+    def rows():
+        for employee_id in range(1, num_employees + 1):
+            title = rng.choice(titles)
+            salary = round(JOB_TITLE_SALARIES[title] * rng.lognormvariate(0, 0.15), -2)
+            hire_date = end_date - datetime.timedelta(days=rng.randint(30, 3650))
+            company_key = rng.choices(company_keys, weights=tenant_weights)[0]
+            yield (employee_id, f"員工 {employee_id}", salary, rng.choice(DEPARTMENTS), title,
+                   hire_date.isoformat(), company_key, rng.choice(pay_dates).isoformat())
+
+    count = _insert_batches(conn, sql, rows())
+    print(f"Generated {count} rows in 員工薪資")
+
+def generate_transactions(conn, rng, num_transactions, company_keys, start_date, end_date, latest_rates):
+    """Generates 交易明細 rows with realistic date, currency and amount distributions."""
+    sql = """
+    INSERT INTO 交易明細 (收入金額, 付款金額, 費用類型, 付款人資訊, 收款人資訊, 交易日期, 公司金鑰, 備註, 帳戶, 幣別)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    dates = [day.isoformat() for day in _date_range(start_date, end_date)]
+    date_cum_weights = list(itertools.accumulate(_date_weights(_date_range(start_date, end_date))))
+    tenant_cum_weights = list(itertools.accumulate(_tenant_weights(company_keys)))
+    accounts = list(ACCOUNT_CURRENCY_MAP)
+    account_cum_weights = list(itertools.accumulate(ACCOUNT_WEIGHTS))
+    memos = list(PAYMENT_MEMOS)
+    names = {company_key: company_name(company_key) for company_key in company_keys}
+
+    def rows():
+        remaining = num_transactions
+        while remaining > 0:
+            n = min(remaining, GENERATOR_BATCH_SIZE)
+            remaining -= n
+            batch_dates = rng.choices(dates, cum_weights=date_cum_weights, k=n)
+            batch_tenants = rng.choices(company_keys, cum_weights=tenant_cum_weights, k=n)
+            batch_accounts = rng.choices(accounts, cum_weights=account_cum_weights, k=n)
+            for transaction_date, company_key, account in zip(batch_dates, batch_tenants, batch_accounts):
+                name = names[company_key]
+                currency = ACCOUNT_CURRENCY_MAP[account]
+                # exchange rates are quoted as foreign currency per TWD
+                rate = latest_rates.get(currency, 1.0)
+                if rng.random() < 0.4:
+                    income = round(rng.lognormvariate(math.log(50000), 1.0) * rate, 2 if currency != "TWD" else 0)
+                    memo = rng.choice(INCOME_MEMOS)
+                    yield (income, 0, "Income", rng.choice(COUNTERPARTIES), name, transaction_date, company_key, memo, account, currency)
                 else:
-                    new_row = row
-                new_rows.append(new_row)
-            # Write data rows
-            csv_writer.writerows(new_rows)
-        print(f"Exported {table_name} to {filename}")
+                    memo = rng.choice(memos)
+                    charge_type, median, spread = PAYMENT_MEMOS[memo]
+                    payment = round(rng.lognormvariate(math.log(median), spread) * rate, 2 if currency != "TWD" else 0)
+                    yield (0, payment, charge_type, name, rng.choice(COUNTERPARTIES), transaction_date, company_key, memo, account, currency)
+
+    count = _insert_batches(conn, sql, rows())
+    print(f"Generated {count} rows in 交易明細")
+
+def generate_account_balances(conn, rng, company_keys, latest_rates):
+    """Generates the six accounts of every tenant, some of them below the minimum safe balance."""
+    sql = "INSERT INTO 帳戶餘額表 (帳戶, 餘額, 幣別, 最低安全餘額, 公司金鑰) VALUES (?, ?, ?, ?, ?)"
+    rows = []
+    for company_key in company_keys:
+        for account, currency in ACCOUNT_CURRENCY_MAP.items():
+            rate = latest_rates.get(currency, 1.0)
+            min_safe_balance = round(100000 * rate, 0)
+            balance = round(rng.uniform(0.5, 20) * 100000 * rate, 0)
+            rows.append((account, balance, currency, min_safe_balance, company_key))
+    count = _insert_batches(conn, sql, rows)
+    print(f"Generated {count} rows in 帳戶餘額表")
+
+def generate_database(database_file, employees=1000, transactions=100000, tenants=3, years=3, seed=None, end_date=None):
+    """
+    Builds a database of realistic size with seeded, reproducible data.
+
+    Args:
+        database_file (str): The database to (re)create.
+        employees (int): Number of 員工薪資 rows.
+        transactions (int): Number of 交易明細 rows.
+        tenants (int): Number of 公司金鑰 values, starting at config.COMPANYKEY.
+        years (int): Length of the transaction and 匯率資料表 history.
+        seed (int): Random seed; the same seed and end_date give the same data.
+        end_date (datetime.date): Last day of the history, today by default.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=365 * years)
+    company_keys = generate_company_keys(tenants)
+
+    conn = sqlite3.connect(database_file)
+    try:
+        create_tables(conn)
+        # Bulk load without fsyncs; the file is rebuilt from scratch on failure anyway
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        latest_rates = generate_exchange_rate_history(conn, rng, company_keys, start_date, end_date)
+        generate_departments(conn, rng, company_keys)
+        generate_salaries(conn, rng, employees, company_keys, start_date, end_date)
+        generate_transactions(conn, rng, transactions, company_keys, start_date, end_date, latest_rates)
+        generate_account_balances(conn, rng, company_keys, latest_rates)
+        finalize_database(conn)
+    finally:
+        conn.close()
+
+def create_tables(conn):
+    """Drops and recreates every table."""
+    # Define table creation statements
+    account_balance_table_sql = """
+    CREATE TABLE IF NOT EXISTS 帳戶餘額表 (
+        帳戶 TEXT,
+        餘額 REAL,
+        幣別 TEXT,
+        最低安全餘額 REAL,
+        公司金鑰 TEXT,
+        PRIMARY KEY (公司金鑰, 帳戶),
+        FOREIGN KEY (帳戶) REFERENCES 交易明細(帳戶)
+    );
+    """
+
+    salaries_table_sql = """
+    CREATE TABLE IF NOT EXISTS 員工薪資 (
+        員工編號 INTEGER PRIMARY KEY,
+        員工姓名 TEXT,
+        薪資 REAL,
+        部門 TEXT,
+        職稱 TEXT,
+        到職日期 TEXT,
+        公司金鑰 TEXT,
+        薪資日期 TEXT
+    );
+    """
+
+    departments_table_sql = """
+    CREATE TABLE IF NOT EXISTS 部門資訊 (
+        部門編號 INTEGER PRIMARY KEY,
+        部門名稱 TEXT,
+        部門主管 TEXT,
+        部門人數 TEXT,
+        地點 TEXT,
+        公司金鑰 TEXT
+    );
+    """
+
+    twd_payment_details_table_sql = """
+    CREATE TABLE IF NOT EXISTS 交易明細 (
+        收入金額 INTEGER,
+        付款金額 REAL,
+        費用類型 TEXT,
+        付款人資訊 TEXT,
+        收款人資訊 TEXT,
+        交易日期 TEXT,
+        公司金鑰 TEXT,
+        備註 TEXT,
+        帳戶 TEXT,
+        幣別 TEXT
+    );
+    """
+
+    exchange_rates_table_sql = """
+    CREATE TABLE IF NOT EXISTS 匯率資料表 (
+        幣別 TEXT,
+        生效日期 TEXT,
+        匯率 REAL,
+        匯率類型 TEXT,
+        公司金鑰 TEXT,
+        PRIMARY KEY (公司金鑰, 幣別, 生效日期)
+    );
+    """
+
+    # Drop existing tables (if they exist)
+    try:
+        cur = conn.cursor()
+        cur.execute("DROP TABLE IF EXISTS 員工薪資")
+        cur.execute("DROP TABLE IF EXISTS 部門資訊")
+        cur.execute("DROP TABLE IF EXISTS 交易明細")
+        cur.execute("DROP TABLE IF EXISTS 匯率資料表")
+        cur.execute("DROP TABLE IF EXISTS 帳戶餘額表")
+        conn.commit()
     except sqlite3.Error as e:
-        print(f"Error exporting {table_name}: {e}")
+        print(f"Error dropping tables: {e}")
 
-def main():
-    conn = create_connection()
-    if conn is not None:
-        # Define table creation statements
-        account_balance_table_sql = """
-        CREATE TABLE IF NOT EXISTS 帳戶餘額表 (
-            帳戶 TEXT PRIMARY KEY,
-            餘額 REAL,
-            幣別 TEXT,
-            最低安全餘額 REAL,
-            公司金鑰 TEXT,
-            FOREIGN KEY (帳戶) REFERENCES 交易明細(帳戶)
-        );
-        """
-
-        salaries_table_sql = """
-        CREATE TABLE IF NOT EXISTS 員工薪資 (
-            員工編號 INTEGER PRIMARY KEY,
-            員工姓名 TEXT,
-            薪資 REAL,
-            部門 TEXT,
-            職稱 TEXT,
-            到職日期 TEXT,
-            公司金鑰 TEXT,
-            薪資日期 TEXT
-        );
-        """
-
-        departments_table_sql = """
-        CREATE TABLE IF NOT EXISTS 部門資訊 (
-            部門編號 INTEGER PRIMARY KEY,
-            部門名稱 TEXT,
-            部門主管 TEXT,
-            部門人數 TEXT,
-            地點 TEXT,
-            公司金鑰 TEXT
-        );
-        """
-
-        twd_payment_details_table_sql = """
-        CREATE TABLE IF NOT EXISTS 交易明細 (
-            收入金額 INTEGER,
-            付款金額 REAL,
-            費用類型 TEXT,
-            付款人資訊 TEXT,
-            收款人資訊 TEXT,
-            交易日期 TEXT,
-            公司金鑰 TEXT,
-            備註 TEXT,
-            帳戶 TEXT,
-            幣別 TEXT
-        );
-        """
-
-        exchange_rates_table_sql = """
-        CREATE TABLE IF NOT EXISTS 匯率資料表 (
-            幣別 TEXT,
-            生效日期 TEXT,
-            匯率 REAL,
-            匯率類型 TEXT,
-            公司金鑰 TEXT,
-            PRIMARY KEY (幣別, 生效日期)
-        );
-        """
-
-        # Drop existing tables (if they exist)
+    # Create tables
+    create_table(conn, account_balance_table_sql)
+    create_table(conn, salaries_table_sql)
+    create_table(conn, departments_table_sql)
+    create_table(conn, twd_payment_details_table_sql)
+    create_table(conn, exchange_rates_table_sql)
+
+def create_indexes(conn):
+    """Creates the tenant-first secondary indexes."""
+    for name, definition in index_advisor.INDEXES.items():
         try:
-            cur = conn.cursor()
-            cur.execute("DROP TABLE IF EXISTS 員工薪資")
-            cur.execute("DROP TABLE IF EXISTS 部門資訊")
-            cur.execute("DROP TABLE IF EXISTS 交易明細")
-            cur.execute("DROP TABLE IF EXISTS 匯率資料表")
-            cur.execute("DROP TABLE IF EXISTS 帳戶餘額表")
-            conn.commit()
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON {definition}')
         except sqlite3.Error as e:
-            print(f"Error dropping tables: {e}")
+            print(f"Error creating index {name}: {e}")
+    conn.commit()
 
-        # Create tables
-        create_table(conn, account_balance_table_sql)
-        create_table(conn, salaries_table_sql)
-        create_table(conn, departments_table_sql)
-        create_table(conn, twd_payment_details_table_sql)
-        create_table(conn, exchange_rates_table_sql)
+def finalize_database(conn):
+    """Creates the indexes, monthly rollups and the 匯率資料表 change counter after the load, refreshes planner statistics and switches to WAL."""
+    create_indexes(conn)
+    try:
+        # Filled in one pass here; from now on the rollup triggers keep them current
+        rollups.install(conn)
+        currency.install(conn)
+        # Statistics let the planner choose between the date and currency indexes
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        # WAL lets the app's read-only connections keep reading while this script writes
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.Error as e:
+        print(f"Error finalizing database: {e}")
 
-        # Populate tables with fake data
+def populate_tables(conn, num_records=None):
+    """Populates every table with fake data."""
+    if num_records is None:
         populate_salaries(conn)
         populate_departments(conn)
         populate_twd_payment_details(conn)
-        populate_exchange_rates(conn)
-        populate_account_balances(conn)
+    else:
+        populate_salaries(conn, num_records)
+        populate_departments(conn, num_records)
+        populate_twd_payment_details(conn, num_records)
+    populate_exchange_rates(conn)
+    populate_account_balances(conn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Creates data.db. Without size options a small demo database is built and exported to CSV.")
+    parser.add_argument("--db", default=DATABASE_FILE, help="database file to (re)create")
+    parser.add_argument("--employees", type=int, help="number of 員工薪資 rows (enables the bulk generator)")
+    parser.add_argument("--transactions", type=int, help="number of 交易明細 rows (enables the bulk generator)")
+    parser.add_argument("--tenants", type=int, default=3, help="number of 公司金鑰 values")
+    parser.add_argument("--years", type=int, default=3, help="years of transaction and exchange rate history")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible data")
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat, help="last day of the history (YYYY-MM-DD), today by default")
+    args = parser.parse_args(argv)
+
+    if args.employees is not None or args.transactions is not None:
+        generate_database(
+            args.db,
+            employees=args.employees if args.employees is not None else 1000,
+            transactions=args.transactions if args.transactions is not None else 100000,
+            tenants=args.tenants,
+            years=args.years,
+            seed=args.seed,
+            end_date=args.end_date,
+        )
+        return
 
-        # Display table data
-        display_table_data(conn, "員工薪資")
-        display_table_data(conn, "部門資訊")
-        display_table_data(conn, "交易明細")
-        display_table_data(conn, "匯率資料表")
-        display_table_data(conn, "帳戶餘額表")
+    if args.seed is not None:
+        random.seed(args.seed)
+    conn = sqlite3.connect(args.db) if args.db != DATABASE_FILE else create_connection()
+    if conn is not None:
+        create_tables(conn)
+
+        # Populate tables with fake data
+        populate_tables(conn)
+        finalize_database(conn)
 
         # Export to CSV
-        export_to_csv(conn, "員工薪資", "員工薪資.csv")
-        export_to_csv(conn, "部門資訊", "部門資訊.csv")
-        export_to_csv(conn, "交易明細", "交易明細.csv")
-        export_to_csv(conn, "匯率資料表", "匯率資料表.csv")
-        export_to_csv(conn, "帳戶餘額表", "帳戶餘額表.csv")
+        for table_name in ("員工薪資", "部門資訊", "交易明細", "匯率資料表", "帳戶餘額表"):
+            exporter.export_table(conn, table_name, f"{table_name}.csv")
 
         conn.close()
     else:
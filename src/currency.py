@@ -0,0 +1,221 @@
+import bisect
+import os
+import sqlite3
+import threading
+import config
+import db_engine
+
+class RateHistory:
+    """
+    The 匯率資料表 rows of one database, per (公司金鑰, 幣別), as parallel sorted lists
+    of 生效日期 and 匯率 so an as-of lookup is one bisect.
+
+    匯率 is the amount of foreign currency per TWD (TWD_USD = 0.03), so an amount
+    converts to TWD as amount / 匯率.
+    """
+
+    def __init__(self, rows):
+        self.history = {}
+        for company_key, currency, effective_date, rate in rows:
+            dates, rates = self.history.setdefault((str(company_key), currency), ([], []))
+            dates.append(effective_date)
+            rates.append(rate)
+
+    def rate(self, currency, date=None, company_key=None):
+        """
+        Returns the rate in effect on date (the latest 生效日期 on or before it), the
+        latest rate when date is None, or the earliest one for dates before the
+        history starts. None when the company has no rates for the currency.
+        """
+        entry = self.history.get((str(company_key or config.COMPANYKEY), currency.upper()))
+        if entry is None:
+            return None
+        dates, rates = entry
+        if date is None:
+            return rates[-1]
+        # Timestamps compare by their date part
+        index = bisect.bisect_right(dates, str(date)[:10]) - 1
+        return rates[max(index, 0)]
+
+    def rows(self):
+        return sum(len(dates) for dates, _ in self.history.values())
+
+# Distinct (幣別, 日期) lookups remembered per history before the memo is cleared
+MEMO_SIZE = 100000
+
+# One-row counter the 匯率資料表 triggers bump, so writes to other tables (交易明細
+# loads, rollup triggers, new indexes) do not reload the rate history
+CHANGE_TABLE = "匯率異動"
+_UNLOADED = object()
+
+class _Converter:
+    """
+    The SQL functions of one database; the history is swapped when 匯率資料表 changes.
+    Rates are always those of config.COMPANYKEY, the tenant every query is scoped to.
+
+    Rows repeat the same few currencies and dates, so the resolved rate per
+    (幣別, 日期) is memoized and most calls are a single dict lookup.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.rates_version = _UNLOADED
+        self.lock = threading.Lock()
+        self.set_history(RateHistory(()))
+
+    def set_history(self, history):
+        self.history = history
+        self.memo = {}
+
+    def _rate(self, currency, date):
+        """Returns the TWD rate for the arguments: 1.0 for TWD, None when unknown."""
+        key = (currency, date)
+        memo = self.memo
+        rate = memo.get(key, 0)
+        if rate == 0:
+            if currency is None or str(currency).upper() == "TWD":
+                rate = 1.0
+            else:
+                rate = self.history.rate(str(currency), date, config.COMPANYKEY) or None
+            if len(memo) >= MEMO_SIZE:
+                memo.clear()
+            memo[key] = rate
+        return rate
+
+    def to_twd(self, amount, currency=None, date=None):
+        if amount is None:
+            return None
+        rate = self._rate(currency, date)
+        if rate is None:
+            return None
+        try:
+            return amount / rate
+        except TypeError:
+            return _number(amount, lambda value: value / rate)
+
+    def from_twd(self, amount, currency=None, date=None):
+        if amount is None:
+            return None
+        rate = self._rate(currency, date)
+        if rate is None:
+            return None
+        try:
+            return amount * rate
+        except TypeError:
+            return _number(amount, lambda value: value * rate)
+
+def _number(amount, convert):
+    """Converts amounts stored as text; anything that is not a number gives NULL."""
+    try:
+        return convert(float(amount))
+    except (TypeError, ValueError):
+        return None
+
+_lock = threading.Lock()
+_converters = {}
+_ensured = set()   # database files checked by ensure()
+
+def install(conn):
+    """Creates the 匯率資料表 change counter and the triggers that bump it."""
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{CHANGE_TABLE}" (id INTEGER PRIMARY KEY CHECK (id = 1), 版本 INTEGER NOT NULL)')
+    conn.execute(f'INSERT OR IGNORE INTO "{CHANGE_TABLE}" VALUES (1, 0)')
+    # Bumped here too: the table may have been recreated and reloaded before the triggers existed
+    conn.execute(f'UPDATE "{CHANGE_TABLE}" SET 版本 = 版本 + 1')
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(
+            f'CREATE TRIGGER IF NOT EXISTS "trg_匯率資料表_{event.lower()}" AFTER {event} ON 匯率資料表 '
+            f'BEGIN UPDATE "{CHANGE_TABLE}" SET 版本 = 版本 + 1; END'
+        )
+    conn.commit()
+
+def is_installed(conn):
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    return CHANGE_TABLE in names and all(f"trg_匯率資料表_{event}" in names for event in ("insert", "update", "delete"))
+
+def ensure(database_file=None):
+    """Installs the change counter into an existing database that lacks it; checked once per process and file."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    if database_file in _ensured:
+        return
+    with _lock:
+        if database_file in _ensured or not os.path.exists(database_file):
+            return
+        conn = sqlite3.connect(database_file, timeout=30)
+        try:
+            if not is_installed(conn):
+                install(conn)
+                print(f"Installed the 匯率資料表 change counter into {database_file}")
+        except sqlite3.Error as e:
+            print(f"Error installing the 匯率資料表 change counter into {database_file}: {e}")
+        finally:
+            conn.close()
+        _ensured.add(database_file)
+
+def rates_version(conn):
+    """
+    Returns the 匯率資料表 change counter, or a (COUNT(*), MAX(rowid)) signature on
+    databases without it; None when there is no 匯率資料表.
+    """
+    try:
+        return conn.execute(f'SELECT 版本 FROM "{CHANGE_TABLE}"').fetchone()
+    except sqlite3.OperationalError:
+        pass
+    try:
+        return conn.execute("SELECT COUNT(*), MAX(rowid) FROM 匯率資料表").fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+def load_history(conn):
+    """Reads 匯率資料表 into a RateHistory; an empty one when the table does not exist."""
+    try:
+        rows = conn.execute(
+            "SELECT CAST(公司金鑰 AS TEXT), UPPER(幣別), 生效日期, 匯率 FROM 匯率資料表 "
+            "WHERE 匯率 > 0 ORDER BY 1, 2, 3"
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"Error loading 匯率資料表: {e}")
+        rows = []
+    return RateHistory(rows)
+
+def converter(database_file):
+    with _lock:
+        current = _converters.get(database_file)
+        if current is None:
+            current = _converters[database_file] = _Converter()
+        return current
+
+def refresh(conn, database_file):
+    """
+    Reloads the rate history when 匯率資料表 changed since it was loaded. A checkout
+    only compares PRAGMA data_version; the table's change counter is read once
+    after each commit to the database.
+    """
+    current = converter(database_file)
+    version = db_engine.data_version(database_file)
+    if current.version == version:
+        return current
+    with current.lock:
+        if current.version != version:
+            rates = rates_version(conn)
+            if rates != current.rates_version:
+                current.set_history(load_history(conn))
+                current.rates_version = rates
+            current.version = version
+    return current
+
+def _on_checkout(conn, database_file, created):
+    current = refresh(conn, database_file)
+    if created:
+        for arguments in (1, 2, 3):
+            conn.create_function("to_twd", arguments, current.to_twd)
+            conn.create_function("from_twd", arguments, current.from_twd)
+
+def rate_history(database_file=None):
+    """Returns the current RateHistory of a database, refreshed if it changed."""
+    pool = db_engine.get_pool(database_file)
+    # Checking a connection out runs _on_checkout, which refreshes the history
+    with pool.connection():
+        return converter(pool.database_file).history
+
+# Every pool connection gets to_twd(amount, 幣別, 日期) and from_twd(...)
+db_engine.register_connection_hook(_on_checkout)
@@ -0,0 +1,266 @@
+import sqlite3
+import os
+import queue
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+import config
+from result_set import ColumnarResult, value_size
+
+def enable_wal(database_file):
+    """Switches the database to WAL so readers do not block the batch writer."""
+    if not os.path.exists(database_file):
+        return None
+    conn = None
+    try:
+        conn = sqlite3.connect(database_file)
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        return mode
+    except sqlite3.Error as e:
+        print(f"Error enabling WAL on {database_file}: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+_connection_hooks = []
+
+def register_connection_hook(hook):
+    """
+    Registers hook(conn, database_file, created), called on every pool checkout;
+    created is True for a newly opened connection, e.g. to register SQL functions.
+    Register hooks before the first query so every connection gets them.
+    """
+    if hook not in _connection_hooks:
+        _connection_hooks.append(hook)
+
+class ConnectionPool:
+    """
+    A thread-safe pool of read-only SQLite connections.
+
+    Each connection is opened in URI mode=ro, tuned with cache_size/mmap_size and
+    keeps an LRU of prepared statements (sqlite3's cached_statements), so repeated
+    questions do not pay for opening the file and re-parsing the schema.
+    """
+
+    def __init__(self, database_file, size=None, timeout=None):
+        self.database_file = os.path.abspath(database_file)
+        self.size = size or config.DB_POOL_SIZE
+        self.timeout = timeout if timeout is not None else config.DB_POOL_TIMEOUT_SECONDS
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+
+    def _connect(self):
+        """Opens a new read-only connection."""
+        uri = f"file:{urllib.parse.quote(self.database_file)}?mode=ro"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            cached_statements=config.DB_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute(f"PRAGMA cache_size = -{int(config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        """Checks out a connection, opening a new one while the pool is below its size."""
+        created = False
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                    created = True
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("connection pool exhausted")
+                finally:
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_seconds += time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+        try:
+            for hook in _connection_hooks:
+                hook(conn, self.database_file, created)
+        except BaseException:
+            self.release(conn)
+            raise
+        return conn
+
+    def release(self, conn):
+        """Returns a connection to the pool."""
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """Returns a snapshot of the pool counters."""
+        with self._lock:
+            return {
+                "database": self.database_file,
+                "size": self.size,
+                "open": self._created,
+                "in_use": self._in_use,
+                "idle": self._created - self._in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 6),
+            }
+
+    def close(self):
+        """Closes every idle connection."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+_pools = {}
+_pools_lock = threading.Lock()
+_version_connections = {}
+
+def get_pool(database_file=None):
+    """Returns the shared pool for a database file, creating it on first use."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    with _pools_lock:
+        pool = _pools.get(database_file)
+        if pool is None:
+            enable_wal(database_file)
+            pool = ConnectionPool(database_file)
+            _pools[database_file] = pool
+        return pool
+
+def data_version(database_file=None):
+    """
+    Returns SQLite's data_version for a database, which changes whenever another
+    connection commits. The value is only comparable across calls because it is
+    always read on the same dedicated connection.
+    """
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    with _pools_lock:
+        conn = _version_connections.get(database_file)
+        if conn is None:
+            uri = f"file:{urllib.parse.quote(database_file)}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            _version_connections[database_file] = conn
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+def execute(sql_query, params=(), database_file=None):
+    """Executes a read-only query on a pooled connection and returns all rows."""
+    with get_pool(database_file).connection() as conn:
+        cur = conn.execute(sql_query, params)
+        try:
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+@contextmanager
+def _progress(conn, progress_handler):
+    """Installs a (callable, n) progress handler on a connection for the duration of a query."""
+    if progress_handler is None:
+        yield
+        return
+    conn.set_progress_handler(*progress_handler)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+def iter_chunks(sql_query, params=(), chunk_size=None, database_file=None, progress_handler=None):
+    """
+    Streams a query result in bounded chunks.
+
+    Yields (columns, rows) tuples with at most chunk_size native-typed rows each.
+    The pooled connection is held until the generator is exhausted or closed.
+    progress_handler is an optional (callable, n) pair passed to set_progress_handler;
+    the query is interrupted when the callable returns a true value.
+    """
+    chunk_size = chunk_size or config.RESULT_CHUNK_SIZE
+    with get_pool(database_file).connection() as conn, _progress(conn, progress_handler):
+        cur = conn.execute(sql_query, params)
+        try:
+            columns = [description[0] for description in cur.description or ()]
+            # The first chunk is always yielded, even when empty, so callers see the columns
+            rows = cur.fetchmany(chunk_size)
+            yield columns, rows
+            while len(rows) == chunk_size:
+                rows = cur.fetchmany(chunk_size)
+                if rows:
+                    yield columns, rows
+        finally:
+            cur.close()
+
+def fetch_bounded(sql_query, params=(), max_rows=None, max_bytes=None, chunk_size=None, database_file=None, progress_handler=None):
+    """Reads a query result chunk by chunk, stops at the row or byte cap and returns a result_set.ColumnarResult."""
+    max_rows = max_rows or config.RESULT_MAX_ROWS
+    max_bytes = max_bytes or config.RESULT_MAX_BYTES
+    columns = []
+    rows = []
+    size = 0
+    truncated = None
+    chunks = iter_chunks(sql_query, params, chunk_size, database_file, progress_handler)
+    try:
+        for columns, chunk in chunks:
+            for row in chunk:
+                if len(rows) >= max_rows:
+                    truncated = "rows"
+                    break
+                size += sum(map(value_size, row))
+                if size > max_bytes:
+                    truncated = "bytes"
+                    break
+                rows.append(row)
+            if truncated:
+                break
+    finally:
+        chunks.close()
+    return ColumnarResult.from_rows(columns, rows, truncated)
+
+def pool_stats():
+    """Returns the stats of every pool opened by this process."""
+    with _pools_lock:
+        return [pool.stats() for pool in _pools.values()]
+
+def pool_metrics():
+    """Yields the pool counters as (metric_name, labels, value) tuples for telemetry."""
+    for stats in pool_stats():
+        labels = {"database": stats["database"]}
+        for key in ("open", "in_use", "idle", "checkouts", "waits", "wait_seconds"):
+            yield f"corpquery_db_pool_{key}", labels, stats[key]
@@ -0,0 +1,364 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+from array import array
+import config
+from column_types import PYTHON_TYPES, declared_types, resolve_types
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# The compact typed binary format written when pyarrow is not installed:
+#   MAGIC, uint32 header length, UTF-8 JSON header {"columns": [...], "types": [...]},
+#   then per chunk a uint32 row count followed by every column as a null bitmap
+#   (bit i set = row i present), one encoding byte and the present values:
+#     INTEGER/REAL  an array typecode (b, h, i, q: the narrowest integer width that
+#                   fits the chunk; d: float64), then the values
+#     TEXT/BLOB     P: uint32 byte lengths, then the bytes
+#                   D: a dictionary of the chunk's distinct values (uint32 count,
+#                   lengths and bytes), then one index per value (B, H or I)
+#   A row count of 0 ends the file. All numbers are little-endian.
+MAGIC = b"TCOL\x01\n"
+
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".tcol": "binary"}
+MIME_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet", "binary": "application/octet-stream"}
+EXTENSIONS = {format_name: extension for extension, format_name in FORMATS.items()}
+
+_EXPORT_TYPES = {kind: python_type for python_type, kind in PYTHON_TYPES.items()}
+
+def columnar_format():
+    """Parquet when pyarrow is installed, the typed binary format otherwise."""
+    return "parquet" if pyarrow is not None else "binary"
+
+def format_for(path):
+    """Picks the format from a file extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown export format for {path}; use one of {', '.join(FORMATS)}")
+    return FORMATS[extension]
+
+def _observe(observed, rows):
+    for index, values in enumerate(zip(*rows)):
+        observed[index].update(map(type, values))
+
+def _coerce(kind, values):
+    """Converts one column's values to its export type; None stays None."""
+    if set(map(type, values)) <= {_EXPORT_TYPES[kind], type(None)}:
+        return list(values)
+    if kind == "REAL":
+        return [None if value is None else float(value) for value in values]
+    if kind == "TEXT":
+        return [value if value is None or isinstance(value, str) else value.hex() if isinstance(value, bytes) else str(value) for value in values]
+    return list(values)
+
+def _columns(rows, width):
+    return list(zip(*rows)) if rows else [()] * width
+
+def _whole_numbers(values):
+    """Writes whole REAL amounts without ".0" (9752, not 9752.0), as the CSVs always showed them; fractions stay exact."""
+    return [int(value) if value is not None and value.is_integer() else value for value in values]
+
+class _CSVWriter:
+    def __init__(self, out, columns, types):
+        self.text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+        self.types = types
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(columns)
+
+    def write(self, values, count):
+        coerced = []
+        for kind, column in zip(self.types, values):
+            column = _coerce(kind, column)
+            coerced.append(_whole_numbers(column) if kind == "REAL" else column)
+        self.writer.writerows(zip(*coerced))
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+
+def _narrowest(values, codes):
+    """Returns the first array typecode whose range holds every value."""
+    for code in codes:
+        bits = array(code).itemsize * 8
+        low, high = (0, 1 << bits) if code.isupper() else (-(1 << (bits - 1)), 1 << (bits - 1))
+        if not values or (low <= min(values) and max(values) < high):
+            return code
+    return codes[-1]
+
+def _pack(code, values):
+    data = array(code, values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+def _unpack(f, code, count):
+    data = array(code)
+    data.frombytes(f.read(count * data.itemsize))
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data
+
+class _BinaryWriter:
+    def __init__(self, out, columns, types):
+        self.out = out
+        self.types = types
+        header = json.dumps({"columns": list(columns), "types": list(types)}, ensure_ascii=False).encode("utf-8")
+        out.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def _write_values(self, kind, present):
+        write = self.out.write
+        if kind == "INTEGER":
+            code = _narrowest(present, "bhiq")
+            write(code.encode() + _pack(code, present))
+        elif kind == "REAL":
+            write(b"d" + _pack("d", present))
+        else:
+            encode = (lambda value: value.encode("utf-8")) if kind == "TEXT" else bytes
+            distinct = {}
+            indices = [distinct.setdefault(value, len(distinct)) for value in present]
+            # Categories, dates and codes repeat a lot within a chunk
+            if len(distinct) * 2 <= len(present):
+                code = _narrowest(indices, "BHI")
+                encoded = list(map(encode, distinct))
+                write(b"D" + struct.pack("<I", len(encoded)) + _pack("I", map(len, encoded)) + b"".join(encoded))
+                write(code.encode() + _pack(code, indices))
+            else:
+                encoded = list(map(encode, present))
+                write(b"P" + _pack("I", map(len, encoded)) + b"".join(encoded))
+
+    def write(self, values, count):
+        if not count:
+            return
+        self.out.write(struct.pack("<I", count))
+        for kind, values in zip(self.types, values):
+            present = [value for value in values if value is not None]
+            if len(present) == len(values):
+                bitmap = bytearray(b"\xff" * (len(values) // 8))
+                if len(values) % 8:
+                    bitmap.append((1 << (len(values) % 8)) - 1)
+            else:
+                bitmap = bytearray((len(values) + 7) // 8)
+                for index, value in enumerate(values):
+                    if value is not None:
+                        bitmap[index >> 3] |= 1 << (index & 7)
+            self.out.write(bytes(bitmap))
+            self._write_values(kind, _coerce(kind, present))
+
+    def close(self):
+        self.out.write(struct.pack("<I", 0))
+
+class _ParquetWriter:
+    _ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64", "TEXT": "string", "BLOB": "binary"}
+
+    def __init__(self, out, columns, types):
+        self.types = types
+        self.arrow_types = [getattr(pyarrow, self._ARROW_TYPES[kind])() for kind in types]
+        self.schema = pyarrow.schema(list(zip(columns, self.arrow_types)))
+        self.writer = pyarrow.parquet.ParquetWriter(out, self.schema)
+
+    def write(self, values, count):
+        if not count:
+            return
+        arrays = [
+            pyarrow.array(_coerce(kind, column), type=arrow_type)
+            for kind, arrow_type, column in zip(self.types, self.arrow_types, values)
+        ]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def check_format(format_name):
+    """Raises ValueError for formats this installation cannot write."""
+    if format_name not in EXTENSIONS:
+        raise ValueError(f"Unknown export format: {format_name}")
+    if format_name == "parquet" and pyarrow is None:
+        raise ValueError("Parquet export needs pyarrow; use the binary format (.tcol) instead")
+
+def _writer(format_name, out, columns, types):
+    check_format(format_name)
+    if format_name == "csv":
+        return _CSVWriter(out, columns, types)
+    if format_name == "binary":
+        return _BinaryWriter(out, columns, types)
+    return _ParquetWriter(out, columns, types)
+
+def write_chunks(out, format_name, columns, types, chunks):
+    """Writes chunks of rows to a binary file object; returns the number of rows."""
+    writer = _writer(format_name, out, columns, types)
+    count = 0
+    for rows in chunks:
+        writer.write(_columns(rows, len(columns)), len(rows))
+        count += len(rows)
+    writer.close()
+    return count
+
+def _cursor_chunks(conn, sql_query, params, chunk_size):
+    cur = conn.execute(sql_query, params)
+    try:
+        yield [description[0] for description in cur.description or ()]
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+class _TypesWidened(Exception):
+    """A chunk holds a wider storage class than the types the export started with."""
+
+def _checked_chunks(first, chunks, declared, observed, types):
+    if first:
+        yield first
+    for rows in chunks:
+        _observe(observed, rows)
+        if resolve_types(declared, observed) != types:
+            raise _TypesWidened()
+        yield rows
+
+def export_query(conn, sql_query, path, format_name=None, params=(), declared=None, table_name=None, chunk_size=None):
+    """
+    Streams a query result to a file in constant memory.
+
+    Column types are the declared ones widened by the values of the first chunk.
+    Should a later chunk hold a wider storage class (SQLite keeps REAL values in
+    INTEGER columns and text in numeric ones), the export starts over with the
+    widened types, so nothing is lost; usually the query runs once.
+
+    Args:
+        declared (list): Declared column types; looked up in schema.json by default.
+        table_name (str): Resolve declared types against this table only.
+
+    Returns:
+        int: The number of rows written.
+    """
+    format_name = format_name or format_for(path)
+    check_format(format_name)
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    observed = None
+    # Written to a unique file next to the target and renamed, so readers never see
+    # a partial file and concurrent exports of the same path do not collide
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", delete=False) as f:
+        temporary = f.name
+    try:
+        while True:
+            chunks = _cursor_chunks(conn, sql_query, params, chunk_size)
+            try:
+                columns = next(chunks)
+                if observed is None:
+                    declared = declared or declared_types(columns, table_name=table_name)
+                    observed = [set() for _ in columns]
+                first = next(chunks, [])
+                _observe(observed, first)
+                types = resolve_types(declared, observed)
+                with open(temporary, "wb") as out:
+                    count = write_chunks(out, format_name, columns, types, _checked_chunks(first, chunks, declared, observed, types))
+                break
+            except _TypesWidened:
+                print(f"Export of {path} found wider column types than its first chunk; restarting")
+            finally:
+                chunks.close()
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return count
+
+def export_table(conn, table_name, path, format_name=None, chunk_size=None):
+    """Streams a whole table to a file, typed by its schema.json columns; returns the number of rows."""
+    try:
+        count = export_query(conn, f'SELECT * FROM "{table_name}"', path, format_name, table_name=table_name, chunk_size=chunk_size)
+    except sqlite3.Error as e:
+        print(f"Error exporting {table_name}: {e}")
+        return 0
+    print(f"Exported {count} rows of {table_name} to {path}")
+    return count
+
+def export_result(results, format_name):
+    """Serializes a result_set.ColumnarResult (e.g. the result shown in the app) with its column types and returns the bytes."""
+    out = io.BytesIO()
+    writer = _writer(format_name, out, results.columns, results.types)
+    writer.write([results.column(index) for index in range(len(results.columns))], len(results))
+    writer.close()
+    return out.getvalue()
+
+def _read_strings(f, count, kind):
+    lengths = _unpack(f, "I", count)
+    strings = [f.read(length) for length in lengths]
+    return [value.decode("utf-8") for value in strings] if kind == "TEXT" else strings
+
+def _read_values(f, kind, count):
+    encoding = f.read(1).decode()
+    if encoding == "P":
+        return _read_strings(f, count, kind)
+    if encoding == "D":
+        dictionary = _read_strings(f, struct.unpack("<I", f.read(4))[0], kind)
+        return [dictionary[index] for index in _unpack(f, f.read(1).decode(), count)]
+    return _unpack(f, encoding, count).tolist()
+
+def iter_binary_chunks(path):
+    """
+    Reads a typed binary export.
+
+    Yields (columns, types, values) per chunk, where values holds one list per
+    column with None for NULL.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a typed binary export")
+        header = json.loads(f.read(struct.unpack("<I", f.read(4))[0]).decode("utf-8"))
+        columns, types = header["columns"], header["types"]
+        while True:
+            count = struct.unpack("<I", f.read(4))[0]
+            if count == 0:
+                return
+            values = []
+            for kind in types:
+                bitmap = f.read((count + 7) // 8)
+                mask = [bool(bitmap[index >> 3] & (1 << (index & 7))) for index in range(count)]
+                items = iter(_read_values(f, kind, sum(mask)))
+                values.append([next(items) if flag else None for flag in mask])
+            yield columns, types, values
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a table or query result to CSV, Parquet (with pyarrow) or the typed binary format (.tcol).")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--table", help="table to export")
+    source.add_argument("--query", help="read-only SQL to export; to_twd/from_twd are available")
+    parser.add_argument("--output", required=True, help="target file; the format follows the extension (.csv, .parquet, .tcol)")
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), help="override the format chosen by the extension")
+    parser.add_argument("--database", default=config.DATABASE_FILE)
+    parser.add_argument("--chunk-size", type=int, default=config.EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    # Imported here so create_db does not load the pool; currency registers to_twd/from_twd on its connections
+    import currency
+    import db_engine
+    try:
+        check_format(args.format or format_for(args.output))
+    except ValueError as e:
+        print(e)
+        return 2
+    start = time.perf_counter()
+    with db_engine.get_pool(args.database).connection() as conn:
+        if args.table:
+            count = export_query(conn, f'SELECT * FROM "{args.table}"', args.output, args.format, table_name=args.table, chunk_size=args.chunk_size)
+        else:
+            count = export_query(conn, args.query, args.output, args.format, chunk_size=args.chunk_size)
+    print(f"Exported {count} rows to {args.output} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from llm_backend import LLMBackend
+from sql_cache import normalize_question
+
+QUESTION_MARKER = "Generate a SQL query to answer the following question:"
+DESCRIPTION = "這是離線測試用的查詢結果說明。"
+
+class InjectedError(Exception):
+    """A failure injected by FakeLLM to exercise retries."""
+
+def extract_question(prompt):
+    """Recovers the user question from an assembled SQL prompt; the question always comes last."""
+    if QUESTION_MARKER in prompt:
+        return prompt.rsplit(QUESTION_MARKER, 1)[1].strip()
+    return prompt.strip()
+
+class FakeLLM(LLMBackend):
+    """
+    A local stand-in for the Gemini client, for benchmarks and offline runs.
+
+    generate_sql returns the golden or recorded SQL for the question found at the end
+    of the prompt (None for unknown questions, like a failed generation), and
+    generate_description returns a fixed text. Both sleep for a configurable latency.
+
+    For retry and hedging tests, error_rate of the calls fail (the sync methods
+    return None like the Gemini client, the async ones raise InjectedError) and
+    slow_rate of the calls take slow_latency extra seconds. generate_description_stream
+    yields the text in small chunks, the first after the description latency and
+    the rest chunk_latency apart.
+    """
+
+    def __init__(self, answers=None, sql_latency=0.0, description_latency=0.0, jitter=0.0, seed=None,
+                 error_rate=0.0, slow_rate=0.0, slow_latency=0.0, chunk_latency=0.0):
+        self.answers = {normalize_question(question): sql for question, sql in (answers or {}).items()}
+        self.sql_latency = sql_latency
+        self.description_latency = description_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.chunk_latency = chunk_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {"generate_sql": 0, "generate_description": 0}
+
+    @classmethod
+    def from_jsonl(cls, path, **kwargs):
+        """Loads golden or recorded answers from a JSONL file with "question" and "golden_sql"/"sql" fields."""
+        answers = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                sql_query = item.get("golden_sql") or item.get("sql")
+                if item.get("question") and sql_query:
+                    answers[item["question"]] = sql_query
+        return cls(answers, **kwargs)
+
+    def _plan(self, latency, name):
+        """Counts a call and draws its delay and whether it fails."""
+        with self._lock:
+            self.calls[name] += 1
+            delay = latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                delay += self.slow_latency
+            fail = bool(self.error_rate) and self._random.random() < self.error_rate
+        return delay, fail
+
+    def _answer(self, prompt):
+        return self.answers.get(normalize_question(extract_question(prompt)))
+
+    def generate_sql(self, prompt, temperature=0.0):
+        delay, fail = self._plan(self.sql_latency, "generate_sql")
+        if delay > 0:
+            time.sleep(delay)
+        return None if fail else self._answer(prompt)
+
+    def generate_description(self, prompt, temperature=0.0):
+        delay, fail = self._plan(self.description_latency, "generate_description")
+        if delay > 0:
+            time.sleep(delay)
+        return None if fail else DESCRIPTION
+
+    def generate_description_stream(self, prompt, temperature=0.0):
+        delay, fail = self._plan(self.description_latency, "generate_description")
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise InjectedError("injected generate_description failure")
+        for i in range(0, len(DESCRIPTION), 4):
+            if i and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield DESCRIPTION[i:i + 4]
+
+    async def generate_sql_async(self, prompt, temperature=0.0):
+        delay, fail = self._plan(self.sql_latency, "generate_sql")
+        await asyncio.sleep(delay)
+        if fail:
+            raise InjectedError("injected generate_sql failure")
+        return self._answer(prompt)
+
+    async def generate_description_async(self, prompt, temperature=0.0):
+        delay, fail = self._plan(self.description_latency, "generate_description")
+        await asyncio.sleep(delay)
+        if fail:
+            raise InjectedError("injected generate_description failure")
+        return DESCRIPTION
+
+class RecordingLLM(LLMBackend):
+    """Wraps a real client and appends every generated SQL to a JSONL file that FakeLLM.from_jsonl can replay."""
+
+    def __init__(self, llm, record_file):
+        self.llm = llm
+        self.record_file = record_file
+        self._lock = threading.Lock()
+
+    def generate_sql(self, prompt, temperature=0.0):
+        sql_query = self.llm.generate_sql(prompt, temperature)
+        if sql_query:
+            line = json.dumps({"question": extract_question(prompt), "sql": sql_query}, ensure_ascii=False)
+            with self._lock, open(self.record_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        return sql_query
+
+    def generate_description(self, prompt, temperature=0.0):
+        return self.llm.generate_description(prompt, temperature)
+
+    def generate_description_stream(self, prompt, temperature=0.0):
+        return self.llm.generate_description_stream(prompt, temperature)
+
+    def warm_up(self):
+        self.llm.warm_up()
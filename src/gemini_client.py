@@ -1,9 +1,9 @@
-import google.generativeai as genai
 import os
+import re
+import threading
 from dotenv import load_dotenv
-import datetime
 import config
-import re
+import llm_backend
 
 def add_spaces_around_keywords(sql_query):
     """Adds spaces around SQL keywords to prevent syntax errors."""
@@ -15,87 +15,160 @@ def add_spaces_around_keywords(sql_query):
 # Load environment variables from .env file
 load_dotenv()
 
-# Gemini API Key
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("Please set the GEMINI_API_KEY environment variable in the .env file.")
-    exit()
-
-def generate_sql(natural_language_query, schema_info, temperature=0.0):
-    """Generates SQL query using Gemini API."""
-    try:
-        schema = schema_info
-        prompt = config.SQL_TEMPLATE.format(schema=schema, question=natural_language_query, COMPANYKEY=config.COMPANYKEY)
-        print(f"Prompt: {prompt}")
-
-        # Configure the Gemini API
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        # Define safety settings to reduce restrictions
-        safety_settings = {
-            "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
-            "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
-            "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
-            "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE"
-        }
-
-        # Generate content using the Gemini API
-        response = model.generate_content(
+# Safety settings to reduce restrictions, built once instead of on every request
+SQL_SAFETY_SETTINGS = {
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
+    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
+    "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE"
+}
+DESCRIPTION_SAFETY_SETTINGS = {
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
+    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_MEDIUM_AND_ABOVE",
+    "HARM_CATEGORY_HARASSMENT": "BLOCK_MEDIUM_AND_ABOVE",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_MEDIUM_AND_ABOVE"
+}
+
+class GeminiBackend(llm_backend.LLMBackend):
+    """
+    A long-lived Gemini client.
+
+    google.generativeai is imported and configured on first use, and one
+    GenerativeModel is kept per model name and safety settings combination, so
+    requests reuse the SDK's transport (and its open connection) instead of
+    configuring and building a model every time.
+    """
+
+    def __init__(self, api_key=None, model_name=None):
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        self.model_name = model_name or config.GEMINI_MODEL
+        self._lock = threading.Lock()
+        self._genai = None
+        self._models = {}
+        self._warmed_up = False
+
+    def _client(self):
+        """Imports and configures the SDK once."""
+        if self._genai is None:
+            if not self.api_key:
+                raise RuntimeError("Please set the GEMINI_API_KEY environment variable in the .env file.")
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
+    def model(self, safety_settings):
+        """Returns the cached GenerativeModel for a safety settings combination."""
+        key = (self.model_name, tuple(sorted(safety_settings.items())))
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._client().GenerativeModel(self.model_name, safety_settings=safety_settings)
+                self._models[key] = model
+            return model
+
+    def warm_up(self):
+        """Builds both models ahead of the first question and, if GEMINI_WARM_UP_PING is set, opens the connection."""
+        if self._warmed_up:
+            return
+        self._warmed_up = True
+        try:
+            sql_model = self.model(SQL_SAFETY_SETTINGS)
+            self.model(DESCRIPTION_SAFETY_SETTINGS)
+            if config.GEMINI_WARM_UP_PING:
+                sql_model.count_tokens("ping")
+        except Exception as e:
+            print(f"Error warming up Gemini client: {e}")
+
+    def generate_sql(self, prompt, temperature=0.0):
+        """
+        Generates SQL query using Gemini API.
+        Args:
+            prompt (str): The complete prompt, as assembled by prompt_builder.build_sql_prompt.
+            temperature (float): The temperature for the Gemini API.
+        Returns:
+            str: The generated SQL query.
+        """
+        try:
+            print(f"Prompt: {prompt}")
+
+            # Generate content using the Gemini API
+            response = self.model(SQL_SAFETY_SETTINGS).generate_content(
+                prompt,
+                generation_config={"temperature": temperature}
+            )
+
+            # Extract the generated SQL query from the response
+            sql_query = response.text.strip()
+            # Add spaces around keywords
+            sql_query = add_spaces_around_keywords(sql_query)
+            return sql_query
+
+        except Exception as e:
+            error_message = f"Error generating SQL query: {e}"
+            print(error_message)
+            return None
+
+    async def generate_sql_async(self, prompt, temperature=0.0):
+        """Generates SQL with the SDK's async API; errors are raised so callers can retry."""
+        response = await self.model(SQL_SAFETY_SETTINGS).generate_content_async(
             prompt,
-            generation_config={"temperature": temperature},
-            safety_settings=safety_settings
+            generation_config={"temperature": temperature}
         )
+        return add_spaces_around_keywords(response.text.strip())
 
-        # Extract the generated SQL query from the response
-        sql_query = response.text.strip()
-        # Add spaces around keywords
-        sql_query = add_spaces_around_keywords(sql_query)
-        return sql_query
-
-    except Exception as e:
-        error_message = f"Error generating SQL query: {e}"
-        print(error_message)
-        return None
+    async def generate_description_async(self, prompt, temperature=0.0):
+        """Generates a description with the SDK's async API; errors are raised so callers can retry."""
+        response = await self.model(DESCRIPTION_SAFETY_SETTINGS).generate_content_async(
+            prompt,
+            generation_config={"temperature": temperature}
+        )
+        return response.text.strip()
 
-def generate_description(prompt, temperature=0.0):
-    """
-    Generates a conversational description using the Gemini API.
-    Args:
-        prompt (str): The prompt for the Gemini API.
-        temperature (float): The temperature for the Gemini API.
-    Returns:
-        str: The generated conversational description.
-    """
-    try:
-        # Configure the Gemini API
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        # Define safety settings to reduce restrictions
-        safety_settings = {
-            "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
-            "HARM_CATEGORY_HATE_SPEECH": "BLOCK_MEDIUM_AND_ABOVE",
-            "HARM_CATEGORY_HARASSMENT": "BLOCK_MEDIUM_AND_ABOVE",
-            "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_MEDIUM_AND_ABOVE"
-        }
-
-        # Generate content using the Gemini API
-        response = model.generate_content(
+    def generate_description_stream(self, prompt, temperature=0.0):
+        """Yields the description chunk by chunk as Gemini streams it; errors are raised."""
+        response = self.model(DESCRIPTION_SAFETY_SETTINGS).generate_content(
             prompt,
             generation_config={"temperature": temperature},
-            safety_settings=safety_settings
+            stream=True
         )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    def generate_description(self, prompt, temperature=0.0):
+        """
+        Generates a conversational description using the Gemini API.
+        Args:
+            prompt (str): The prompt for the Gemini API.
+            temperature (float): The temperature for the Gemini API.
+        Returns:
+            str: The generated conversational description.
+        """
+        try:
+            # Generate content using the Gemini API
+            response = self.model(DESCRIPTION_SAFETY_SETTINGS).generate_content(
+                prompt,
+                generation_config={"temperature": temperature}
+            )
+
+            # Extract the generated conversational description from the response
+            description = response.text.strip()
+
+            return description
+
+        except Exception as e:
+            error_message = f"Error generating conversational description: {e}"
+            print(error_message)
+            return None
+
+def generate_sql(prompt, temperature=0.0):
+    """Generates SQL with the process-wide backend."""
+    return llm_backend.get_backend().generate_sql(prompt, temperature)
 
-        # Extract the generated conversational description from the response
-        description = response.text.strip()
-
-        return description
-
-    except Exception as e:
-        error_message = f"Error generating conversational description: {e}"
-        print(error_message)
-        return None
+def generate_description(prompt, temperature=0.0):
+    """Generates a conversational description with the process-wide backend."""
+    return llm_backend.get_backend().generate_description(prompt, temperature)
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    pass
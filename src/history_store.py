@@ -0,0 +1,125 @@
+import datetime
+import json
+import os
+import sqlite3
+from collections import namedtuple
+import config
+
+HistoryEntry = namedtuple("HistoryEntry", ["id", "question", "response", "sql_query", "created_at"])
+
+def _connect():
+    """Opens the history database and creates its tables if needed."""
+    conn = sqlite3.connect(config.HISTORY_DB_FILE, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_key TEXT NOT NULL,
+            question TEXT,
+            response TEXT,
+            sql_query TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    # Pages are read newest first per company; the rowid in the index breaks timestamp ties
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_company_created ON history (company_key, created_at)")
+    conn.execute("CREATE TABLE IF NOT EXISTS history_meta (name TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+def append(company_key, question, response, sql_query=None, created_at=None):
+    """Appends one question/answer pair and returns its id."""
+    created_at = created_at or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = _connect()
+    try:
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO history (company_key, question, response, sql_query, created_at) VALUES (?, ?, ?, ?, ?)",
+                (str(company_key), question, response, sql_query, created_at),
+            )
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+def load_page(company_key, before=None, limit=None):
+    """
+    Loads one page of history, newest first.
+
+    Args:
+        company_key (str): Only this company's history is returned.
+        before (HistoryEntry): The last entry of the previous page, or None for the first page.
+        limit (int): Page size, HISTORY_PAGE_SIZE by default.
+
+    Returns:
+        list: HistoryEntry tuples.
+    """
+    limit = limit or config.HISTORY_PAGE_SIZE
+    conn = _connect()
+    try:
+        if before is None:
+            rows = conn.execute(
+                "SELECT id, question, response, sql_query, created_at FROM history "
+                "WHERE company_key = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (str(company_key), limit),
+            ).fetchall()
+        else:
+            # Keyset pagination: continue strictly after the last entry shown
+            rows = conn.execute(
+                "SELECT id, question, response, sql_query, created_at FROM history "
+                "WHERE company_key = ? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?",
+                (str(company_key), before.created_at, before.id, limit),
+            ).fetchall()
+    finally:
+        conn.close()
+    return [HistoryEntry(*row) for row in rows]
+
+def delete(company_key, entry_id):
+    """Deletes one entry by id; returns whether it existed."""
+    conn = _connect()
+    try:
+        with conn:
+            cur = conn.execute("DELETE FROM history WHERE id = ? AND company_key = ?", (entry_id, str(company_key)))
+        return cur.rowcount > 0
+    finally:
+        conn.close()
+
+def count(company_key):
+    """Returns how many entries a company has."""
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM history WHERE company_key = ?", (str(company_key),)).fetchone()[0]
+    finally:
+        conn.close()
+
+def import_memory_file(memory_file, company_key):
+    """
+    Imports the legacy memory.txt (a JSON list of [question, response(, timestamp)])
+    once; later calls do nothing. Returns the number of imported entries.
+    """
+    marker = "imported:" + os.path.abspath(memory_file)
+    conn = _connect()
+    try:
+        if conn.execute("SELECT 1 FROM history_meta WHERE name = ?", (marker,)).fetchone():
+            return 0
+        try:
+            with open(memory_file, "r") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            items = []
+        except json.JSONDecodeError as e:
+            print(f"Error reading {memory_file}: {e}")
+            return 0
+        rows = []
+        for item in items:
+            question, response = item[0], item[1]
+            # Entries without a timestamp sort before every timestamped one
+            timestamp = item[2] if len(item) > 2 and item[2] != "N/A" else ""
+            rows.append((str(company_key), question, response, None, timestamp))
+        with conn:
+            conn.executemany(
+                "INSERT INTO history (company_key, question, response, sql_query, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("INSERT INTO history_meta (name, value) VALUES (?, ?)", (marker, str(len(rows))))
+        return len(rows)
+    finally:
+        conn.close()
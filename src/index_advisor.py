@@ -0,0 +1,424 @@
+import argparse
+import atexit
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import config
+import db_engine
+
+TENANT_COLUMN = "公司金鑰"
+
+# FROM/JOIN <table> [AS] <alias>, used to map plan aliases back to tables
+# (comma joins are matched too; they only fill in names FROM/JOIN did not define)
+_KEYWORDS = r"(?:SELECT|FROM|WHERE|JOIN|ON|GROUP|ORDER|LIMIT|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|UNION|HAVING|USING|AS)\b"
+_TABLE_REF = re.compile(
+    r"(\bFROM|\bJOIN|,)\s*([^\s(),;]+)(?:\s+(?:AS\s+)?(?!" + _KEYWORDS + r")([^\s(),;]+))?",
+    re.IGNORECASE,
+)
+_SCAN = re.compile(r"^SCAN (\S+)$")
+_EQUALITY = r"\s*(?:==?|IN\s*\(|IS\s+(?!NOT\b))"
+_RANGE = r"\s*(?:>=|<=|>|<|BETWEEN\b|LIKE\b)"
+
+# Tenant-first composite indexes: every generated query filters on 公司金鑰 and
+# usually on a date or currency, so 公司金鑰 leads and the range column comes last.
+# 匯率資料表 and 帳戶餘額表 are already covered by their (公司金鑰, ...) primary keys.
+INDEXES = {
+    "idx_交易明細_公司金鑰_交易日期": "交易明細 (公司金鑰, 交易日期)",
+    "idx_交易明細_公司金鑰_幣別_交易日期": "交易明細 (公司金鑰, 幣別, 交易日期)",
+    "idx_交易明細_公司金鑰_帳戶_交易日期": "交易明細 (公司金鑰, 帳戶, 交易日期)",
+    "idx_交易明細_公司金鑰_費用類型_交易日期": "交易明細 (公司金鑰, 費用類型, 交易日期)",
+    "idx_員工薪資_公司金鑰_薪資日期": "員工薪資 (公司金鑰, 薪資日期)",
+    "idx_員工薪資_公司金鑰_部門": "員工薪資 (公司金鑰, 部門)",
+    "idx_員工薪資_公司金鑰_員工姓名": "員工薪資 (公司金鑰, 員工姓名)",
+    "idx_部門資訊_公司金鑰_部門名稱": "部門資訊 (公司金鑰, 部門名稱)",
+}
+
+_lock = threading.Lock()
+_analyzed = OrderedDict()   # query hash -> (full_scans, suggestions), least recently used first; at most INDEX_ADVISOR_MAX_QUERIES
+_table_columns = {}   # database file -> {table: [columns]}
+_ensured = set()   # database files checked by ensure()
+_pending = []   # observations waiting for the next flush
+_flush_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+def _connect():
+    """Opens the advisor log and creates its tables if needed."""
+    conn = sqlite3.connect(config.INDEX_ADVISOR_FILE, timeout=5)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS query_log (
+            query_hash TEXT PRIMARY KEY,
+            database_file TEXT,
+            sql_query TEXT,
+            query_plan TEXT,
+            full_scans TEXT,
+            executions INTEGER DEFAULT 0,
+            total_seconds REAL DEFAULT 0,
+            first_seen REAL,
+            last_seen REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS index_suggestions (
+            database_file TEXT,
+            table_name TEXT,
+            columns TEXT,
+            occurrences INTEGER DEFAULT 0,
+            last_seen REAL,
+            created_at REAL,
+            PRIMARY KEY (database_file, table_name, columns)
+        )
+    """)
+    return conn
+
+def _query_hash(sql_query, database_file):
+    payload = database_file + "\x1f" + " ".join(sql_query.split())
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def table_columns(database_file=None):
+    """Returns {table: [columns]} for a database, cached until an index is created."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    with _lock:
+        cached = _table_columns.get(database_file)
+    if cached is not None:
+        return cached
+    with db_engine.get_pool(database_file).connection() as conn:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        columns = {table: [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')] for table in tables}
+    with _lock:
+        _table_columns[database_file] = columns
+    return columns
+
+def existing_indexes(table, database_file=None):
+    """Returns the column lists of the indexes on a table, including primary key indexes."""
+    with db_engine.get_pool(database_file).connection() as conn:
+        names = [row[1] for row in conn.execute(f'PRAGMA index_list("{table}")')]
+        return [[row[2] for row in conn.execute(f'PRAGMA index_info("{name}")')] for name in names]
+
+def explain(sql_query, database_file=None):
+    """Returns the EXPLAIN QUERY PLAN detail lines of a query."""
+    with db_engine.get_pool(database_file).connection() as conn:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql_query.strip().rstrip(";"))]
+
+def table_aliases(sql_query):
+    """Maps the table names and aliases used in a query to table names."""
+    aliases = {}
+    comma_refs = []
+    for keyword, table, alias in _TABLE_REF.findall(sql_query):
+        refs = [(table.strip('"`[]'), table.strip('"`[]'))]
+        if alias:
+            refs.append((alias.strip('"`[]'), table.strip('"`[]')))
+        if keyword == ",":
+            comma_refs.extend(refs)
+        else:
+            aliases.update(refs)
+    for name, table in comma_refs:
+        aliases.setdefault(name, table)
+    return aliases
+
+def full_scans(plan, sql_query, tables):
+    """Returns the real tables that the plan reads with a full-table SCAN (no index), once per SCAN step."""
+    aliases = table_aliases(sql_query)
+    scanned = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if not match:
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        if table in tables:
+            scanned.append(table)
+    return scanned
+
+def _predicates(sql_query, table, columns, aliases):
+    """Finds the equality and range columns of a table in the query's predicates."""
+    equality = []
+    ranges = []
+    for column in columns:
+        for kind, operator in ((equality, _EQUALITY), (ranges, _RANGE)):
+            pattern = r"(?:([^\s().,=<>]+)\.)?(?<![\w])" + re.escape(column) + operator
+            for qualifier in re.findall(pattern, sql_query, flags=re.IGNORECASE):
+                # A qualified column only counts for the table its alias points to
+                if qualifier and aliases.get(qualifier) != table:
+                    continue
+                if column not in kind:
+                    kind.append(column)
+    return equality, [column for column in ranges if column not in equality]
+
+def suggest_index(sql_query, table, columns, existing=()):
+    """
+    Suggests a tenant-first index for a scanned table.
+
+    Returns:
+        tuple: the index columns (公司金鑰, other equality columns, then one range column),
+               or None when there is no usable predicate or an index already starts with them.
+    """
+    equality, ranges = _predicates(sql_query, table, columns, table_aliases(sql_query))
+    if TENANT_COLUMN in equality:
+        equality.remove(TENANT_COLUMN)
+        equality.insert(0, TENANT_COLUMN)
+    suggestion = tuple(equality + ranges[:1])
+    if not suggestion:
+        return None
+    if any(tuple(index[:len(suggestion)]) == suggestion for index in existing):
+        return None
+    return suggestion
+
+def index_name(table, columns):
+    return "idx_advisor_" + "_".join((table,) + tuple(columns))
+
+def index_ddl(table, columns):
+    """Returns the CREATE INDEX statement for a suggestion."""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    return f'CREATE INDEX IF NOT EXISTS "{index_name(table, columns)}" ON "{table}" ({column_list})'
+
+def analyze(sql_query, database_file=None, plan=None):
+    """
+    Explains a query (unless its plan is given) and derives index suggestions for
+    its full-table scans.
+
+    Returns:
+        tuple: (plan lines, scanned tables, [(table, columns), ...])
+    """
+    tables = table_columns(database_file)
+    if plan is None:
+        plan = explain(sql_query, database_file)
+    scanned = list(dict.fromkeys(full_scans(plan, sql_query, tables)))
+    suggestions = []
+    for table in scanned:
+        columns = suggest_index(sql_query, table, tables[table], existing_indexes(table, database_file))
+        if columns:
+            suggestions.append((table, columns))
+    return plan, scanned, suggestions
+
+def observe(sql_query, seconds, database_file=None, plan=None):
+    """
+    Records an executed query and, the first time it is seen, its plan (explained
+    here unless given, e.g. by query_guard) and full-table scans.
+
+    The log is written by flush() on a background thread, every
+    INDEX_ADVISOR_FLUSH_SECONDS or once INDEX_ADVISOR_FLUSH_ROWS observations are
+    waiting, and at shutdown. When INDEX_ADVISOR_AUTO_CREATE is set, a suggested
+    index is created during a flush once its access pattern has been seen
+    INDEX_ADVISOR_MIN_COUNT times.
+
+    Returns:
+        list: the tables the query scans without an index.
+    """
+    global _flusher
+    if not config.INDEX_ADVISOR_ENABLED:
+        return []
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    query_hash = _query_hash(sql_query, database_file)
+    with _lock:
+        known = _analyzed.get(query_hash)
+        if known is not None:
+            _analyzed.move_to_end(query_hash)
+    if known is None:
+        plan, scanned, suggestions = analyze(sql_query, database_file, plan)
+        for table, columns in suggestions:
+            print(f"Full table scan on {table}; suggested index: {index_ddl(table, columns)}")
+        with _lock:
+            _analyzed[query_hash] = (scanned, suggestions)
+            while len(_analyzed) > config.INDEX_ADVISOR_MAX_QUERIES:
+                _analyzed.popitem(last=False)
+    else:
+        plan = None
+        scanned, suggestions = known
+
+    with _lock:
+        _pending.append((query_hash, database_file, sql_query, plan, scanned, suggestions, seconds, time.time()))
+        waiting = len(_pending)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="index-advisor-flush", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+    if waiting >= config.INDEX_ADVISOR_FLUSH_ROWS:
+        _wakeup.set()
+    return scanned
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(config.INDEX_ADVISOR_FLUSH_SECONDS)
+        _wakeup.clear()
+        flush()
+
+def flush():
+    """Writes the buffered observations to the advisor log in one transaction and creates due indexes."""
+    with _flush_lock:
+        with _lock:
+            batch = _pending[:]
+            del _pending[:]
+        if not batch:
+            return
+        queries = {}
+        patterns = {}
+        for query_hash, database_file, sql_query, plan, scanned, suggestions, seconds, seen in batch:
+            entry = queries.get(query_hash)
+            if entry is None:
+                queries[query_hash] = [database_file, sql_query, plan, scanned, 1, seconds, seen, seen]
+            else:
+                entry[2] = entry[2] or plan
+                entry[3] = scanned
+                entry[4] += 1
+                entry[5] += seconds
+                entry[7] = seen
+            for table, columns in suggestions:
+                key = (database_file, table, ",".join(columns))
+                count, _ = patterns.get(key, (0, seen))
+                patterns[key] = (count + 1, seen)
+
+        to_create = {}
+        conn = None
+        try:
+            conn = _connect()
+            conn.executemany(
+                "INSERT INTO query_log (query_hash, database_file, sql_query, query_plan, full_scans, executions, total_seconds, first_seen, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(query_hash) DO UPDATE SET executions = executions + excluded.executions, "
+                "total_seconds = total_seconds + excluded.total_seconds, last_seen = excluded.last_seen, "
+                "query_plan = COALESCE(excluded.query_plan, query_plan), full_scans = excluded.full_scans",
+                [
+                    (query_hash, database_file, sql_query, "\n".join(plan) if plan is not None else None, ",".join(scanned), executions, total_seconds, first_seen, last_seen)
+                    for query_hash, (database_file, sql_query, plan, scanned, executions, total_seconds, first_seen, last_seen) in queries.items()
+                ],
+            )
+            for (database_file, table, columns), (count, seen) in patterns.items():
+                row = conn.execute(
+                    "INSERT INTO index_suggestions (database_file, table_name, columns, occurrences, last_seen) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(database_file, table_name, columns) DO UPDATE SET occurrences = occurrences + excluded.occurrences, last_seen = excluded.last_seen "
+                    "RETURNING occurrences, created_at",
+                    (database_file, table, columns, count, seen),
+                ).fetchone()
+                if config.INDEX_ADVISOR_AUTO_CREATE and row[1] is None and row[0] >= config.INDEX_ADVISOR_MIN_COUNT:
+                    to_create.setdefault(database_file, []).append((table, tuple(columns.split(","))))
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing index advisor log: {e}")
+        finally:
+            if conn:
+                conn.close()
+
+        for database_file, pending in to_create.items():
+            create_indexes(pending, database_file)
+
+def suggestions(min_count=None, database_file=None):
+    """Returns the pending suggestions seen at least min_count times, most frequent first."""
+    flush()
+    min_count = config.INDEX_ADVISOR_MIN_COUNT if min_count is None else min_count
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT table_name, columns, occurrences FROM index_suggestions "
+            "WHERE database_file = ? AND created_at IS NULL AND occurrences >= ? ORDER BY occurrences DESC",
+            (database_file, min_count),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(table, tuple(columns.split(",")), occurrences) for table, columns, occurrences in rows]
+
+def create_indexes(pending, database_file=None):
+    """Creates suggested indexes on a read-write connection and refreshes the planner statistics."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    created = []
+    conn = None
+    try:
+        conn = sqlite3.connect(database_file, timeout=30)
+        for table, columns in pending:
+            ddl = index_ddl(table, columns)
+            print(f"Creating index: {ddl}")
+            conn.execute(ddl)
+            created.append((table, columns))
+        conn.execute("ANALYZE")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error creating indexes: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+    if created:
+        log = _connect()
+        try:
+            log.executemany(
+                "UPDATE index_suggestions SET created_at = ? WHERE database_file = ? AND table_name = ? AND columns = ?",
+                [(time.time(), database_file, table, ",".join(columns)) for table, columns in created],
+            )
+            log.commit()
+        finally:
+            log.close()
+        # Plans change with the new indexes, so every query is explained again
+        with _lock:
+            _analyzed.clear()
+            _table_columns.pop(database_file, None)
+    return created
+
+def ensure(database_file=None):
+    """Creates the recommended INDEXES an existing database lacks; checked once per process and file."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    if database_file in _ensured:
+        return
+    with _lock:
+        if database_file in _ensured or not os.path.exists(database_file):
+            return
+        _ensured.add(database_file)
+    created = []
+    conn = None
+    try:
+        conn = sqlite3.connect(database_file, timeout=30)
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        for name, definition in INDEXES.items():
+            if name not in existing:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON {definition}')
+                created.append(name)
+        if created:
+            conn.execute("ANALYZE")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error creating indexes in {database_file}: {e}")
+    finally:
+        if conn:
+            conn.close()
+    if created:
+        print(f"Created indexes in {database_file}: {', '.join(created)}")
+        with _lock:
+            _analyzed.clear()
+            _table_columns.pop(database_file, None)
+
+def scan_report(database_file=None, limit=20):
+    """Returns the logged queries with full-table scans, by total time spent."""
+    flush()
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    conn = _connect()
+    try:
+        return conn.execute(
+            "SELECT sql_query, full_scans, executions, total_seconds FROM query_log "
+            "WHERE database_file = ? AND full_scans != '' ORDER BY total_seconds DESC LIMIT ?",
+            (database_file, limit),
+        ).fetchall()
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports full-table scans seen by the app and suggests tenant-first indexes.")
+    parser.add_argument("--database", default=config.DATABASE_FILE)
+    parser.add_argument("--min-count", type=int, default=config.INDEX_ADVISOR_MIN_COUNT, help="only suggest patterns seen this often")
+    parser.add_argument("--create", action="store_true", help="create the suggested indexes")
+    args = parser.parse_args(argv)
+
+    print("Queries with full table scans:")
+    for sql_query, scanned, executions, total_seconds in scan_report(args.database):
+        print(f"  [{scanned}] {executions}x, {total_seconds * 1000:.1f} ms total: {sql_query}")
+    pending = suggestions(args.min_count, args.database)
+    print("Suggested indexes:")
+    for table, columns, occurrences in pending:
+        print(f"  {occurrences}x {index_ddl(table, columns)};")
+    if args.create and pending:
+        create_indexes([(table, columns) for table, columns, _ in pending], args.database)
+
+if __name__ == "__main__":
+    main()
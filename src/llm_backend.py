@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import config
+
+class LLMBackend:
+    """
+    The interface the pipeline talks to.
+
+    generate_sql and generate_description return the generated text, or None when
+    generation failed. The *_async variants raise on failure instead, so that
+    async_llm.AsyncLLM can retry them; by default they run the synchronous method
+    in a worker thread and raise when it returns None. warm_up prepares clients
+    ahead of the first request.
+    """
+
+    def generate_sql(self, prompt, temperature=0.0):
+        raise NotImplementedError
+
+    def generate_description(self, prompt, temperature=0.0):
+        raise NotImplementedError
+
+    async def generate_sql_async(self, prompt, temperature=0.0):
+        sql_query = await asyncio.to_thread(self.generate_sql, prompt, temperature)
+        if sql_query is None:
+            raise RuntimeError("SQL generation failed")
+        return sql_query
+
+    async def generate_description_async(self, prompt, temperature=0.0):
+        description = await asyncio.to_thread(self.generate_description, prompt, temperature)
+        if description is None:
+            raise RuntimeError("description generation failed")
+        return description
+
+    def generate_description_stream(self, prompt, temperature=0.0):
+        """
+        Yields the description in chunks as the model produces them and raises on
+        failure. Backends without streaming yield the whole text at once.
+        """
+        description = self.generate_description(prompt, temperature)
+        if description is None:
+            raise RuntimeError("description generation failed")
+        yield description
+
+    def warm_up(self):
+        pass
+
+_lock = threading.Lock()
+_backend = None
+
+def get_backend():
+    """
+    Returns the process-wide backend, creating the Gemini backend on first use.
+    With LLM_RESILIENT it is wrapped in async_llm's rate limiting, retries and hedging.
+    """
+    global _backend
+    with _lock:
+        if _backend is None:
+            # Imported here so offline tools never load the Gemini SDK
+            from gemini_client import GeminiBackend
+            _backend = GeminiBackend()
+            if config.LLM_RESILIENT:
+                from async_llm import AsyncLLM, ResilientBackend
+                _backend = ResilientBackend(AsyncLLM(_backend))
+        return _backend
+
+def set_backend(backend):
+    """Replaces the process-wide backend, e.g. with fake_llm.FakeLLM in tests and benchmarks."""
+    global _backend
+    with _lock:
+        _backend = backend
+
+def warm_up():
+    """Warms up the process-wide backend."""
+    get_backend().warm_up()
@@ -0,0 +1,377 @@
+import asyncio
+import datetime
+import re
+import sqlite3
+import time
+import config
+import currency  # registers to_twd/from_twd on every pool connection
+import db_engine
+import index_advisor
+import llm_backend
+import prompt_builder
+import query_guard
+import result_cache
+import result_summary
+import schema_index
+import single_flight
+import sql_cache
+import telemetry
+
+NO_RESULTS = "The SQL query returned no results."
+
+# Concurrent identical requests share one LLM call / query instead of each making their own
+_sql_flight = single_flight.SingleFlight("generate_sql")
+_query_flight = single_flight.SingleFlight("query_database")
+_description_flight = single_flight.SingleFlight("generate_description")
+
+# Security Exception
+class SecurityException(Exception):
+    pass
+
+def filter_user_input(user_input):
+    banned_phrases = ["忽略", "刪除", "其他公司", "ignore", "delete", "other companies"]
+    if any(phrase in user_input for phrase in banned_phrases):
+        raise SecurityException("檢測到危險指令")
+
+def default_llm():
+    """Returns the process-wide LLM backend (Gemini unless llm_backend.set_backend replaced it)."""
+    return llm_backend.get_backend()
+
+def postprocess_sql(sql_query, natural_language_query):
+    """Cleans up the generated SQL and enforces the 公司金鑰 condition."""
+    # Remove "```sql" from the beginning of the query
+    sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+    sql_query = sql_query.replace("\n", "")
+
+    # Add spaces around FROM and WHERE
+    sql_query = sql_query.replace("FROM", " FROM ").replace("WHERE", " WHERE ")
+
+    # Enforce 公司金鑰 condition
+    company_key = config.COMPANYKEY
+    # Enforce 公司金鑰 condition
+    sql_query = re.sub(r"公司金鑰\s*=\s*(\".*?\"|'.*?')", f"公司金鑰 = '{company_key}'", sql_query, flags=re.IGNORECASE)
+    if "WHERE" not in sql_query.upper():
+        sql_query = f"SELECT * FROM ({sql_query}) WHERE 公司金鑰 = '{company_key}'"
+
+    # Extract employee number from the natural language query
+    match = re.search(r"員工(\d+)", natural_language_query)
+    if match:
+        employee_number = match.group(1)
+        employee_name = f"員工 {employee_number}"
+        # Replace the incorrect employee name in the SQL query with the correct one
+        sql_query = sql_query.replace("'員工姓名'", f"'{employee_name}'")
+    return sql_query
+
+def sql_cache_key(natural_language_query, schema_info):
+    """Returns the NL-to-SQL cache key for a question."""
+    return sql_cache.make_key(natural_language_query, schema_info, config.SQL_TEMPLATE + config.SQL_INSTRUCTIONS, config.COMPANYKEY)
+
+def cached_sql(natural_language_query, schema_info, trace_id=None):
+    """Returns the cached post-processed SQL for a question, or None."""
+    with telemetry.span("sql_cache_lookup", trace_id) as span:
+        sql_query = sql_cache.get(sql_cache_key(natural_language_query, schema_info))
+        span.set(cache_hit=sql_query is not None)
+    if sql_query is not None:
+        print(f"SQL cache hit: {sql_query}")
+    return sql_query
+
+def build_sql_prompt(natural_language_query, schema_info, exchange_rates, trace_id=None):
+    """Builds the NL-to-SQL prompt from the tables relevant to the question."""
+    with telemetry.span("prompt_build", trace_id) as span:
+        # Only the tables relevant to the question (and their join neighbours) go into the prompt
+        relevant_schema = schema_index.prune_schema(natural_language_query, schema_info)
+        # Conversions go through to_twd/from_twd, so the static rates are not needed in the prompt
+        if not config.PROMPT_INCLUDE_EXCHANGE_RATES:
+            exchange_rates = None
+        prompt = prompt_builder.build_sql_prompt(natural_language_query, relevant_schema, exchange_rates)
+        span.set(tables=len(relevant_schema), prompt_chars=len(prompt.text), prompt_tokens=prompt.total_tokens)
+    print(prompt_builder.format_accounting(prompt))
+    return prompt
+
+def get_sql(natural_language_query, schema_info, exchange_rates, llm=None, trace_id=None, use_cache=True):
+    """
+    Returns the post-processed SQL for a question, from the cache or from the LLM.
+
+    Returns:
+        tuple: (sql_query or None, cache_hit)
+    """
+    if use_cache:
+        # Look up the post-processed SQL in the cache before calling the LLM
+        sql_query = cached_sql(natural_language_query, schema_info, trace_id)
+        if sql_query is not None:
+            return sql_query, True
+
+    llm = llm or default_llm()
+    prompt = build_sql_prompt(natural_language_query, schema_info, exchange_rates, trace_id)
+    with telemetry.span("generate_sql", trace_id, prompt_chars=len(prompt.text), cache_hit=False) as span:
+        # Keyed like the SQL cache: the normalized question, schema, template and company key
+        sql_query, coalesced = _sql_flight.do(sql_cache_key(natural_language_query, schema_info), llm.generate_sql, prompt.text)
+        span.set(ok=sql_query is not None, coalesced=coalesced)
+    if sql_query:
+        with telemetry.span("sql_postprocess", trace_id):
+            sql_query = postprocess_sql(sql_query, natural_language_query)
+    return sql_query, False
+
+async def get_sql_async(natural_language_query, schema_info, exchange_rates, llm=None, trace_id=None, use_cache=True):
+    """get_sql for event loops: the LLM call is awaited instead of blocking a thread."""
+    if use_cache:
+        sql_query = await asyncio.to_thread(cached_sql, natural_language_query, schema_info, trace_id)
+        if sql_query is not None:
+            return sql_query, True
+
+    llm = llm or default_llm()
+    prompt = build_sql_prompt(natural_language_query, schema_info, exchange_rates, trace_id)
+    with telemetry.span("generate_sql", trace_id, prompt_chars=len(prompt.text), cache_hit=False) as span:
+        coalesced = False
+        try:
+            sql_query, coalesced = await _sql_flight.do_async(sql_cache_key(natural_language_query, schema_info), llm.generate_sql_async, prompt.text)
+        except Exception as e:
+            print(f"Error generating SQL query: {e}")
+            sql_query = None
+        span.set(ok=sql_query is not None, coalesced=coalesced)
+    if sql_query:
+        with telemetry.span("sql_postprocess", trace_id):
+            sql_query = postprocess_sql(sql_query, natural_language_query)
+    return sql_query, False
+
+def remember_sql(natural_language_query, schema_info, sql_query):
+    """Caches SQL that executed successfully."""
+    sql_cache.put(sql_cache_key(natural_language_query, schema_info), natural_language_query, sql_query)
+
+def run_query(sql_query, database_file=None, trace_id=None, cache_hit=False):
+    """
+    Executes the SQL under the query guard, streaming at most RESULT_MAX_ROWS/RESULT_MAX_BYTES
+    of native-typed rows. Identical SQL is answered from the result cache until the
+    database changes.
+
+    Raises:
+        sqlite3.Error: also query_guard.QueryBudgetExceeded when the plan or time budget is hit.
+    """
+    print(f"Executing SQL query: {sql_query}")
+    with telemetry.span("query_database", trace_id, sql_chars=len(sql_query), cache_hit=cache_hit) as span:
+        key = result_cache.make_key(sql_query, config.COMPANYKEY, database_file)
+        version = db_engine.data_version(database_file)
+        results = result_cache.get(key, version)
+        span.set(result_cache_hit=results is not None)
+        if results is not None:
+            span.set(row_count=len(results), truncated=results.truncated)
+            return results
+        try:
+            (results, plan), coalesced = _query_flight.do(key, query_guard.fetch, sql_query, (), database_file)
+        except query_guard.QueryBudgetExceeded as e:
+            span.set(budget=e.budget)
+            rejected = e
+        else:
+            rejected = None
+            span.set(row_count=len(results), truncated=results.truncated, coalesced=coalesced)
+            if not coalesced:
+                result_cache.put(key, results, version)
+    if rejected is not None:
+        # Rejected plans are exactly the scans the advisor should see
+        if rejected.plan is not None:
+            observe_query(sql_query, 0.0, database_file, trace_id, rejected.plan)
+        raise rejected
+    observe_query(sql_query, span.duration, database_file, trace_id, plan)
+    return results
+
+def observe_query(sql_query, seconds, database_file=None, trace_id=None, plan=None):
+    """Records a query with the index advisor; advisor errors are printed, never raised."""
+    with telemetry.span("index_advisor", trace_id) as advisor_span:
+        try:
+            scanned = index_advisor.observe(sql_query, seconds, database_file, plan)
+            advisor_span.set(full_scans=",".join(scanned))
+        except sqlite3.Error as e:
+            # The advisor must never fail a query that already succeeded
+            print(f"Error running index advisor: {e}")
+
+def build_description_prompt(natural_language_query, results, trace_id=None):
+    """
+    Prepares the description step.
+
+    Returns:
+        tuple: (description_prompt, template_description). Scalar and single-row results
+               get a template description and no prompt; otherwise only a local digest
+               and a small sample go into the prompt, never the raw rows. Results that
+               are entirely NULL are explained like empty ones.
+    """
+    with telemetry.span("description_prompt_build", trace_id) as span:
+        if results is not None and len(results) and not result_summary.all_null(results):
+            description = result_summary.template_description(natural_language_query, results)
+            if description is not None:
+                span.set(prompt_chars=0, template=True)
+                return None, description
+            digest = result_summary.summarize(results)
+            results_string = result_summary.format_digest(digest, results.truncated)
+        else:
+            results_string = NO_RESULTS
+
+        now = datetime.datetime.now()
+        current_time = now.strftime("%Y-%m-%d %H:%M:%S")
+        description_prompt = f"""You are a helpful assistant that always responds in Traditional Chinese. The current time is {current_time}.
+
+        If the user's query involves calculating salaries "this month" or "currently", use the current date as the salary date.
+
+        Generate a conversational description of the query results.
+        Do not include the SQL query in the description.
+        Do not mention anything about '公司金鑰'，user don't know what is '公司金鑰', just explain it is the filter that belong user's company.
+        User Natural language query: {natural_language_query}
+        Query Results Summary (statistics computed over all rows, plus a sample): {results_string}
+        No need to translate Results value
+        """
+
+        if results_string == NO_RESULTS:
+            description_prompt += """
+            Explain why there might be no data.
+            """
+        span.set(prompt_chars=len(description_prompt), template=False)
+    return description_prompt, None
+
+def description_key(natural_language_query, sql_query):
+    """
+    Identifies a description for coalescing: the same question over the same SQL
+    for the same company. The prompt itself is not used because it carries the time.
+    """
+    return (sql_cache.normalize_question(natural_language_query), result_cache.normalize_sql(sql_query), str(config.COMPANYKEY))
+
+def describe(description_prompt, llm=None, trace_id=None, coalesce_key=None):
+    """Generates the conversational description from a prepared prompt; see description_key for coalesce_key."""
+    llm = llm or default_llm()
+    with telemetry.span("generate_description", trace_id, prompt_chars=len(description_prompt)) as span:
+        if coalesce_key is None:
+            description, coalesced = llm.generate_description(description_prompt), False
+        else:
+            description, coalesced = _description_flight.do(coalesce_key, llm.generate_description, description_prompt)
+        span.set(ok=description is not None, coalesced=coalesced)
+    return description
+
+async def describe_async(description_prompt, llm=None, trace_id=None, coalesce_key=None):
+    """describe for event loops; returns None when generation failed."""
+    llm = llm or default_llm()
+    with telemetry.span("generate_description", trace_id, prompt_chars=len(description_prompt)) as span:
+        coalesced = False
+        try:
+            if coalesce_key is None:
+                description = await llm.generate_description_async(description_prompt)
+            else:
+                description, coalesced = await _description_flight.do_async(coalesce_key, llm.generate_description_async, description_prompt)
+        except Exception as e:
+            print(f"Error generating conversational description: {e}")
+            description = None
+        span.set(ok=description is not None, coalesced=coalesced)
+    return description
+
+def describe_stream(description_prompt, llm=None, trace_id=None, coalesce_key=None):
+    """
+    Yields the conversational description chunk by chunk. Time to the first chunk is
+    recorded as its own description_first_token stage; failures end the stream early.
+    With a coalesce_key, a caller that finds the same description already being
+    streamed waits for the leader and gets the whole text as one chunk.
+    """
+    llm = llm or default_llm()
+    with telemetry.span("generate_description", trace_id, prompt_chars=len(description_prompt), stream=True) as span:
+        future, leader = (None, True) if coalesce_key is None else _description_flight.claim(coalesce_key)
+        first_token = telemetry.Span("description_first_token", trace_id)
+        chunks = 0
+        parts = []
+        complete = False
+        try:
+            if leader:
+                source = llm.generate_description_stream(description_prompt)
+            else:
+                span.set(coalesced=True)
+                description = future.result()
+                source = [description] if description else []
+            for chunk in source:
+                if not chunk:
+                    continue
+                if chunks == 0:
+                    first_token.finish()
+                    span.set(ttft_ms=round(first_token.duration * 1000, 3))
+                chunks += 1
+                parts.append(chunk)
+                yield chunk
+            complete = True
+        except Exception as e:
+            print(f"Error generating conversational description: {e}")
+        finally:
+            if leader and future is not None:
+                # Followers only get a description that was streamed to the end
+                _description_flight.finish(coalesce_key, future, "".join(parts) if complete and parts else None)
+        span.set(ok=chunks > 0, chunks=chunks, chars=sum(len(part) for part in parts))
+
+def _new_answer(natural_language_query, trace_id):
+    return {"question": natural_language_query, "trace_id": trace_id, "sql": None, "results": None,
+            "description": None, "cache_hit": False, "error": None, "error_kind": None}
+
+def answer_question(natural_language_query, schema_info, exchange_rates, llm=None, database_file=None, use_cache=True, trace_id=None):
+    """
+    Runs the whole question → SQL → rows → description pipeline without any UI.
+
+    Returns:
+        dict: question, trace_id, sql, results (result_set.ColumnarResult or None), description,
+              cache_hit, error (str or None), error_kind ("security", "llm" or
+              "database") and total_seconds.
+    """
+    trace_id = trace_id or telemetry.new_trace_id()
+    start = time.perf_counter()
+    answer = _new_answer(natural_language_query, trace_id)
+    try:
+        with telemetry.span("input_filter", trace_id, query_chars=len(natural_language_query)):
+            filter_user_input(natural_language_query)
+        sql_query, cache_hit = get_sql(natural_language_query, schema_info, exchange_rates, llm, trace_id, use_cache)
+        answer.update(sql=sql_query, cache_hit=cache_hit)
+        if not sql_query:
+            answer.update(error="Failed to generate SQL query.", error_kind="llm")
+            return answer
+        results = run_query(sql_query, database_file, trace_id, cache_hit)
+        answer["results"] = results
+        if use_cache and not cache_hit:
+            remember_sql(natural_language_query, schema_info, sql_query)
+        description_prompt, description = build_description_prompt(natural_language_query, results, trace_id)
+        if description is None:
+            description = describe(description_prompt, llm, trace_id, description_key(natural_language_query, sql_query))
+        answer["description"] = description
+        if description is None:
+            answer.update(error="Failed to generate a conversational description of the query results.", error_kind="llm")
+    except SecurityException as e:
+        answer.update(error=str(e), error_kind="security")
+    except sqlite3.Error as e:
+        answer.update(error=f"Error querying database: {e}", error_kind="database")
+    finally:
+        answer["total_seconds"] = time.perf_counter() - start
+    return answer
+
+async def answer_question_async(natural_language_query, schema_info, exchange_rates, llm=None, database_file=None, use_cache=True, trace_id=None):
+    """
+    answer_question for event loops, e.g. api_server. LLM calls are awaited through
+    the backend's *_async methods and the SQLite work runs in worker threads, so
+    one loop can serve many questions at once. Returns the same dict.
+    """
+    trace_id = trace_id or telemetry.new_trace_id()
+    start = time.perf_counter()
+    answer = _new_answer(natural_language_query, trace_id)
+    try:
+        with telemetry.span("input_filter", trace_id, query_chars=len(natural_language_query)):
+            filter_user_input(natural_language_query)
+        sql_query, cache_hit = await get_sql_async(natural_language_query, schema_info, exchange_rates, llm, trace_id, use_cache)
+        answer.update(sql=sql_query, cache_hit=cache_hit)
+        if not sql_query:
+            answer.update(error="Failed to generate SQL query.", error_kind="llm")
+            return answer
+        results = await asyncio.to_thread(run_query, sql_query, database_file, trace_id, cache_hit)
+        answer["results"] = results
+        if use_cache and not cache_hit:
+            await asyncio.to_thread(remember_sql, natural_language_query, schema_info, sql_query)
+        description_prompt, description = build_description_prompt(natural_language_query, results, trace_id)
+        if description is None:
+            description = await describe_async(description_prompt, llm, trace_id, description_key(natural_language_query, sql_query))
+        answer["description"] = description
+        if description is None:
+            answer.update(error="Failed to generate a conversational description of the query results.", error_kind="llm")
+    except SecurityException as e:
+        answer.update(error=str(e), error_kind="security")
+    except sqlite3.Error as e:
+        answer.update(error=f"Error querying database: {e}", error_kind="database")
+    finally:
+        answer["total_seconds"] = time.perf_counter() - start
+    return answer
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import re
+from collections import namedtuple
+import catalog
+import config
+
+# A prompt section. Lower priority numbers are kept longest; required sections are never trimmed.
+Section = namedtuple("Section", ["name", "text", "priority", "required"])
+
+# text: the full prompt. prefix: everything before the question, byte-identical for
+# identical inputs so provider-side prefix caching can reuse it. sections: per-section
+# chars/tokens and whether the section was included or trimmed.
+PromptBuild = namedtuple("PromptBuild", ["text", "prefix", "prefix_hash", "sections", "total_tokens", "budget"])
+
+_CJK = re.compile(r"[\u3000-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+def estimate_tokens(text):
+    """Roughly estimates the token count: one token per CJK character, four characters per token otherwise."""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _dumps(value):
+    """Serializes a value in a byte-stable way."""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=catalog.json_default)
+
+def render_schema(schema_info, tables=None):
+    """Renders the schema one table per line, in the given table order."""
+    tables = list(schema_info) if tables is None else tables
+    return "Schema:\n" + "\n".join(_dumps({table: schema_info[table]}) for table in tables) + "\n"
+
+def build_sql_prompt(natural_language_query, schema_info, exchange_rates=None, instructions=None, company_key=None, budget=None):
+    """
+    Assembles the SQL generation prompt under a token budget.
+
+    The static sections come first (rules, instructions, exchange rates), then the
+    schema, and the question always comes last. When the estimate exceeds the budget
+    the lowest-priority sections are dropped first; the schema is cut table by table
+    from the least relevant end, keeping at least one table.
+
+    Returns:
+        PromptBuild: The prompt text and the per-section token accounting.
+    """
+    company_key = company_key or config.COMPANYKEY
+    instructions = config.SQL_INSTRUCTIONS if instructions is None else instructions
+    budget = budget or config.PROMPT_TOKEN_BUDGET
+    tables = list(schema_info)
+
+    sections = [Section("rules", config.SQL_RULES.format(COMPANYKEY=company_key), 0, True)]
+    if instructions:
+        sections.append(Section("instructions", f"Instructions:\n{instructions}\n", 2, False))
+    if exchange_rates:
+        sections.append(Section("exchange_rates", f"Exchange rates:\n{_dumps(exchange_rates)}\n", 3, False))
+    sections.append(Section("schema", render_schema(schema_info, tables), 1, False))
+    sections.append(Section("question", config.SQL_QUESTION_TEMPLATE.format(question=natural_language_query), 0, True))
+
+    tokens = {section.name: estimate_tokens(section.text) for section in sections}
+    included = {section.name: True for section in sections}
+    trimmed = set()
+    while sum(tokens[name] for name in included if included[name]) > budget:
+        candidates = [s for s in sections if not s.required and included[s.name]]
+        if not candidates:
+            break
+        victim = max(candidates, key=lambda s: s.priority)
+        if victim.name == "schema":
+            if len(tables) <= 1:
+                break
+            tables.pop()
+            index = sections.index(victim)
+            sections[index] = victim._replace(text=render_schema(schema_info, tables))
+            tokens["schema"] = estimate_tokens(sections[index].text)
+        else:
+            included[victim.name] = False
+        trimmed.add(victim.name)
+
+    kept = [s for s in sections if included[s.name]]
+    prefix = "".join(s.text for s in kept if s.name != "question")
+    text = prefix + sections[-1].text
+    total = sum(tokens[s.name] for s in kept)
+    if total > budget:
+        print(f"Prompt is over budget even after trimming: {total} > {budget} tokens")
+    accounting = []
+    for s in sections:
+        entry = {
+            "name": s.name,
+            "chars": len(s.text) if included[s.name] else 0,
+            "tokens": tokens[s.name] if included[s.name] else 0,
+            "included": included[s.name],
+            "trimmed": s.name in trimmed,
+        }
+        if s.name == "schema":
+            entry["tables"] = len(tables)
+        accounting.append(entry)
+    prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+    return PromptBuild(text, prefix, prefix_hash, accounting, total, budget)
+
+def format_accounting(build):
+    """Renders the per-section token accounting on one line for logs."""
+    parts = [f"{a['name']}={a['tokens']}" + ("(trimmed)" if a["trimmed"] else "") for a in build.sections]
+    return f"prompt tokens≈{build.total_tokens}/{build.budget} [" + ", ".join(parts) + f"] prefix={build.prefix_hash[:12]}"
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import threading
+import time
+import config
+import db_engine
+import index_advisor
+
+class QueryBudgetExceeded(sqlite3.OperationalError):
+    """
+    Raised when a query is rejected or cancelled; budget names the limit that was hit
+    and plan holds the EXPLAIN QUERY PLAN lines of a rejected query.
+    """
+
+    def __init__(self, budget, message, plan=None):
+        super().__init__(message)
+        self.budget = budget
+        self.plan = plan
+
+_lock = threading.Lock()
+_counters = {"checked": 0, "rejected_plan": 0, "cancelled_time": 0, "truncated_rows": 0, "truncated_bytes": 0}
+_table_rows = {}   # database file -> (data_version, {table: estimated rows})
+
+def _bump(name):
+    with _lock:
+        _counters[name] += 1
+
+def table_rows(database_file=None, tables=()):
+    """
+    Returns row estimates: the ones ANALYZE stored in sqlite_stat1 (create_db runs
+    ANALYZE after every build), plus a count for each of tables that sqlite_stat1
+    does not cover. That count stops at GUARD_SMALL_TABLE_ROWS, so it never scans
+    more than the rows needed to call a table large. Cached until the database's
+    data_version changes.
+    """
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    version = db_engine.data_version(database_file)
+    with _lock:
+        cached = _table_rows.get(database_file)
+    if cached is None or cached[0] != version:
+        estimates = {}
+        try:
+            for table, stat in db_engine.execute("SELECT tbl, stat FROM sqlite_stat1", database_file=database_file):
+                estimates[table] = max(estimates.get(table, 0), int(stat.split()[0]))
+        except sqlite3.OperationalError:
+            # No ANALYZE has been run on this database
+            pass
+        cached = (version, estimates)
+        with _lock:
+            _table_rows[database_file] = cached
+    estimates = cached[1]
+    missing = [table for table in dict.fromkeys(tables) if table not in estimates]
+    if missing:
+        with db_engine.get_pool(database_file).connection() as conn:
+            counted = {
+                table: conn.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM "{table}" LIMIT ?)', (config.GUARD_SMALL_TABLE_ROWS,)).fetchone()[0]
+                for table in missing
+            }
+        with _lock:
+            estimates.update(counted)
+    return estimates
+
+def check_plan(sql_query, database_file=None, max_scans=None):
+    """
+    Rejects a query before execution when its plan has too many unindexed scans.
+
+    Automatic indexes count as indexed (the plan shows a SEARCH), and scans of
+    tables below GUARD_SMALL_TABLE_ROWS rows (by ANALYZE's estimate, or counted up
+    to that limit when the table has no statistics) are ignored.
+
+    Returns:
+        tuple: (EXPLAIN QUERY PLAN lines, the large tables the plan scans without an index)
+    """
+    max_scans = config.GUARD_MAX_UNINDEXED_SCANS if max_scans is None else max_scans
+    plan = index_advisor.explain(sql_query, database_file)
+    scanned = index_advisor.full_scans(plan, sql_query, index_advisor.table_columns(database_file))
+    estimates = table_rows(database_file, scanned)
+    scanned = [table for table in scanned if estimates[table] >= config.GUARD_SMALL_TABLE_ROWS]
+    _bump("checked")
+    if len(scanned) > max_scans:
+        _bump("rejected_plan")
+        raise QueryBudgetExceeded(
+            "plan",
+            f"Query rejected: {len(scanned)} unindexed full table scans ({', '.join(scanned)}), at most {max_scans} allowed",
+            plan,
+        )
+    return plan, scanned
+
+class _Deadline:
+    """A progress handler that interrupts the query once its time budget is spent."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.expired = False
+
+    def __call__(self):
+        if time.monotonic() > self.deadline:
+            self.expired = True
+            return 1
+        return 0
+
+    def handler(self):
+        return (self, config.GUARD_PROGRESS_STEPS)
+
+def _run(fetch, deadline):
+    try:
+        return fetch(deadline.handler())
+    except sqlite3.OperationalError as e:
+        if deadline.expired:
+            _bump("cancelled_time")
+            raise QueryBudgetExceeded("time", f"Query cancelled after exceeding the {deadline.seconds:g} s time budget") from e
+        raise
+
+def fetch(sql_query, params=(), database_file=None, time_budget=None, max_rows=None, max_bytes=None):
+    """
+    Runs a generated query under all budgets.
+
+    The plan is checked first, the query is interrupted by the progress handler once
+    the time budget is spent, and the row and byte caps truncate the result
+    (reported through ColumnarResult.truncated) instead of failing it.
+
+    Returns:
+        tuple: (ColumnarResult, the checked plan lines, for index_advisor.observe)
+
+    Raises:
+        QueryBudgetExceeded: with budget "plan" or "time".
+    """
+    plan, _ = check_plan(sql_query, database_file)
+    deadline = _Deadline(config.GUARD_TIME_BUDGET_SECONDS if time_budget is None else time_budget)
+    results = _run(
+        lambda handler: db_engine.fetch_bounded(sql_query, params, max_rows, max_bytes, database_file=database_file, progress_handler=handler),
+        deadline,
+    )
+    if results.truncated:
+        _bump(f"truncated_{results.truncated}")
+    return results, plan
+
+def stats():
+    """Returns how often each budget was hit."""
+    with _lock:
+        return dict(_counters)
+
+def guard_metrics():
+    """Yields the guard counters as (metric_name, labels, value) tuples for telemetry."""
+    for key, value in stats().items():
+        yield f"corpquery_query_guard_{key}", {}, value
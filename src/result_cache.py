@@ -0,0 +1,124 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+import config
+import db_engine
+
+# Rough per-entry overhead of the key and the ColumnarResult object
+_ENTRY_OVERHEAD = 256
+
+_lock = threading.Lock()
+_entries = OrderedDict()   # key -> (size, ColumnarResult), least recently used first
+_versions = {}   # database file -> data_version the cached entries were read at
+_bytes = 0
+_counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+# SQL whose result changes without a write: the clock below a day, or random numbers
+_VOLATILE = re.compile(
+    r"\b(?:DATETIME|TIME|JULIANDAY|UNIXEPOCH|STRFTIME)\s*\([^)]*'now'|\bCURRENT_TIME(?:STAMP)?\b|\bRANDOM(?:BLOB)?\s*\(",
+    re.IGNORECASE,
+)
+# SQL that depends on today's date, e.g. DATE('now', '-1 year')
+_DATED = re.compile(r"'now'|\bCURRENT_DATE\b", re.IGNORECASE)
+
+def normalize_sql(sql_query):
+    """Collapses whitespace and drops the trailing semicolon; literals keep their case."""
+    return " ".join(sql_query.split()).rstrip(";").strip()
+
+def make_key(sql_query, company_key, database_file=None):
+    """Builds the cache key; SQL reading today's date is keyed on the date (UTC and local) too."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    sql_query = normalize_sql(sql_query)
+    today = (time.strftime("%Y-%m-%d", time.gmtime()), time.strftime("%Y-%m-%d")) if _DATED.search(sql_query) else None
+    return (database_file, sql_query, str(company_key), today)
+
+def cacheable(key):
+    """Whether a result can be reused until the database changes; not for time-of-day or random() SQL."""
+    return _VOLATILE.search(key[1]) is None
+
+def result_size(results):
+    """Estimates the memory a cached result holds."""
+    return _ENTRY_OVERHEAD + sum(sys.getsizeof(column) for column in results.columns) + results.nbytes
+
+def _remove(key):
+    global _bytes
+    size, _ = _entries.pop(key)
+    _bytes -= size
+
+def _validate(database_file, version):
+    """Drops every entry of a database once another connection has committed to it."""
+    if _versions.get(database_file) == version:
+        return
+    stale = [key for key in _entries if key[0] == database_file]
+    for key in stale:
+        _remove(key)
+    if stale:
+        _counters["invalidations"] += 1
+    _versions[database_file] = version
+
+def get(key, version=None):
+    """Returns the cached ColumnarResult for a key, or None on a miss or after the database changed."""
+    if not config.RESULT_CACHE_ENABLED or not cacheable(key):
+        return None
+    version = db_engine.data_version(key[0]) if version is None else version
+    with _lock:
+        _validate(key[0], version)
+        entry = _entries.get(key)
+        if entry is None:
+            _counters["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _counters["hits"] += 1
+        return entry[1]
+
+def put(key, results, version=None):
+    """
+    Caches a result and evicts least recently used entries beyond RESULT_CACHE_MAX_BYTES.
+
+    version should be the data_version read before the query ran; a result that
+    raced with a batch load is not cached.
+    """
+    global _bytes
+    if not config.RESULT_CACHE_ENABLED or not cacheable(key):
+        return
+    size = result_size(results)
+    if size > config.RESULT_CACHE_MAX_BYTES:
+        return
+    current = db_engine.data_version(key[0])
+    if version is not None and version != current:
+        return
+    with _lock:
+        _validate(key[0], current)
+        if key in _entries:
+            _remove(key)
+        _entries[key] = (size, results)
+        _bytes += size
+        while _bytes > config.RESULT_CACHE_MAX_BYTES:
+            _remove(next(iter(_entries)))
+            _counters["evictions"] += 1
+
+def stats():
+    """Returns the hit ratio, the bytes held and the hit/miss/eviction/invalidation counters."""
+    with _lock:
+        current = dict(_counters, entries=len(_entries), bytes=_bytes)
+    total = current["hits"] + current["misses"]
+    current["hit_ratio"] = current["hits"] / total if total else 0.0
+    return current
+
+def cache_metrics():
+    """Yields the cache counters as (metric_name, labels, value) tuples for telemetry."""
+    for key, value in stats().items():
+        yield f"corpquery_result_cache_{key}", {}, value
+
+def clear():
+    """Removes every cached result and resets the counters."""
+    global _bytes
+    with _lock:
+        _entries.clear()
+        _versions.clear()
+        _bytes = 0
+        for name in _counters:
+            _counters[name] = 0
@@ -0,0 +1,175 @@
+import itertools
+from array import array
+import column_types
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUMERIC_TYPES = {"INTEGER": ("int64", "q"), "REAL": ("float64", "d")}
+
+def value_size(value):
+    """Estimates how many bytes a single cell occupies."""
+    if value is None:
+        return 1
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return len(value)
+    return 8
+
+class ColumnarResult:
+    """
+    A query result held column by column.
+
+    types are the columns' schema.json types, widened to the values actually
+    present (see column_types.resolve_types). INTEGER and REAL columns are NumPy arrays
+    when NumPy is installed and array.array otherwise; their NULL cells hold 0 and
+    are flagged in the column's mask (bytes, 1 = present; None when the column has
+    no NULLs). TEXT and BLOB columns are lists of the native values, with None.
+    truncated is None when the whole result was read, otherwise "rows" or "bytes"
+    depending on which cap was hit.
+    """
+
+    def __init__(self, columns, types, arrays, masks, row_count, truncated=None):
+        self.columns = list(columns)
+        self.types = list(types)
+        self.arrays = arrays
+        self.masks = masks
+        self.row_count = row_count
+        self.truncated = truncated
+
+    @classmethod
+    def from_columns(cls, columns, values, truncated=None, declared=None):
+        """Builds a result from one list of native values per column."""
+        row_count = len(values[0]) if values else 0
+        observed = [set(map(type, column)) for column in values]
+        types = column_types.resolve_types(declared or column_types.declared_types(columns), observed)
+        arrays = []
+        masks = []
+        for kind, column in zip(types, values):
+            if kind not in NUMERIC_TYPES:
+                arrays.append(list(column))
+                masks.append(None)
+                continue
+            cast = int if kind == "INTEGER" else float
+            mask = None
+            if None in column:
+                mask = bytes(value is not None for value in column)
+                column = [cast(0) if value is None else value for value in column]
+            if kind == "REAL":
+                column = [float(value) for value in column]
+            dtype, typecode = NUMERIC_TYPES[kind]
+            arrays.append(numpy.array(column, dtype=dtype) if numpy is not None else array(typecode, column))
+            masks.append(mask)
+        return cls(columns, types, arrays, masks, row_count, truncated)
+
+    @classmethod
+    def from_rows(cls, columns, rows, truncated=None, declared=None):
+        """Builds a result from row tuples, e.g. cursor.fetchmany() output."""
+        values = [list(column) for column in zip(*rows)] if rows else [[] for _ in columns]
+        return cls.from_columns(columns, values, truncated, declared)
+
+    def __len__(self):
+        return self.row_count
+
+    def index(self, key):
+        """Returns the position of a column given by name or position."""
+        return key if isinstance(key, int) else self.columns.index(key)
+
+    def column(self, key):
+        """Returns a column as a list of Python values, with None for NULL."""
+        index = self.index(key)
+        values = self.arrays[index]
+        if self.types[index] not in NUMERIC_TYPES:
+            return list(values)
+        values = values.tolist()
+        mask = self.masks[index]
+        if mask is None:
+            return values
+        return [value if present else None for value, present in zip(values, mask)]
+
+    def values(self, key):
+        """Returns the non-NULL values of a column; typed arrays for numeric columns."""
+        index = self.index(key)
+        values, mask = self.arrays[index], self.masks[index]
+        if self.types[index] not in NUMERIC_TYPES:
+            return [value for value in values if value is not None]
+        if mask is None:
+            return values
+        if numpy is not None:
+            return values[numpy.frombuffer(mask, dtype=numpy.bool_)]
+        return array(values.typecode, itertools.compress(values, mask))
+
+    def rows(self):
+        """Returns the rows as tuples, for consumers that need row order."""
+        if not self.columns:
+            return [()] * self.row_count
+        return list(zip(*(self.column(index) for index in range(len(self.columns)))))
+
+    def row(self, position):
+        """Returns one row as a tuple without converting whole columns."""
+        cells = []
+        for values, mask in zip(self.arrays, self.masks):
+            if mask is not None and not mask[position]:
+                cells.append(None)
+            else:
+                value = values[position]
+                # NumPy scalars become the matching Python int or float
+                cells.append(value.item() if numpy is not None and isinstance(value, numpy.generic) else value)
+        return tuple(cells)
+
+    def aggregate(self, key):
+        """
+        Computes count, nulls and, for numeric columns with values, sum/min/max/avg
+        over the column arrays. The numbers are Python ints and floats.
+        """
+        index = self.index(key)
+        values = self.values(index)
+        result = {"count": len(values), "nulls": self.row_count - len(values)}
+        if self.types[index] in NUMERIC_TYPES and len(values):
+            cast = int if self.types[index] == "INTEGER" else float
+            if numpy is not None:
+                total, low, high = values.sum(), values.min(), values.max()
+            else:
+                total, low, high = sum(values), min(values), max(values)
+            result.update(sum=cast(total), min=cast(low), max=cast(high), avg=float(total) / len(values))
+        return result
+
+    def group_totals(self, group_key, value_key):
+        """Sums a numeric column per distinct value (as text) of another column; NULL values are skipped."""
+        totals = {}
+        for group, value in zip(self.column(group_key), self.column(value_key)):
+            if value is not None:
+                key = str(group)
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    @property
+    def nbytes(self):
+        """Estimates the memory the result holds."""
+        size = 0
+        for kind, values, mask in zip(self.types, self.arrays, self.masks):
+            if kind in NUMERIC_TYPES:
+                size += len(values) * 8 + (len(mask) if mask is not None else 0)
+            else:
+                size += sum(map(value_size, values)) + 8 * len(values)
+        return size
+
+    def to_dataframe(self):
+        """
+        Returns a pandas DataFrame with the columns' dtypes (NULLs in INTEGER
+        columns become NaN), or a {name: column} dict when pandas is not installed.
+        """
+        try:
+            import pandas
+        except ImportError:
+            return {name: self.column(index) for index, name in enumerate(self.columns)}
+        frame = pandas.DataFrame({
+            index: self.arrays[index] if self.types[index] in NUMERIC_TYPES and self.masks[index] is None else self.column(index)
+            for index in range(len(self.columns))
+        })
+        # Assigned afterwards so duplicate names (e.g. two SUM(...) columns) survive
+        frame.columns = self.columns
+        return frame
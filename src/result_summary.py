@@ -0,0 +1,111 @@
+from collections import Counter
+import config
+
+# Columns the user never needs to see in a description
+HIDDEN_COLUMNS = {"公司金鑰"}
+
+def format_value(value):
+    """Formats a cell for display, with thousands separators for numbers."""
+    if value is None:
+        return "無資料"
+    if isinstance(value, float):
+        return f"{value:,.0f}" if value.is_integer() else f"{value:,.2f}"
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    return str(value)
+
+def summarize(results, top_n=None, sample_size=None):
+    """
+    Computes a compact statistical digest of a query result.
+
+    Args:
+        results (result_set.ColumnarResult): The result; numeric statistics run over its column arrays.
+        top_n (int): How many of the most frequent values / largest groups to keep.
+        sample_size (int): How many rows to keep as a sample.
+
+    Returns:
+        dict: Row count, per-column statistics (count, nulls, sum/min/max/avg for
+              numeric columns, distinct/top-N values for text columns), group totals
+              of numeric columns over low-cardinality text columns, and a row sample.
+    """
+    top_n = top_n or config.SUMMARY_TOP_N
+    sample_size = sample_size or config.SUMMARY_SAMPLE_ROWS
+    columns = results.columns
+    visible = [i for i, name in enumerate(columns) if name not in HIDDEN_COLUMNS]
+
+    stats = []
+    numeric = []
+    categorical = []
+    for i in visible:
+        column = {"name": columns[i], **results.aggregate(i)}
+        if "sum" in column:
+            column["kind"] = "number"
+            numeric.append(i)
+        else:
+            counts = Counter(map(str, results.values(i)))
+            column.update(kind="text", distinct=len(counts), top=counts.most_common(top_n))
+            if counts:
+                column.update(min=min(counts), max=max(counts))
+            if 1 < len(counts) <= config.SUMMARY_MAX_GROUPS:
+                categorical.append(i)
+        stats.append(column)
+
+    groups = []
+    for g in categorical:
+        for n in numeric:
+            totals = results.group_totals(g, n)
+            top = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top_n]
+            groups.append({"group_by": columns[g], "column": columns[n], "totals": top})
+
+    sample = [results.row(position) for position in range(min(sample_size, len(results)))]
+    return {
+        "row_count": len(results),
+        "columns": stats,
+        "groups": groups,
+        "sample": [tuple(row[i] for i in visible) for row in sample],
+        "sample_columns": [columns[i] for i in visible],
+    }
+
+def format_digest(digest, truncated=None):
+    """Renders a digest as the compact text that goes into the description prompt."""
+    lines = [f"Row count: {digest['row_count']}" + (" (result truncated, statistics cover the rows read)" if truncated else "")]
+    for column in digest["columns"]:
+        if column["kind"] == "number":
+            lines.append(
+                f"- {column['name']}: count={column['count']}, nulls={column['nulls']}, "
+                f"sum={format_value(column['sum'])}, min={format_value(column['min'])}, "
+                f"max={format_value(column['max'])}, avg={format_value(column['avg'])}"
+            )
+        else:
+            top = ", ".join(f"{value} ({count})" for value, count in column["top"])
+            lines.append(f"- {column['name']}: count={column['count']}, nulls={column['nulls']}, distinct={column['distinct']}, top: {top}")
+    for group in digest["groups"]:
+        totals = ", ".join(f"{key}={format_value(total)}" for key, total in group["totals"])
+        lines.append(f"- {group['column']} by {group['group_by']}: {totals}")
+    if digest["sample"]:
+        lines.append(f"Sample rows {tuple(digest['sample_columns'])}:")
+        lines.extend(str(row) for row in digest["sample"])
+    return "\n".join(lines)
+
+def all_null(results):
+    """Whether every visible cell is NULL, e.g. a SUM() over no matching rows."""
+    return all(not len(results.values(i)) for i, name in enumerate(results.columns) if name not in HIDDEN_COLUMNS)
+
+def template_description(natural_language_query, results):
+    """
+    Describes scalar and single-row results without calling the LLM.
+
+    Returns:
+        str: A Traditional Chinese description, or None when the result needs the LLM
+             (more than one row, or a NULL among the values).
+    """
+    if len(results) != 1:
+        return None
+    row = results.row(0)
+    cells = [(name, row[i]) for i, name in enumerate(results.columns) if name not in HIDDEN_COLUMNS]
+    if not cells or any(value is None for _, value in cells):
+        return None
+    if len(cells) == 1:
+        return f"根據您的查詢「{natural_language_query}」，在貴公司的資料中，結果為 {format_value(cells[0][1])}。"
+    details = "、".join(f"{name}為 {format_value(value)}" for name, value in cells)
+    return f"根據您的查詢「{natural_language_query}」，在貴公司的資料中共找到 1 筆資料：{details}。"
@@ -0,0 +1,214 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+import config
+
+# Monthly rollups of the detail tables. Key and measure expressions use {row} as the
+# column prefix: "" when rebuilding from the base table, "NEW."/"OLD." in triggers.
+# NULL keys are stored as '' so that the primary key (and the trigger upserts) match them.
+ROLLUPS = {
+    "交易月結": {
+        "source": "交易明細",
+        "keys": [
+            ("公司金鑰", "{row}公司金鑰"),
+            ("月份", "substr({row}交易日期, 1, 7)"),
+            ("帳戶", "{row}帳戶"),
+            ("幣別", "{row}幣別"),
+            ("費用類型", "{row}費用類型"),
+        ],
+        "measures": [
+            ("交易筆數", "1", "INTEGER"),
+            ("收入總額", "{row}收入金額", "REAL"),
+            ("付款總額", "{row}付款金額", "REAL"),
+        ],
+    },
+    "薪資月結": {
+        "source": "員工薪資",
+        "keys": [
+            ("公司金鑰", "{row}公司金鑰"),
+            ("月份", "substr({row}薪資日期, 1, 7)"),
+            ("部門", "{row}部門"),
+        ],
+        "measures": [
+            ("薪資筆數", "1", "INTEGER"),
+            ("薪資總額", "{row}薪資", "REAL"),
+        ],
+    },
+}
+
+# Sums maintained by triggers drift by float rounding; verify allows this much
+TOLERANCE = 0.005
+
+_lock = threading.Lock()
+_ensured = set()
+
+def _key_exprs(spec, row=""):
+    return [f"COALESCE({expr.format(row=row)}, '')" for _, expr in spec["keys"]]
+
+def _measure_exprs(spec, row=""):
+    return [f"COALESCE({expr.format(row=row)}, 0)" for _, expr, _ in spec["measures"]]
+
+def _key_names(spec):
+    return [name for name, _ in spec["keys"]]
+
+def _measure_names(spec):
+    return [name for name, _, _ in spec["measures"]]
+
+def create_table_sql(name, spec):
+    columns = [f"{key} TEXT NOT NULL" for key in _key_names(spec)]
+    columns += [f"{measure} {sql_type} NOT NULL DEFAULT 0" for measure, _, sql_type in spec["measures"]]
+    return f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(columns)}, PRIMARY KEY ({', '.join(_key_names(spec))}))"
+
+def aggregate_sql(spec):
+    """The GROUP BY over the base table that a rollup must equal."""
+    keys = _key_exprs(spec)
+    selected = [f"{expr} AS {name}" for expr, name in zip(keys, _key_names(spec))]
+    selected += [f"SUM({expr}) AS {name}" for expr, name in zip(_measure_exprs(spec), _measure_names(spec))]
+    return f"SELECT {', '.join(selected)} FROM {spec['source']} GROUP BY {', '.join(keys)}"
+
+def _add_sql(name, spec, row, sign):
+    """Upserts one base row into the rollup (sign -1 takes it out again)."""
+    keys = _key_names(spec)
+    measures = _measure_names(spec)
+    values = _key_exprs(spec, row) + [f"{sign} * {expr}" for expr in _measure_exprs(spec, row)]
+    updates = ", ".join(f"{measure} = {measure} + excluded.{measure}" for measure in measures)
+    return (
+        f"INSERT INTO {name} ({', '.join(keys + measures)}) VALUES ({', '.join(values)}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates};"
+    )
+
+def _prune_sql(name, spec, row):
+    """Deletes the rollup row of a base row once no base rows are left in it."""
+    conditions = " AND ".join(f"{key} = {expr}" for key, expr in zip(_key_names(spec), _key_exprs(spec, row)))
+    return f"DELETE FROM {name} WHERE {conditions} AND {_measure_names(spec)[0]} <= 0;"
+
+def trigger_sql(name, spec):
+    """The AFTER INSERT/DELETE/UPDATE triggers that keep a rollup in step with its base table."""
+    source = spec["source"]
+    remove = _add_sql(name, spec, "OLD.", -1) + " " + _prune_sql(name, spec, "OLD.")
+    add = _add_sql(name, spec, "NEW.", 1)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{name}_insert AFTER INSERT ON {source} BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{name}_delete AFTER DELETE ON {source} BEGIN {remove} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{name}_update AFTER UPDATE ON {source} BEGIN {remove} {add} END",
+    ]
+
+def drop_triggers(conn, name):
+    for event in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{name}_{event}")
+
+def rebuild(conn, names=None):
+    """Recomputes rollups from their base tables in one transaction; returns {name: rows}."""
+    counts = {}
+    with conn:
+        for name in names or ROLLUPS:
+            spec = ROLLUPS[name]
+            conn.execute(create_table_sql(name, spec))
+            conn.execute(f"DELETE FROM {name}")
+            columns = ", ".join(_key_names(spec) + _measure_names(spec))
+            conn.execute(f"INSERT INTO {name} ({columns}) {aggregate_sql(spec)}")
+            counts[name] = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    return counts
+
+def install(conn):
+    """
+    Creates the rollup tables, fills them from the base tables and installs the
+    triggers. Bulk loads are faster when this runs after the load (create_db does),
+    since the triggers then fire once per later change instead of once per row.
+    """
+    counts = rebuild(conn)
+    with conn:
+        for name, spec in ROLLUPS.items():
+            # Recreated so changes to ROLLUPS reach existing databases
+            drop_triggers(conn, name)
+            for statement in trigger_sql(name, spec):
+                conn.execute(statement)
+    return counts
+
+def is_installed(conn):
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    return all(name in names and f"trg_{name}_insert" in names for name in ROLLUPS)
+
+def ensure(database_file=None):
+    """Installs the rollups into an existing database that lacks them; checked once per process and file."""
+    database_file = os.path.abspath(database_file or config.DATABASE_FILE)
+    if database_file in _ensured:
+        return
+    with _lock:
+        if database_file in _ensured or not os.path.exists(database_file):
+            return
+        conn = sqlite3.connect(database_file, timeout=30)
+        try:
+            if not is_installed(conn):
+                counts = install(conn)
+                print(f"Installed rollups into {database_file}: {counts}")
+        except sqlite3.Error as e:
+            print(f"Error installing rollups into {database_file}: {e}")
+        finally:
+            conn.close()
+        _ensured.add(database_file)
+
+def verify(conn, names=None, limit=20):
+    """
+    Compares rollups with a fresh aggregation of their base tables.
+
+    Returns:
+        dict: {name: [mismatch descriptions]}; empty lists mean the rollup is exact
+              (sums within TOLERANCE).
+    """
+    problems = {}
+    for name in names or ROLLUPS:
+        spec = ROLLUPS[name]
+        keys = _key_names(spec)
+        measures = _measure_names(spec)
+        join = " AND ".join(f"e.{key} = a.{key}" for key in keys)
+        differs = " OR ".join(f"ABS(e.{measure} - a.{measure}) > {TOLERANCE}" for measure in measures)
+        key_list = ", ".join(f"e.{key}" for key in keys)
+        rows = conn.execute(f"""
+            WITH e AS ({aggregate_sql(spec)})
+            SELECT 'mismatch', {key_list}, {', '.join(f'e.{m}, a.{m}' for m in measures)}
+            FROM e JOIN {name} a ON {join} WHERE {differs}
+            UNION ALL
+            SELECT 'missing', {key_list}, {', '.join(f'e.{m}, NULL' for m in measures)}
+            FROM e WHERE NOT EXISTS (SELECT 1 FROM {name} a WHERE {join})
+            UNION ALL
+            SELECT 'extra', {', '.join(f'a.{key}' for key in keys)}, {', '.join(f'NULL, a.{m}' for m in measures)}
+            FROM {name} a WHERE NOT EXISTS (SELECT 1 FROM e WHERE {join})
+            LIMIT {int(limit)}
+        """).fetchall()
+        problems[name] = [f"{row[0]} {dict(zip(keys, row[1:1 + len(keys)]))} expected/actual {row[1 + len(keys):]}" for row in rows]
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the monthly rollup tables (交易月結, 薪資月結).")
+    parser.add_argument("command", choices=["install", "rebuild", "verify"])
+    parser.add_argument("--database", default=config.DATABASE_FILE)
+    parser.add_argument("--table", action="append", choices=list(ROLLUPS), help="limit to these rollups")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database, timeout=30)
+    try:
+        start = time.perf_counter()
+        if args.command == "install":
+            print(f"Installed: {install(conn)}")
+        elif args.command == "rebuild":
+            print(f"Rebuilt: {rebuild(conn, args.table)}")
+        else:
+            problems = verify(conn, args.table)
+            for name, issues in problems.items():
+                print(f"{name}: {'OK' if not issues else f'{len(issues)} differences'}")
+                for issue in issues:
+                    print(f"  {issue}")
+            if any(problems.values()):
+                print("Run `python src/rollups.py rebuild` to recompute the rollups.")
+                return 1
+        print(f"Done in {time.perf_counter() - start:.2f}s")
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
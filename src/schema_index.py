@@ -0,0 +1,139 @@
+import json
+import os
+import re
+import unicodedata
+import catalog
+import config
+
+# Extra Chinese/English terms for each table, on top of its table and column names
+SYNONYMS = {
+    "員工薪資": ["薪資", "薪水", "工資", "月薪", "員工", "職稱", "到職", "salary", "salaries", "payroll", "employee", "employees", "wage", "wages"],
+    "部門資訊": ["部門", "主管", "人數", "地點", "department", "departments", "manager", "location"],
+    "交易明細": ["交易", "付款", "收入", "支出", "費用", "花費", "開銷", "收款", "付款人", "收款人", "水電", "租金", "廣告", "材料", "transaction", "transactions", "payment", "payments", "income", "expense", "expenses", "spend"],
+    "匯率資料表": ["匯率", "換算", "兌換", "台幣", "臺幣", "新台幣", "美金", "美元", "日幣", "日圓", "歐元", "港幣", "升值", "貶值", "exchange", "rate", "rates", "currency", "usd", "jpy", "eur", "hkd", "twd"],
+    "帳戶餘額表": ["餘額", "存款", "帳戶", "安全餘額", "balance", "balances", "account", "accounts"],
+    "交易月結": ["月結", "每月", "各月", "逐月", "按月", "月份", "月度", "季度", "年度", "趨勢", "monthly", "month", "months", "quarterly", "trend"],
+    "薪資月結": ["月結", "每月", "各月", "逐月", "按月", "月份", "月度", "薪資總額", "人事成本", "monthly", "month", "months"],
+}
+
+# Relations that are not declared as foreign keys in schema.json
+RELATIONS = {
+    "員工薪資": ["部門資訊", "薪資月結"],  # 員工薪資.部門 ↔ 部門資訊.部門名稱
+    "交易明細": ["交易月結"],
+    "交易月結": ["交易明細"],  # monthly rollup of 交易明細
+    "薪資月結": ["員工薪資", "部門資訊"],  # monthly rollup of 員工薪資, 部門 ↔ 部門資訊.部門名稱
+}
+
+# Columns shared by every table carry no information about which table is meant
+COMMON_COLUMNS = {"公司金鑰", "FOREIGN KEY"}
+
+def _normalize(text):
+    return unicodedata.normalize("NFKC", text).lower()
+
+def _references(table_info):
+    """Returns the tables a table references through its FOREIGN KEY entries."""
+    targets = []
+    for column in table_info.get("columns", []):
+        reference = column.get("references")
+        if reference:
+            targets.append(reference.split("(")[0].strip())
+    return targets
+
+def build_index(schema_info):
+    """
+    Builds the keyword index for a schema.
+
+    Returns:
+        dict: "terms" maps each normalized term to the tables it points at,
+              "neighbours" maps each table to the tables it needs for joins and
+              "fingerprint" identifies the schema the index was built from.
+    """
+    terms = {}
+
+    def add(term, table):
+        term = _normalize(term.strip())
+        if term and table not in terms.setdefault(term, []):
+            terms[term].append(table)
+
+    neighbours = {}
+    for table_name, table_info in schema_info.items():
+        add(table_name, table_name)
+        for column in table_info.get("columns", []):
+            if column.get("name") not in COMMON_COLUMNS:
+                add(column["name"], table_name)
+                if column.get("description"):
+                    add(column["description"], table_name)
+        for synonym in SYNONYMS.get(table_name, []):
+            add(synonym, table_name)
+        related = _references(table_info) + RELATIONS.get(table_name, [])
+        neighbours[table_name] = [table for table in related if table in schema_info and table != table_name]
+
+    return {"fingerprint": catalog.schema_fingerprint(schema_info), "terms": terms, "neighbours": neighbours}
+
+def save_index(index, index_file=None):
+    """Writes the index to disk."""
+    with open(index_file or config.SCHEMA_INDEX_FILE, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+_loaded = {}
+
+def load_index(schema_info, index_file=None):
+    """Loads the prebuilt index, rebuilding it in memory when it is missing or stale."""
+    index_file = index_file or config.SCHEMA_INDEX_FILE
+    fingerprint = catalog.schema_fingerprint(schema_info)
+    cached = _loaded.get(index_file)
+    if cached and cached["fingerprint"] == fingerprint:
+        return cached
+    index = None
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading schema index {index_file}: {e}")
+    if not index or index.get("fingerprint") != fingerprint:
+        print("Schema index missing or stale, rebuilding in memory")
+        index = build_index(schema_info)
+    # ASCII terms are matched on word boundaries, CJK terms as substrings
+    ascii_terms = sorted((term for term in index["terms"] if term.isascii()), key=len, reverse=True)
+    index["_ascii_pattern"] = re.compile(r"\b(" + "|".join(map(re.escape, ascii_terms)) + r")\b") if ascii_terms else None
+    _loaded[index_file] = index
+    return index
+
+def select_tables(natural_language_query, schema_info, index=None):
+    """Returns the tables relevant to a question, most relevant first, with their join neighbours."""
+    index = index or load_index(schema_info)
+    question = _normalize(natural_language_query)
+    scores = {}
+    for term, tables in index["terms"].items():
+        if term.isascii():
+            continue
+        if term in question:
+            for table in tables:
+                scores[table] = scores.get(table, 0) + len(term)
+    if index["_ascii_pattern"] is not None:
+        for term in index["_ascii_pattern"].findall(question):
+            for table in index["terms"][term]:
+                scores[table] = scores.get(table, 0) + len(term)
+
+    ranked = sorted(scores, key=lambda table: scores[table], reverse=True)[:config.SCHEMA_INDEX_MAX_TABLES]
+    selected = list(ranked)
+    for table in ranked:
+        for neighbour in index["neighbours"].get(table, []):
+            if neighbour not in selected:
+                selected.append(neighbour)
+    return selected
+
+def prune_schema(natural_language_query, schema_info, index=None):
+    """Returns only the part of schema_info relevant to the question, or the whole schema when nothing matches."""
+    tables = select_tables(natural_language_query, schema_info, index)
+    if not tables:
+        return schema_info
+    return {table: schema_info[table] for table in tables if table in schema_info}
+
+if __name__ == '__main__':
+    # Build the index offline from schema.json
+    schema = catalog.schema()
+    index = build_index(schema)
+    save_index(index)
+    print(f"Indexed {len(index['terms'])} terms for {len(schema)} tables into {config.SCHEMA_INDEX_FILE}")
@@ -0,0 +1,218 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import catalog
+import config
+import schema_index
+import schema_parser
+
+MANIFEST_VERSION = 1
+
+def _path(name):
+    """Resolves a config path against the repository root."""
+    return os.path.join(catalog.REPO_ROOT, name)
+
+def find_documents(source_dir):
+    """Returns every .docx under source_dir, skipping Word's ~$ lock files."""
+    documents = []
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            if name.lower().endswith(".docx") and not name.startswith("~$"):
+                documents.append(os.path.join(root, name))
+    return sorted(documents)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": MANIFEST_VERSION, "files": {}}
+    except ValueError as e:
+        print(f"Error reading {manifest_file}, parsing everything again: {e}")
+        return {"version": MANIFEST_VERSION, "files": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "files": {}}
+    return manifest
+
+def _write_atomic(path, data):
+    """Writes bytes to path through a temporary file, so readers never see half a file."""
+    # A unique name per writer, so concurrent ingest runs never share a temporary file
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", delete=False) as f:
+        f.write(data)
+    try:
+        # NamedTemporaryFile creates the file owner-only; the catalog is meant to be readable
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, path)
+    except OSError:
+        os.remove(f.name)
+        raise
+
+def _parse(path):
+    """Process pool worker: returns (path, tables, error)."""
+    try:
+        return path, schema_parser.parse_tables(path), None
+    except Exception as e:
+        return path, {}, f"{type(e).__name__}: {e}"
+
+def parse_documents(paths, workers=None):
+    """Parses documents in a process pool; a single document is parsed in-process."""
+    if len(paths) <= 1 or workers == 1:
+        return [_parse(path) for path in paths]
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+        return list(executor.map(_parse, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+def compile_catalog(manifest):
+    """Merges the per-document tables into one {table: info} catalog; later paths win on duplicates."""
+    compiled = {}
+    origin = {}
+    for relative_path in sorted(manifest["files"]):
+        for table_name, table_info in manifest["files"][relative_path]["tables"].items():
+            if table_name in compiled:
+                print(f"Table {table_name} in {relative_path} replaces the one in {origin[table_name]}")
+            compiled[table_name] = table_info
+            origin[table_name] = relative_path
+    return compiled
+
+def ingest(source_dir=None, manifest_file=None, catalog_file=None, pickle_file=None, workers=None, force=False):
+    """
+    Parses the changed documents under source_dir and rebuilds the compiled catalog.
+
+    A document is skipped when its mtime and size match the manifest, or when they
+    moved but its sha256 did not. Only new and changed documents go to the parser
+    pool; the tables of the others come from the manifest.
+
+    Returns:
+        tuple: (compiled catalog dict, stats dict)
+    """
+    source_dir = source_dir or _path(config.SCHEMA_DOCS_DIR)
+    manifest_file = manifest_file or _path(config.SCHEMA_MANIFEST_FILE)
+    catalog_file = catalog_file or _path(config.SCHEMA_CATALOG_FILE)
+    pickle_file = pickle_file or _path(config.SCHEMA_CATALOG_PICKLE)
+    workers = workers or config.SCHEMA_INGEST_WORKERS
+    start = time.perf_counter()
+
+    manifest = {"version": MANIFEST_VERSION, "files": {}} if force else load_manifest(manifest_file)
+    files = manifest["files"]
+    documents = find_documents(source_dir)
+    relative = {path: os.path.relpath(path, source_dir).replace(os.sep, "/") for path in documents}
+
+    changed = []
+    hashes = {}
+    for path in documents:
+        stat = os.stat(path)
+        entry = files.get(relative[path])
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size and not entry.get("error"):
+            continue
+        content_hash = file_hash(path)
+        if entry and entry["sha256"] == content_hash and not entry.get("error"):
+            entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            continue
+        hashes[path] = (content_hash, stat)
+        changed.append(path)
+
+    errors = {}
+    for path, tables, error in parse_documents(changed, workers):
+        content_hash, stat = hashes[path]
+        files[relative[path]] = {"sha256": content_hash, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "tables": tables, "error": error}
+        if error:
+            errors[relative[path]] = error
+            print(f"Error parsing schema from {path}: {error}")
+
+    removed = sorted(set(files) - set(relative.values()))
+    for relative_path in removed:
+        del files[relative_path]
+
+    compiled = compile_catalog(manifest)
+    _write_atomic(manifest_file, json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+    _write_atomic(catalog_file, json.dumps(compiled, ensure_ascii=False, indent=2).encode("utf-8"))
+    _write_atomic(pickle_file, pickle.dumps(compiled, protocol=pickle.HIGHEST_PROTOCOL))
+
+    stats = {
+        "documents": len(documents),
+        "parsed": len(changed),
+        "skipped": len(documents) - len(changed),
+        "removed": len(removed),
+        "errors": len(errors),
+        "tables": len(compiled),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    return compiled, stats
+
+def load_compiled(pickle_file=None, catalog_file=None):
+    """Loads the compiled catalog, preferring the pickle and falling back to the JSON."""
+    pickle_file = pickle_file or _path(config.SCHEMA_CATALOG_PICKLE)
+    try:
+        with open(pickle_file, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        with open(catalog_file or _path(config.SCHEMA_CATALOG_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def merge_into_schema(compiled, schema_info):
+    """
+    Returns schema_info with the ingested tables merged in. New tables are added as
+    parsed; for known tables only missing columns and descriptions are filled in, so
+    hand-written constraints, references and primary keys stay as they are.
+    """
+    merged = json.loads(json.dumps(schema_info, default=catalog.json_default))
+    for table_name, table_info in compiled.items():
+        existing = merged.get(table_name)
+        if existing is None:
+            merged[table_name] = json.loads(json.dumps(table_info))
+            continue
+        columns = {column["name"]: column for column in existing["columns"]}
+        for column in table_info["columns"]:
+            current = columns.get(column["name"])
+            if current is None:
+                existing["columns"].append(dict(column))
+            elif column.get("description") and not current.get("description"):
+                current["description"] = column["description"]
+    return merged
+
+def dump_schema(schema_info):
+    """Serializes a schema in schema.json's layout: one line per column."""
+    tables = []
+    for table_name, table_info in schema_info.items():
+        parts = []
+        for key, value in table_info.items():
+            if key == "columns":
+                columns = ",\n".join("      " + json.dumps(column, ensure_ascii=False) for column in value)
+                parts.append(f'    "columns": [\n{columns}\n    ]')
+            else:
+                parts.append(f"    {json.dumps(key, ensure_ascii=False)}: " + json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n    "))
+        tables.append(f"  {json.dumps(table_name, ensure_ascii=False)}: {{\n" + ",\n".join(parts) + "\n  }")
+    return "{\n" + ",\n".join(tables) + "\n}\n"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse the DB_Schema Word documents into a compiled schema catalog.")
+    parser.add_argument("--source", default=_path(config.SCHEMA_DOCS_DIR), help="directory searched for .docx files")
+    parser.add_argument("--workers", type=int, default=config.SCHEMA_INGEST_WORKERS, help="parser processes")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and parse every document")
+    parser.add_argument("--merge-schema", action="store_true", help="also merge the tables into schema.json and rebuild schema_index.json")
+    args = parser.parse_args(argv)
+
+    compiled, stats = ingest(args.source, workers=args.workers, force=args.force)
+    print(json.dumps(stats, ensure_ascii=False))
+    if args.merge_schema:
+        merged = merge_into_schema(compiled, catalog.schema())
+        _write_atomic(catalog.SCHEMA_FILE, dump_schema(merged).encode("utf-8"))
+        schema_index.save_index(schema_index.build_index(catalog.schema()), _path(config.SCHEMA_INDEX_FILE))
+        print(f"Merged {len(compiled)} tables into {catalog.SCHEMA_FILE}")
+    return 1 if stats["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
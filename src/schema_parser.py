@@ -1,3 +1,6 @@
+import os
+import re
+
 def format_schema(schema_info):
     """Formats the schema information into a string."""
     schema_string = ""
@@ -7,6 +10,125 @@ def format_schema(schema_info):
             schema_string += f"  Column: {column['name']} ({column['type']}) - {column['description']}\n"
     return schema_string
 
+# Header cell -> column attribute, for the English and Chinese document templates
+HEADER_ALIASES = {
+    "fieldname": "name", "欄位名稱": "name",
+    "type": "type", "型別": "type",
+    "description": "description", "描述": "description",
+    "null": "nullable", "是否為空": "nullable",
+    "default": "default", "預設值": "default",
+    "remark": "remark", "備註": "remark",
+}
+TABLE_NAME_PATTERN = re.compile(r"(?:Table Name|表格名稱)\s*[:：]?\s*([^\s:：]+)")
+PRIMARY_KEY_PATTERN = re.compile(r"Primary Key\s*[:：]?\s*(.*?)\s*(?:Index|$)")
+# Documents whose field list is running text ("6. SOURCETYPE smallint 資料來源 X ..."): an
+# upper-case field name, an SQL type and a description starting with a non-ASCII character
+SQL_TYPE = r"(?:bigint|smallint|tinyint|int|integer|n?va?r?char\s*\(\s*\d+\s*\)|numeric\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\)|decimal\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\)|datetime|date|bit|real|float|text)"
+TEXT_COLUMN_PATTERN = re.compile(r"([A-Z][A-Z0-9_]+)\s*(" + SQL_TYPE + r")\s*([^\x00-\x7f][^\sA-Z]*)?")
+NULLABLE_VALUES = {"是": True, "y": True, "yes": True, "null": True, "否": False, "n": False, "no": False, "x": False, "not null": False}
+
+def _blocks(doc):
+    """Yields the document body in order as lists of cell texts: one per table row or tab-separated paragraph."""
+    from docx.oxml.ns import qn
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    for child in doc.element.body.iterchildren():
+        if child.tag == qn("w:tbl"):
+            for row in Table(child, doc).rows:
+                yield [cell.text.strip() for cell in row.cells]
+        elif child.tag == qn("w:p"):
+            text = Paragraph(child, doc).text
+            if text.strip():
+                yield [cell.strip() for cell in text.split("\t")]
+
+def _header(cells):
+    """Returns {attribute: cell index} when the cells are a column header row, else None."""
+    mapping = {}
+    for index, cell in enumerate(cells):
+        attribute = HEADER_ALIASES.get(cell.replace(" ", "").lower())
+        if attribute and attribute not in mapping:
+            mapping[attribute] = index
+    return mapping if "name" in mapping and "type" in mapping else None
+
+def parse_tables(docx_path):
+    """
+    Parses every table definition in a Word document.
+
+    A "Table Name"/"表格名稱" line starts a table; the column rows that follow a
+    FieldName/欄位名稱 header (as a Word table or as tab-separated paragraphs) belong
+    to it, until the next table name.
+
+    Returns:
+        dict: {table_name: {"columns": [...]}} in the schema.json format; columns have
+              name and type, and description, nullable and primaryKey when the
+              document says so.
+
+    Raises:
+        Exception: whatever python-docx raises for unreadable files.
+    """
+    import docx
+    doc = docx.Document(docx_path)
+    tables = {}
+    current = None
+    primary_keys = set()
+    header = None
+    for cells in _blocks(doc):
+        line = " ".join(cells)
+        match = TABLE_NAME_PATTERN.search(line)
+        if match:
+            current = tables.setdefault(match.group(1), {"columns": []})
+            primary_keys = set()
+            header = None
+        match = PRIMARY_KEY_PATTERN.search(line)
+        if match:
+            primary_keys = set(re.split(r"[\s,，、]+", match.group(1))) - {""}
+        mapping = _header(cells)
+        if mapping:
+            header = mapping
+            continue
+        if header is None:
+            continue
+        values = {attribute: cells[index] for attribute, index in header.items() if index < len(cells)}
+        if not values.get("name") or not values.get("type"):
+            continue
+        if current is None:
+            # Documents without a table name line are named after the file
+            current = tables.setdefault(os.path.splitext(os.path.basename(docx_path))[0], {"columns": []})
+        column = {"name": values["name"], "type": values["type"]}
+        if values.get("description"):
+            column["description"] = values["description"]
+        nullable = NULLABLE_VALUES.get(values.get("nullable", "").lower())
+        if nullable is not None:
+            column["nullable"] = nullable
+        if values["name"] in primary_keys or "主鍵" in values.get("remark", "") or "PK" in values.get("remark", "").upper().split():
+            column["primaryKey"] = True
+        current["columns"].append(column)
+    if not any(table["columns"] for table in tables.values()):
+        return _parse_text("".join(doc.element.body.itertext()), docx_path)
+    return {name: table for name, table in tables.items() if table["columns"]}
+
+def _parse_text(text, docx_path):
+    """Fallback for documents whose field list is running text rather than rows."""
+    match = TABLE_NAME_PATTERN.search(text)
+    table_name = match.group(1) if match else os.path.splitext(os.path.basename(docx_path))[0]
+    match = PRIMARY_KEY_PATTERN.search(text)
+    primary_keys = set(re.split(r"[\s,，、]+", match.group(1))) if match else set()
+    columns = []
+    seen = set()
+    for name, sql_type, description in TEXT_COLUMN_PATTERN.findall(text[match.end():] if match else text):
+        if name in seen:
+            continue
+        seen.add(name)
+        column = {"name": name, "type": re.sub(r"\s+", "", sql_type)}
+        # The next item's list number sticks to the description ("付款金額6.")
+        description = re.sub(r"\d+\.$", "", description or "")
+        if description:
+            column["description"] = description
+        if name in primary_keys:
+            column["primaryKey"] = True
+        columns.append(column)
+    return {table_name: {"columns": columns}} if columns else {}
+
 def parse_schema(docx_path):
     """
     Parses a Word document containing database schema information and returns a structured representation.
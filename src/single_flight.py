@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+import config
+
+_flights = []
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight work.
+
+    The first caller for a key (the leader) does the work; callers arriving with
+    the same key while it runs (followers) wait on the leader's future and get the
+    same result or exception. The key is forgotten as soon as the work finishes,
+    so this never serves stale results; caching is left to sql_cache and
+    result_cache. The futures are thread-safe, so threads (Streamlit sessions,
+    batch_runner workers) and event loops (api_server) can share one flight.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.counters = {"leaders": 0, "followers": 0}
+        _flights.append(self)
+
+    def claim(self, key):
+        """
+        Returns (future, leader). A leader must call finish(); a follower waits on the future.
+        With SINGLE_FLIGHT_ENABLED off every caller is a leader of its own future.
+        """
+        if not config.SINGLE_FLIGHT_ENABLED:
+            return Future(), True
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.counters["followers"] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.counters["leaders"] += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        """Publishes the leader's result (or exception) and releases the key."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, function, *args):
+        """Runs function(*args) once per key among concurrent callers and returns (result, coalesced)."""
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = function(*args)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    async def do_async(self, key, coroutine_function, *args):
+        """do() for event loops: followers await the leader without blocking the loop."""
+        future, leader = self.claim(key)
+        if not leader:
+            # shield: a cancelled follower must not cancel the leader's shared future
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+        try:
+            result = await coroutine_function(*args)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+def stats():
+    """Returns the leader/follower counts and in-flight keys of every flight."""
+    return {flight.name: dict(flight.counters, in_flight=flight.in_flight()) for flight in _flights}
+
+def flight_metrics():
+    """Yields the counters as (metric_name, labels, value) tuples for telemetry."""
+    for name, values in stats().items():
+        for key, value in values.items():
+            yield f"corpquery_single_flight_{key}", {"stage": name}, value
@@ -0,0 +1,145 @@
+import sqlite3
+import hashlib
+import re
+import time
+import unicodedata
+import catalog
+import config
+
+def _connect():
+    """Opens the cache database and creates the cache tables if needed."""
+    conn = sqlite3.connect(config.SQL_CACHE_FILE, timeout=5)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sql_cache (
+            cache_key TEXT PRIMARY KEY,
+            question TEXT,
+            sql_query TEXT,
+            created_at REAL,
+            last_used_at REAL,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sql_cache_last_used ON sql_cache (last_used_at)")
+    conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, value INTEGER)")
+    return conn
+
+def _bump(conn, name):
+    """Increments a hit/miss counter."""
+    conn.execute(
+        "INSERT INTO cache_stats (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+def normalize_question(question):
+    """Normalizes a question so trivially different spellings share a cache entry."""
+    question = unicodedata.normalize("NFKC", question).strip().lower()
+    question = re.sub(r"\s+", " ", question)
+    # Trailing punctuation does not change the meaning of the question
+    return question.rstrip("?？。.!！ ")
+
+def make_key(question, schema_info, template, company_key):
+    """Builds the cache key from the question, schema, prompt template and company key."""
+    parts = [
+        normalize_question(question),
+        catalog.schema_fingerprint(schema_info),
+        hashlib.sha256(template.encode("utf-8")).hexdigest(),
+        str(company_key),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+def get(cache_key):
+    """Returns the cached SQL for a key, or None on a miss or an expired entry."""
+    conn = None
+    try:
+        conn = _connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT sql_query, created_at FROM sql_cache WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row and now - row[1] <= config.SQL_CACHE_TTL_SECONDS:
+            conn.execute(
+                "UPDATE sql_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (now, cache_key),
+            )
+            _bump(conn, "hits")
+            conn.commit()
+            return row[0]
+        if row:
+            conn.execute("DELETE FROM sql_cache WHERE cache_key = ?", (cache_key,))
+        _bump(conn, "misses")
+        conn.commit()
+        return None
+    except sqlite3.Error as e:
+        print(f"Error reading SQL cache: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+def put(cache_key, question, sql_query):
+    """Stores the post-processed SQL for a key and evicts expired and least recently used entries."""
+    conn = None
+    try:
+        conn = _connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO sql_cache (cache_key, question, sql_query, created_at, last_used_at, hit_count) "
+            "VALUES (?, ?, ?, ?, ?, 0)",
+            (cache_key, question, sql_query, now, now),
+        )
+        conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - config.SQL_CACHE_TTL_SECONDS,))
+        conn.execute(
+            "DELETE FROM sql_cache WHERE cache_key IN ("
+            "SELECT cache_key FROM sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (config.SQL_CACHE_MAX_ENTRIES,),
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error writing SQL cache: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def stats():
+    """Returns the hit/miss counters and the number of cached entries."""
+    conn = None
+    try:
+        conn = _connect()
+        counters = dict(conn.execute("SELECT name, value FROM cache_stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Error reading SQL cache stats: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+    hits = counters.get("hits", 0)
+    misses = counters.get("misses", 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "entries": entries,
+        "hit_ratio": hits / total if total else 0.0,
+    }
+
+def cache_metrics():
+    """Yields the cache counters as (metric_name, labels, value) tuples for telemetry."""
+    current = stats()
+    if current:
+        for key in ("hits", "misses", "entries", "hit_ratio"):
+            yield f"corpquery_sql_cache_{key}", {}, current[key]
+
+def clear():
+    """Removes every cached entry and resets the counters."""
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM sql_cache")
+        conn.execute("DELETE FROM cache_stats")
+        conn.commit()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print(stats())
@@ -0,0 +1,217 @@
+import json
+import logging
+import logging.handlers
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+_lock = threading.Lock()
+_windows = {}   # stage -> recent durations (seconds), for quantiles
+_buckets = {}   # stage -> cumulative bucket counts
+_totals = {}    # stage -> [count, sum]
+_collectors = []
+_traces = {}    # trace_id -> {stage: seconds}, for callers collecting one question's timings
+_logger = None
+_server = None
+
+def _span_logger():
+    """Returns the JSONL span logger, creating the rotating file handler on first use."""
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("corpquery.spans")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if config.TELEMETRY_LOG_FILE:
+            handler = logging.handlers.RotatingFileHandler(
+                config.TELEMETRY_LOG_FILE,
+                maxBytes=config.TELEMETRY_LOG_MAX_BYTES,
+                backupCount=config.TELEMETRY_LOG_BACKUPS,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+def new_trace_id():
+    """Returns an id that ties together the spans of one question."""
+    return uuid.uuid4().hex[:16]
+
+class Span:
+    """A timed pipeline stage with free-form attributes."""
+
+    def __init__(self, name, trace_id=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        """Adds attributes to the span, e.g. prompt_chars, row_count or cache_hit."""
+        self.attributes.update(attributes)
+
+    def finish(self):
+        """Stops the clock and records the span; for spans that do not fit a with block."""
+        self.duration = time.perf_counter() - self._start
+        record(self)
+
+    def to_dict(self):
+        return {
+            "span": self.name,
+            "trace_id": self.trace_id,
+            "start": round(self.start_time, 6),
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attributes,
+        }
+
+@contextmanager
+def span(name, trace_id=None, **attributes):
+    """Times the enclosed block and records it as a span, also when it raises."""
+    current = Span(name, trace_id, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.finish()
+
+def record(finished):
+    """Adds a finished span to the latency statistics and the JSONL log."""
+    with _lock:
+        window = _windows.get(finished.name)
+        if window is None:
+            window = _windows[finished.name] = deque(maxlen=config.TELEMETRY_WINDOW)
+            _buckets[finished.name] = [0] * len(config.TELEMETRY_BUCKETS)
+            _totals[finished.name] = [0, 0.0]
+        window.append(finished.duration)
+        for i, bound in enumerate(config.TELEMETRY_BUCKETS):
+            if finished.duration <= bound:
+                _buckets[finished.name][i] += 1
+        _totals[finished.name][0] += 1
+        _totals[finished.name][1] += finished.duration
+        stages = _traces.get(finished.trace_id)
+        if stages is not None:
+            stages[finished.name] = stages.get(finished.name, 0.0) + finished.duration
+    try:
+        _span_logger().info(json.dumps(finished.to_dict(), ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"Error writing span log: {e}")
+
+@contextmanager
+def collect(trace_id):
+    """Collects the stage durations (seconds, summed per stage) of one trace while the block runs."""
+    stages = {}
+    with _lock:
+        _traces[trace_id] = stages
+    try:
+        yield stages
+    finally:
+        with _lock:
+            _traces.pop(trace_id, None)
+
+def _quantile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def stage_quantiles():
+    """Returns p50/p95/p99 (seconds) and counts for every stage seen so far."""
+    with _lock:
+        snapshot = {name: (sorted(window), list(_totals[name])) for name, window in _windows.items()}
+    return {
+        name: {
+            "p50": _quantile(ordered, 0.50),
+            "p95": _quantile(ordered, 0.95),
+            "p99": _quantile(ordered, 0.99),
+            "count": totals[0],
+            "sum": totals[1],
+        }
+        for name, (ordered, totals) in snapshot.items()
+    }
+
+def reset():
+    """Clears the latency statistics, e.g. between benchmark runs."""
+    with _lock:
+        _windows.clear()
+        _buckets.clear()
+        _totals.clear()
+
+def register_collector(collector):
+    """Registers a callable returning (metric_name, labels_dict, value) tuples for the /metrics output."""
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+def _labels(labels):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}" if labels else ""
+
+def render_prometheus():
+    """Renders the stage latencies and registered gauges in the Prometheus text format."""
+    lines = [
+        "# HELP corpquery_stage_duration_seconds Pipeline stage latency.",
+        "# TYPE corpquery_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        buckets = {name: list(counts) for name, counts in _buckets.items()}
+        totals = {name: list(values) for name, values in _totals.items()}
+    for name in sorted(buckets):
+        for bound, count in zip(config.TELEMETRY_BUCKETS, buckets[name]):
+            lines.append(f'corpquery_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+        lines.append(f'corpquery_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {totals[name][0]}')
+        lines.append(f'corpquery_stage_duration_seconds_sum{{stage="{name}"}} {totals[name][1]:.6f}')
+        lines.append(f'corpquery_stage_duration_seconds_count{{stage="{name}"}} {totals[name][0]}')
+
+    lines.append("# HELP corpquery_stage_latency_seconds Pipeline stage latency quantiles over the recent window.")
+    lines.append("# TYPE corpquery_stage_latency_seconds summary")
+    for name, values in sorted(stage_quantiles().items()):
+        for q in ("p50", "p95", "p99"):
+            quantile = {"p50": "0.5", "p95": "0.95", "p99": "0.99"}[q]
+            lines.append(f'corpquery_stage_latency_seconds{{stage="{name}",quantile="{quantile}"}} {values[q]:.6f}')
+        lines.append(f'corpquery_stage_latency_seconds_sum{{stage="{name}"}} {values["sum"]:.6f}')
+        lines.append(f'corpquery_stage_latency_seconds_count{{stage="{name}"}} {values["count"]}')
+
+    for collector in list(_collectors):
+        try:
+            for metric, labels, value in collector():
+                lines.append(f"{metric}{_labels(labels)} {value}")
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=None, host=None):
+    """Serves /metrics on a background thread; does nothing when the port is 0 or the server already runs."""
+    global _server
+    port = config.METRICS_PORT if port is None else port
+    host = config.METRICS_HOST if host is None else host
+    with _lock:
+        if not port or _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"Error starting metrics server on {host}:{port}: {e}")
+            return None
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Serving Prometheus metrics on {host}:{port}/metrics")
+    return _server